@@ -0,0 +1,73 @@
+import asyncio
+import math
+from typing import Any
+
+from .metrics import REGISTRY
+from .websocket_manager import WebSocketManager, merge_update
+
+COALESCED = REGISTRY.counter(
+    "ha_dashboard_coalesced_updates_total", "Updates merged into one still waiting to be sent"
+).labels()
+
+
+class UpdateCoalescer:
+    # collapses repeated updates to a topic within its interval and sends every
+    # topic that is due in one "updates" frame; intervals are aligned to the loop
+    # clock so topics sharing an interval are flushed together
+
+    def __init__(
+        self,
+        ws_manager: WebSocketManager,
+        default_interval: float = 0.0,
+        intervals: dict[str, float] | None = None,
+    ):
+        self.ws_manager = ws_manager
+        self.default_interval = default_interval
+        self.intervals: dict[str, float] = intervals or {}
+        self._pending: dict[str, dict[str, Any]] = {}
+        self._due: dict[str, float] = {}
+        self._timer: asyncio.TimerHandle | None = None
+
+    def set_interval(self, topic: str, interval: float) -> None:
+        self.intervals[topic] = interval
+
+    def submit(self, topic: str, update: dict[str, Any]) -> None:
+        interval = self.intervals.get(topic, self.default_interval)
+        if interval <= 0:
+            self.ws_manager.publish({"type": "update", "topic": topic, "data": update}, key=topic)
+            return
+
+        pending = self._pending.get(topic)
+        if pending is not None:
+            merge_update(pending, update)
+            COALESCED.inc()
+            return
+
+        loop = asyncio.get_running_loop()
+        due = (math.floor(loop.time() / interval) + 1) * interval
+        self._pending[topic] = dict(update)
+        self._due[topic] = due
+        self._schedule(loop, due)
+
+    def _schedule(self, loop: asyncio.AbstractEventLoop, due: float) -> None:
+        if self._timer is not None:
+            if self._timer.when() <= due:
+                return
+            self._timer.cancel()
+        self._timer = loop.call_at(due, self._flush)
+
+    def _flush(self) -> None:
+        self._timer = None
+        loop = asyncio.get_running_loop()
+        # call_at may fire up to the clock resolution before the due time
+        now = loop.time() + 0.001
+        batch = {}
+        for topic, due in list(self._due.items()):
+            if due <= now:
+                del self._due[topic]
+                batch[topic] = self._pending.pop(topic)
+
+        if batch:
+            self.ws_manager.publish({"type": "updates", "data": batch})
+        if self._due:
+            self._schedule(loop, min(self._due.values()))
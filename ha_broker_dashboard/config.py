@@ -11,12 +11,29 @@ class MQTTConfig:
     port: int
     username: str = ""
     password: str = ""
+    connections: int = 1
+    shared_group: str = ""
+    decode_workers: int = 0
+    decode_min_bytes: int = 512
+    mode: Literal["thread", "asyncio"] = "thread"
 
 
 @dataclass
 class ServerConfig:
     host: str
     port: int
+    client_queue_size: int = 256
+    client_max_lag: float = 10.0
+    coalesce_ms: int = 0
+    replay_size: int = 1024
+    static_reload: bool = False
+
+
+@dataclass
+class StorageConfig:
+    path: str
+    retention_hours: float = 168
+    segment_records: int = 65536
 
 
 @dataclass
@@ -33,6 +50,9 @@ class SensorConfig:
     unit: str | None = None
     inputUnit: str | None = None
     precision: float | None = None
+    coalesceMs: int | None = None
+    payload: Literal["auto", "numeric", "boolean", "string", "json"] = "auto"
+    valuePath: str | None = None
 
 
 @dataclass
@@ -40,6 +60,7 @@ class AppConfig:
     mqtt: MQTTConfig
     server: ServerConfig
     sensors: list[SensorConfig]
+    storage: StorageConfig | None = None
 
 
 def load_config(config_path: str | Path = "config.yaml") -> AppConfig:
@@ -54,4 +75,5 @@ def load_config(config_path: str | Path = "config.yaml") -> AppConfig:
         mqtt=MQTTConfig(**data.get("mqtt", {})),
         server=ServerConfig(**data.get("server", {})),
         sensors=[SensorConfig(**s) for s in data.get("sensors", [])],
+        storage=StorageConfig(**data["storage"]) if data.get("storage") else None,
     )
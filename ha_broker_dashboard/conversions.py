@@ -1,7 +1,13 @@
 """Unit conversion module for sensor data."""
 
 import math
-from typing import Callable
+from array import array
+from typing import Any, Callable, Iterable
+
+try:
+    import numpy as np
+except ImportError:  # optional, batch conversions fall back to pure Python
+    np = None
 
 
 def truncate_to_precision(value: float, precision: float) -> float:
@@ -59,3 +65,100 @@ def has_conversion(input_unit: str | None, output_unit: str | None) -> bool:
     conversion_key = f"{input_unit}_to_{output_unit}"
     return conversion_key in CONVERSIONS
 
+
+def compile_conversion(
+    input_unit: str | None, output_unit: str | None, precision: float | None
+) -> Callable[[Any], Any]:
+    # resolves the conversion and precision once and returns a callable that gives
+    # the same result as converting and then truncating each value: numeric input
+    # comes back as a float, anything float() rejects comes back unchanged
+    convert = None
+    if input_unit and output_unit and input_unit != output_unit:
+        convert = CONVERSIONS.get(f"{input_unit}_to_{output_unit}", float)
+
+    if precision is None:
+        if convert is None:
+            return lambda value: value
+
+        def converted(value: Any) -> Any:
+            try:
+                return convert(float(value))
+            except (ValueError, TypeError):
+                return value
+
+        return converted
+
+    if precision <= 0:
+        truncate = float
+    else:
+        def truncate(value: float) -> float:
+            return math.floor(value / precision) * precision
+
+    if convert is None:
+        def truncated(value: Any) -> Any:
+            try:
+                return truncate(float(value))
+            except (ValueError, TypeError):
+                return value
+
+        return truncated
+
+    def converted_and_truncated(value: Any) -> Any:
+        try:
+            return truncate(convert(float(value)))
+        except (ValueError, TypeError):
+            return value
+
+    return converted_and_truncated
+
+
+def _as_float64(values: Iterable[float]) -> array:
+    if isinstance(values, array) and values.typecode == "d":
+        return values
+    try:
+        view = memoryview(values)
+    except TypeError:
+        return array("d", values)
+    if view.format == "d":
+        result = array("d")
+        result.frombytes(view.cast("B"))
+        return result
+    return array("d", view.tolist())
+
+
+def _numpy_result(result: "np.ndarray") -> array:
+    output = array("d")
+    output.frombytes(result.tobytes())
+    return output
+
+
+def convert_values(
+    values: Iterable[float], input_unit: str | None, output_unit: str | None
+) -> array:
+    # batch convert_value over any float buffer or iterable, returned as array('d').
+    # the conversion functions are plain arithmetic, so applying them to an ndarray
+    # performs the same float64 operations in the same order as the scalar path
+    data = _as_float64(values)
+    if input_unit is None or output_unit is None or input_unit == output_unit:
+        return array("d", data)
+    conversion = CONVERSIONS.get(f"{input_unit}_to_{output_unit}")
+    if conversion is None:
+        return array("d", data)
+    if np is not None:
+        return _numpy_result(conversion(np.frombuffer(data, dtype=np.float64)))
+    return array("d", map(conversion, data))
+
+
+def truncate_values(values: Iterable[float], precision: float) -> array:
+    # batch truncate_to_precision, including floor semantics for negative values
+    data = _as_float64(values)
+    if precision <= 0:
+        return array("d", data)
+    if np is not None:
+        values = np.frombuffer(data, dtype=np.float64)
+        # math.floor raises on nan and inf, so leave those inputs to the Python loop
+        # below, which raises exactly as truncate_to_precision does
+        if np.isfinite(values).all():
+            return _numpy_result(np.floor(values / precision) * precision)
+    floor = math.floor
+    return array("d", [floor(value / precision) * precision for value in data])
@@ -1,10 +1,38 @@
-from collections import deque
-from dataclasses import dataclass, field
+import itertools
+from array import array
+from dataclasses import dataclass, field, replace
 from datetime import datetime
 from threading import Lock
-from typing import Any
+from time import perf_counter
+from typing import Any, Callable, Collection
 
-from .conversions import convert_value, truncate_to_precision
+from .conversions import compile_conversion
+from .history import HistoryBuffer
+from .history_log import HistoryLog
+from .metrics import REGISTRY
+from .rollups import DEFAULT_TIERS, RollupSet
+from .topic_trie import TopicTrie
+
+ROLLUP_IMPLEMENTATIONS = ("graph", "gauge")
+
+TOPIC_MESSAGES = REGISTRY.counter(
+    "ha_dashboard_topic_messages_total", "MQTT messages applied to each sensor", ["topic"]
+)
+REGISTRY.callback(
+    "ha_dashboard_ingest_messages_total",
+    "MQTT messages applied to all sensors",
+    lambda: sum(value for _, _, value in TOPIC_MESSAGES.samples()),
+    kind="counter",
+)
+CONVERT_FAILURES = REGISTRY.counter(
+    "ha_dashboard_convert_failures_total",
+    "Values on numeric sensors that were not numbers after conversion",
+    ["topic"],
+)
+LOCK_WAIT = REGISTRY.histogram(
+    "ha_dashboard_lock_wait_seconds",
+    "Time ingest waited for a sensor lock, observed only when the lock was contended",
+).labels()
 
 
 @dataclass
@@ -14,7 +42,7 @@ class SensorData:
     type: str
     implementation: str
     current_value: Any = None
-    history: deque = field(default_factory=lambda: deque(maxlen=100))
+    history: HistoryBuffer = field(default_factory=lambda: HistoryBuffer(100))
     last_updated: datetime | None = None
     min_value: float | None = None
     max_value: float | None = None
@@ -24,16 +52,31 @@ class SensorData:
     unit: str | None = None
     input_unit: str | None = None
     precision: float | None = None
+    version: int = 0
+    id: int = 0
+    rollups: RollupSet | None = None
+    template: str | None = None
+    announced: bool = True
+    lock: Lock = field(default_factory=Lock, repr=False, compare=False)
+    # built by DataStore at registration; applies one raw value to this sensor
+    apply: Callable[[Any], None] | None = field(default=None, repr=False, compare=False)
 
-    def to_dict(self) -> dict:
-        return {
+    def copy(self) -> "SensorData":
+        # detached copy for serializing outside the lock; history arrays are memcpy'd
+        return replace(self, history=self.history.copy(), lock=Lock())
+
+    def to_dict(self, include_history: bool = True) -> dict:
+        sensor = {
+            "id": self.id,
             "topic": self.topic,
             "name": self.name,
             "type": self.type,
             "implementation": self.implementation,
             "current_value": self.current_value,
-            "history": list(self.history),
+            "history_size": self.history.maxlen,
             "last_updated": self.last_updated.isoformat() if self.last_updated else None,
+            # epoch seconds of last_updated; clients skip deltas that are not newer
+            "ts": self.last_updated.timestamp() if self.last_updated else None,
             "min_value": self.min_value,
             "max_value": self.max_value,
             "true_value": self.true_value,
@@ -43,12 +86,55 @@ class SensorData:
             "input_unit": self.input_unit,
             "precision": self.precision,
         }
+        if include_history:
+            sensor["history"] = self.history.to_list()
+        return sensor
+
+    def to_update_dict(self) -> dict:
+        # delta for the most recent update only; clients get the full history from init
+        timestamp = self.last_updated.timestamp() if self.last_updated else None
+        update = {
+            "current_value": self.current_value,
+            "last_updated": self.last_updated.isoformat() if self.last_updated else None,
+            # epoch seconds of last_updated, unambiguous unlike the naive ISO string
+            "ts": timestamp,
+        }
+        if self.implementation == "graph":
+            # non-numeric samples are not kept in history, so only send a point if one was added
+            if self.history and self.history[-1][1] == timestamp:
+                update["points"] = [self.history.point(-1)]
+        elif self.implementation == "boolean":
+            update["last_switched"] = (
+                self.last_switched.isoformat() if self.last_switched else None
+            )
+        return update
 
 
 class DataStore:
-    def __init__(self):
+    def __init__(
+        self,
+        history_log: HistoryLog | None = None,
+        rollup_tiers: tuple[tuple[int, int], ...] = DEFAULT_TIERS,
+    ):
         self._sensors: dict[str, SensorData] = {}
+        self._history_log = history_log
+        self._rollup_tiers = rollup_tiers
+        self._templates: TopicTrie[dict[str, Any]] = TopicTrie()
+        # guards the sensor registry only; each sensor's state has its own lock so
+        # readers of one sensor never wait on the ingest of another
         self._lock = Lock()
+        self._versions = itertools.count(1)
+        self._version = 0
+        self.topic_ids: dict[str, int] = {}
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def _next_version(self) -> int:
+        version = next(self._versions)
+        self._version = version
+        return version
 
     def register_sensor(
         self,
@@ -68,12 +154,12 @@ class DataStore:
         with self._lock:
             if topic in self._sensors:
                 return
-            self._sensors[topic] = SensorData(
+            self._register(
                 topic=topic,
                 name=name,
-                type=sensor_type,
+                sensor_type=sensor_type,
                 implementation=implementation,
-                history=deque(maxlen=history_size),
+                history_size=history_size,
                 min_value=min_value,
                 max_value=max_value,
                 true_value=true_value,
@@ -83,45 +169,268 @@ class DataStore:
                 precision=precision,
             )
 
-    def update_sensor(self, topic: str, value: Any) -> SensorData | None:
+    def register_template(self, pattern: str, **sensor_kwargs: Any) -> None:
+        # sensor_kwargs are register_sensor's arguments; the name may reference the
+        # wildcard levels of a matching topic as {0}, {1}, ... or the whole {topic}
         with self._lock:
-            if topic not in self._sensors:
+            self._templates.insert(pattern, {"pattern": pattern, **sensor_kwargs})
+
+    def _register_from_template(self, topic: str) -> SensorData | None:
+        matches = self._templates.match(topic)
+        if not matches:
+            return None
+        template, captures = matches[0]
+        sensor_kwargs = dict(template)
+        pattern = sensor_kwargs.pop("pattern")
+        try:
+            sensor_kwargs["name"] = sensor_kwargs["name"].format(*captures, topic=topic)
+        except (IndexError, KeyError, ValueError):
+            sensor_kwargs["name"] = topic
+        sensor = self._register(topic=topic, **sensor_kwargs)
+        sensor.template = pattern
+        sensor.announced = False
+        return sensor
+
+    def _register(
+        self,
+        topic: str,
+        name: str,
+        sensor_type: str,
+        implementation: str,
+        history_size: int,
+        **options: Any,
+    ) -> SensorData:
+        sensor = SensorData(
+            topic=topic,
+            name=name,
+            type=sensor_type,
+            implementation=implementation,
+            history=HistoryBuffer(history_size),
+            version=self._next_version(),
+            id=len(self.topic_ids),
+            **options,
+        )
+        if implementation == "graph" and self._history_log:
+            self._rehydrate(sensor)
+        sensor.apply = self._compile_updater(sensor)
+        self._sensors[topic] = sensor
+        self.topic_ids[topic] = sensor.id
+        return sensor
+
+    def _compile_updater(self, sensor: SensorData) -> Callable[[Any], None]:
+        # everything that depends only on the sensor's configuration (units, precision,
+        # implementation, rollups, history log) is resolved here instead of per message
+        convert = compile_conversion(sensor.input_unit, sensor.unit, sensor.precision)
+        next_version = self._next_version
+        now = datetime.now
+        count = TOPIC_MESSAGES.labels(sensor.topic).inc
+
+        if sensor.implementation == "boolean":
+            def update_boolean(value: Any) -> None:
+                count()
+                converted = convert(value)
+                updated = now()
+                if sensor.current_value != converted:
+                    sensor.last_switched = updated
+                sensor.current_value = converted
+                sensor.version = next_version()
+                sensor.last_updated = updated
+
+            return update_boolean
+
+        if sensor.implementation not in ROLLUP_IMPLEMENTATIONS:
+            def update_value(value: Any) -> None:
+                count()
+                sensor.current_value = convert(value)
+                sensor.version = next_version()
+                sensor.last_updated = now()
+
+            return update_value
+
+        record = self._compile_numeric_sink(sensor)
+        convert_failed = CONVERT_FAILURES.labels(sensor.topic).inc
+
+        def update_numeric(value: Any) -> None:
+            count()
+            converted = convert(value)
+            updated = now()
+            sensor.current_value = converted
+            sensor.version = next_version()
+            sensor.last_updated = updated
+            try:
+                numeric_value = float(converted)
+            except (ValueError, TypeError):
+                convert_failed()
+                return
+            record(updated.timestamp(), numeric_value)
+
+        return update_numeric
+
+    def _compile_numeric_sink(self, sensor: SensorData) -> Callable[[float, float], None]:
+        steps: list[Callable[[float, float], None]] = []
+        if sensor.rollups is not None:
+            steps.append(sensor.rollups.add)
+        elif self._rollup_tiers:
+            tiers = self._rollup_tiers
+
+            def allocate_rollups(timestamp: float, value: float) -> None:
+                # rollups are only allocated once a sensor sees a number; later samples
+                # then go straight to them through a recompiled pipeline
+                sensor.rollups = RollupSet(tiers)
+                sensor.rollups.add(timestamp, value)
+                sensor.apply = self._compile_updater(sensor)
+
+            steps.append(allocate_rollups)
+        if sensor.implementation == "graph":
+            history_append = sensor.history.append
+            steps.append(lambda timestamp, value: history_append(value, timestamp))
+            if self._history_log:
+                log_append = self._history_log.append
+                topic = sensor.topic
+                steps.append(lambda timestamp, value: log_append(topic, timestamp, value))
+
+        if not steps:
+            return lambda timestamp, value: None
+        if len(steps) == 1:
+            return steps[0]
+
+        def record(timestamp: float, value: float) -> None:
+            for step in steps:
+                step(timestamp, value)
+
+        return record
+
+    def _rehydrate(self, sensor: SensorData) -> None:
+        records = self._history_log.load_recent(sensor.topic, sensor.history.maxlen)
+        if records and self._rollup_tiers:
+            sensor.rollups = RollupSet(self._rollup_tiers)
+        for timestamp, value in records:
+            sensor.history.append(value, timestamp)
+            if sensor.rollups is not None:
+                sensor.rollups.add(timestamp, value)
+        if records:
+            timestamp, value = records[-1]
+            sensor.current_value = value
+            sensor.last_updated = datetime.fromtimestamp(timestamp)
+
+    def update_sensor(self, topic: str, value: Any) -> SensorData | None:
+        sensor = self._sensors.get(topic)
+        if sensor is None:
+            with self._lock:
+                sensor = self._sensors.get(topic) or self._register_from_template(topic)
+            if sensor is None:
                 return None
-            sensor = self._sensors[topic]
-            old_value = sensor.current_value
-
-            # apply unit conversion if input_unit and unit differ
-            converted_value = value
-            if sensor.input_unit and sensor.unit and sensor.input_unit != sensor.unit:
-                try:
-                    numeric_value = float(value)
-                    converted_value = convert_value(numeric_value, sensor.input_unit, sensor.unit)
-                except (ValueError, TypeError):
-                    pass
-
-            if sensor.precision is not None:
-                try:
-                    numeric_value = float(converted_value)
-                    converted_value = truncate_to_precision(numeric_value, sensor.precision)
-                except (ValueError, TypeError):
-                    pass
-
-            sensor.current_value = converted_value
-            sensor.last_updated = datetime.now()
-            if sensor.implementation == "graph":
-                sensor.history.append(
-                    {"value": converted_value, "timestamp": sensor.last_updated.isoformat()}
-                )
-            elif sensor.implementation == "boolean":
-                if old_value != converted_value:
-                    sensor.last_switched = sensor.last_updated
-            return sensor
+
+        lock = sensor.lock
+        if not lock.acquire(blocking=False):
+            # only contended acquisitions pay for the timing
+            started = perf_counter()
+            lock.acquire()
+            LOCK_WAIT.observe(perf_counter() - started)
+        try:
+            sensor.apply(value)
+        finally:
+            lock.release()
+        return sensor
 
     def get_sensor(self, topic: str) -> SensorData | None:
+        return self._sensors.get(topic)
+
+    def topics(self) -> list[str]:
         with self._lock:
-            return self._sensors.get(topic)
+            return list(self._sensors)
 
-    def get_all_sensors(self) -> dict[str, dict]:
+    def _sensor_items(self) -> list[tuple[str, SensorData]]:
         with self._lock:
-            return {topic: sensor.to_dict() for topic, sensor in self._sensors.items()}
+            return list(self._sensors.items())
+
+    @staticmethod
+    def _snapshot(sensor: SensorData) -> SensorData:
+        with sensor.lock:
+            return sensor.copy()
+
+    def get_history(
+        self, topic: str, start: float | None = None, end: float | None = None
+    ) -> tuple[array, array] | None:
+        # (timestamps, values) of a sensor's history between two epoch times, inclusive
+        sensor = self._sensors.get(topic)
+        if sensor is None:
+            return None
+        with sensor.lock:
+            history = sensor.history
+            first = 0 if start is None else history.bisect(start)
+            last = len(history) if end is None else history.bisect(end, right=True)
+            timestamps, values = history.columns(first, last)
+            oldest = history[0][1] if history else None
+
+        if self._history_log and start is not None and (oldest is None or start < oldest):
+            # the range reaches past what is kept in memory, fill the gap from disk
+            if oldest is not None:
+                end = oldest if end is None else min(end, oldest)
+            older = [
+                record for record in self._history_log.read(topic, start, end)
+                if oldest is None or record[0] < oldest
+            ]
+            timestamps = array("d", [timestamp for timestamp, _ in older]) + timestamps
+            values = array("d", [value for _, value in older]) + values
+        return timestamps, values
+
+    def get_rollups(
+        self, topic: str, resolution: int, start: float | None = None, end: float | None = None
+    ) -> list[dict] | None:
+        sensor = self._sensors.get(topic)
+        if sensor is None:
+            return None
+        with sensor.lock:
+            if sensor.rollups is None or resolution not in sensor.rollups.tiers:
+                return []
+            return sensor.rollups.tiers[resolution].buckets(start, end)
+
+    def get_all_sensors(self) -> dict[str, dict]:
+        return {
+            topic: self._snapshot(sensor).to_dict() for topic, sensor in self._sensor_items()
+        }
+
+    def get_sensors_since(
+        self, since: int = 0, fields: Collection[str] | None = None
+    ) -> dict[str, dict]:
+        # sensors whose version is newer than since, limited to the given to_dict fields.
+        # Versions are read under each sensor's lock, so an update that is in progress
+        # when the caller read `version` is included rather than skipped
+        include_history = fields is None or "history" in fields
+        result = {}
+        for topic, sensor in self._sensor_items():
+            with sensor.lock:
+                if sensor.version <= since:
+                    continue
+                # without history the dict is cheap enough to build under the lock
+                result[topic] = sensor.copy() if include_history else sensor.to_dict(False)
+
+        for topic, sensor in result.items():
+            sensor_dict = sensor.to_dict() if include_history else sensor
+            if fields is not None:
+                sensor_dict = {name: sensor_dict[name] for name in fields if name in sensor_dict}
+            result[topic] = sensor_dict
+        return result
+
+    def get_changed_sensor(
+        self, topic: str, known_version: int | None
+    ) -> tuple[int, dict] | None:
+        # (version, dict) of one sensor, or None if it is unknown or still at known_version
+        sensor = self._sensors.get(topic)
+        if sensor is None or sensor.version == known_version:
+            return None
+        snapshot = self._snapshot(sensor)
+        return snapshot.version, snapshot.to_dict()
 
+    def get_changed_sensors(
+        self, known_versions: dict[str, int]
+    ) -> tuple[list[str], dict[str, tuple[int, dict]]]:
+        # every topic in store order, plus (version, dict) for the ones whose version differs
+        items = self._sensor_items()
+        changed = {}
+        for topic, sensor in items:
+            if known_versions.get(topic) != sensor.version:
+                snapshot = self._snapshot(sensor)
+                changed[topic] = (snapshot.version, snapshot.to_dict())
+        return [topic for topic, _ in items], changed
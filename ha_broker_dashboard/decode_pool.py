@@ -0,0 +1,343 @@
+"""Optional worker-process pool for decoding large MQTT payloads.
+
+Raw payloads go to the workers, and decoded values come back, through
+single-producer/single-consumer byte rings in shared memory. Each record is a
+length-prefixed frame built with struct, so nothing is pickled per message.
+"""
+
+import json
+import logging
+import multiprocessing
+import struct
+import threading
+import time
+import zlib
+from multiprocessing import shared_memory
+from typing import Any, Callable
+
+from .payloads import PARSE_FAILURES, PayloadDecoder, PayloadFormat
+
+logger = logging.getLogger(__name__)
+
+# head (bytes ever written) and tail (bytes ever read) live on separate cache lines;
+# the capacity is stored too since attached segments may be rounded up to a page
+_COUNTER = struct.Struct("<Q")
+_HEAD_OFFSET = 0
+_CAPACITY_OFFSET = 8
+_TAIL_OFFSET = 64
+_DATA_OFFSET = 128
+_LENGTH = struct.Struct("<I")
+
+# worker input: uint16 topic length, topic, payload
+_REQUEST = struct.Struct("<H")
+# worker output: uint16 topic length, uint8 kind, topic, encoded value
+_RESULT = struct.Struct("<HB")
+_FLOAT = struct.Struct("<d")
+_INT = struct.Struct("<q")
+KIND_FLOAT, KIND_INT, KIND_TRUE, KIND_FALSE, KIND_NULL, KIND_TEXT, KIND_JSON, KIND_ERROR = range(8)
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    # the creating process owns the segment's lifetime
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+class ShmRing:
+    # one writer and one reader, which may be in different processes. The writer
+    # publishes a frame by advancing head after the frame bytes are in place and
+    # the reader frees it by advancing tail, so neither side needs a lock
+
+    def __init__(self, capacity: int = 1 << 22, name: str | None = None):
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=_DATA_OFFSET + capacity)
+            self.shm.buf[:_DATA_OFFSET] = bytes(_DATA_OFFSET)
+            _COUNTER.pack_into(self.shm.buf, _CAPACITY_OFFSET, capacity)
+            self.owner = True
+        else:
+            self.shm = _attach(name)
+            self.owner = False
+        self.name = self.shm.name
+        self._buf = self.shm.buf
+        self.capacity = self._load(_CAPACITY_OFFSET)
+
+    def _load(self, offset: int) -> int:
+        return _COUNTER.unpack_from(self._buf, offset)[0]
+
+    def frame_size(self, *parts: bytes) -> int:
+        return _LENGTH.size + sum(len(part) for part in parts)
+
+    def _write(self, position: int, data: bytes) -> int:
+        # copies data to the byte position, continuing at the start past the end
+        offset = position % self.capacity
+        first = min(len(data), self.capacity - offset)
+        with memoryview(data) as view:
+            self._buf[_DATA_OFFSET + offset:_DATA_OFFSET + offset + first] = view[:first]
+            if first < len(data):
+                self._buf[_DATA_OFFSET:_DATA_OFFSET + len(data) - first] = view[first:]
+        return position + len(data)
+
+    def _read(self, position: int, length: int) -> bytes:
+        offset = position % self.capacity
+        first = min(length, self.capacity - offset)
+        data = bytes(self._buf[_DATA_OFFSET + offset:_DATA_OFFSET + offset + first])
+        if first < length:
+            data += self._buf[_DATA_OFFSET:_DATA_OFFSET + length - first]
+        return data
+
+    def put(self, *parts: bytes) -> bool:
+        # writes the concatenated parts as one frame; False if the ring is full.
+        # Frames straddle the end of the buffer, so any frame up to the capacity
+        # fits once the reader has caught up
+        size = self.frame_size(*parts)
+        if size > self.capacity:
+            raise ValueError(f"frame of {size} bytes exceeds ring capacity {self.capacity}")
+        head = self._load(_HEAD_OFFSET)
+        tail = self._load(_TAIL_OFFSET)
+        if head - tail + size > self.capacity:
+            return False
+
+        position = self._write(head, _LENGTH.pack(size - _LENGTH.size))
+        for part in parts:
+            position = self._write(position, part)
+        _COUNTER.pack_into(self._buf, _HEAD_OFFSET, head + size)
+        return True
+
+    def get(self) -> bytes | None:
+        head = self._load(_HEAD_OFFSET)
+        tail = self._load(_TAIL_OFFSET)
+        if head == tail:
+            return None
+        length = _LENGTH.unpack(self._read(tail, _LENGTH.size))[0]
+        frame = self._read(tail + _LENGTH.size, length)
+        _COUNTER.pack_into(self._buf, _TAIL_OFFSET, tail + _LENGTH.size + length)
+        return frame
+
+    def close(self) -> None:
+        self._buf.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class _Backoff:
+    # spin while there is work, then sleep progressively longer while idle
+
+    def __init__(self, minimum: float = 0.0002, maximum: float = 0.005):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.delay = 0.0
+
+    def reset(self) -> None:
+        self.delay = 0.0
+
+    def wait(self) -> None:
+        self.delay = min(max(self.delay * 2, self.minimum), self.maximum)
+        time.sleep(self.delay)
+
+
+def encode_result(topic: bytes, value: Any) -> tuple[bytes, ...]:
+    if isinstance(value, bool):
+        return _RESULT.pack(len(topic), KIND_TRUE if value else KIND_FALSE), topic
+    if isinstance(value, float):
+        return _RESULT.pack(len(topic), KIND_FLOAT), topic, _FLOAT.pack(value)
+    if isinstance(value, int) and -(1 << 63) <= value < (1 << 63):
+        return _RESULT.pack(len(topic), KIND_INT), topic, _INT.pack(value)
+    if value is None:
+        return _RESULT.pack(len(topic), KIND_NULL), topic
+    if isinstance(value, str):
+        return _RESULT.pack(len(topic), KIND_TEXT), topic, value.encode()
+    # objects, arrays and big ints; rare once a value path picks out a scalar
+    return _RESULT.pack(len(topic), KIND_JSON), topic, json.dumps(value).encode()
+
+
+def decode_result(frame: bytes) -> tuple[str, int, Any]:
+    topic_length, kind = _RESULT.unpack_from(frame)
+    start = _RESULT.size + topic_length
+    topic = frame[_RESULT.size:start].decode()
+    if kind == KIND_FLOAT:
+        return topic, kind, _FLOAT.unpack_from(frame, start)[0]
+    if kind == KIND_INT:
+        return topic, kind, _INT.unpack_from(frame, start)[0]
+    if kind in (KIND_TRUE, KIND_FALSE, KIND_NULL):
+        return topic, kind, {KIND_TRUE: True, KIND_FALSE: False, KIND_NULL: None}[kind]
+    text = frame[start:].decode()
+    if kind == KIND_JSON:
+        return topic, kind, json.loads(text)
+    return topic, kind, text
+
+
+def _worker_main(
+    requests_name: str,
+    results_name: str,
+    formats: list[PayloadFormat],
+    stop: Any,
+) -> None:
+    requests = ShmRing(name=requests_name)
+    results = ShmRing(name=results_name)
+    decoder = PayloadDecoder(formats)
+    backoff = _Backoff()
+    try:
+        while True:
+            frame = requests.get()
+            if frame is None:
+                # checking the event is a semaphore round trip, so only do it when idle
+                if stop.is_set():
+                    return
+                backoff.wait()
+                continue
+            backoff.reset()
+            topic_length = _REQUEST.unpack_from(frame)[0]
+            topic_bytes = frame[_REQUEST.size:_REQUEST.size + topic_length]
+            try:
+                value = decoder.decode(topic_bytes.decode(), frame[_REQUEST.size + topic_length:])
+                result = encode_result(topic_bytes, value)
+            except Exception as e:
+                result = (_RESULT.pack(len(topic_bytes), KIND_ERROR), topic_bytes, str(e).encode())
+            if results.frame_size(*result) > results.capacity:
+                error = f"decoded value does not fit the {results.capacity} byte result ring"
+                result = (_RESULT.pack(len(topic_bytes), KIND_ERROR), topic_bytes, error.encode())
+            while not results.put(*result):
+                if stop.is_set():
+                    return
+                backoff.wait()
+    finally:
+        requests.close()
+        results.close()
+
+
+class _Worker:
+
+    def __init__(self, context, ring_bytes: int, formats: list[PayloadFormat], stop):
+        self.requests = ShmRing(ring_bytes)
+        self.results = ShmRing(ring_bytes)
+        # several MQTT connection threads may submit to the same worker
+        self.submit_lock = threading.Lock()
+        self.failed = False
+        self.submitted = 0
+        self.completed = 0
+        self.process = context.Process(
+            target=_worker_main,
+            args=(self.requests.name, self.results.name, formats, stop),
+            name="payload-decoder",
+            daemon=True,
+        )
+
+
+class DecodePool:
+    # payloads of at least min_bytes are decoded by worker processes. Topics are
+    # pinned to a worker, and once a topic has gone to the pool it stays there, so
+    # values for any one topic are still delivered in arrival order
+
+    def __init__(
+        self,
+        workers: int,
+        formats: list[PayloadFormat],
+        on_result: Callable[[str, Any], None],
+        min_bytes: int = 512,
+        ring_bytes: int = 1 << 22,
+    ):
+        self.min_bytes = min_bytes
+        self.on_result = on_result
+        self._context = multiprocessing.get_context("spawn")
+        self._stop = self._context.Event()
+        self._workers = [
+            _Worker(self._context, ring_bytes, formats, self._stop) for _ in range(workers)
+        ]
+        self._pooled_topics: set[str] = set()
+        self._collector: threading.Thread | None = None
+        self._running = False
+        self.submitted = 0
+        self.completed = 0
+
+    @property
+    def pending(self) -> int:
+        return self.submitted - self.completed
+
+    def start(self) -> None:
+        self._running = True
+        for worker in self._workers:
+            worker.process.start()
+        self._collector = threading.Thread(target=self._collect, name="decode-results", daemon=True)
+        self._collector.start()
+
+    def stop(self) -> None:
+        if not self._running:
+            return
+        self._running = False
+        self._stop.set()
+        self._collector.join()
+        for worker in self._workers:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.requests.close()
+            worker.results.close()
+
+    def submit(self, topic: str, payload: bytes) -> bool:
+        # False means the caller should decode this payload itself
+        if len(payload) < self.min_bytes and topic not in self._pooled_topics:
+            return False
+        topic_bytes = topic.encode()
+        worker = self._workers[zlib.crc32(topic_bytes) % len(self._workers)]
+        if worker.failed:
+            return False
+        request = (_REQUEST.pack(len(topic_bytes)), topic_bytes, payload)
+        backoff = _Backoff()
+        with worker.submit_lock:
+            if worker.requests.frame_size(*request) > worker.requests.capacity:
+                # too big for the ring, so the caller decodes it. A pooled topic first
+                # waits for its queued values so this one cannot overtake them
+                if topic in self._pooled_topics:
+                    while worker.completed < worker.submitted and self._running and not worker.failed:
+                        backoff.wait()
+                return False
+            self._pooled_topics.add(topic)
+            # a full ring pushes back on the MQTT thread rather than reordering or dropping
+            while not worker.requests.put(*request):
+                if not self._running:
+                    return True
+                backoff.wait()
+            worker.submitted += 1
+        self.submitted += 1
+        return True
+
+    def _collect(self) -> None:
+        backoff = _Backoff()
+        while self._running:
+            idle = True
+            for worker in self._workers:
+                while (frame := worker.results.get()) is not None:
+                    idle = False
+                    self._deliver(frame)
+                    worker.completed += 1
+            if idle:
+                self._check_workers()
+                backoff.wait()
+            else:
+                backoff.reset()
+
+    def _check_workers(self) -> None:
+        for worker in self._workers:
+            if not worker.failed and not worker.process.is_alive():
+                worker.failed = True
+                logger.error(
+                    f"Payload decoder process exited with code {worker.process.exitcode}; "
+                    f"payloads queued for it will not be delivered"
+                )
+
+    def _deliver(self, frame: bytes) -> None:
+        topic, kind, value = decode_result(frame)
+        self.completed += 1
+        if kind == KIND_ERROR:
+            PARSE_FAILURES.labels(topic).inc()
+            logger.error(f"Error processing message from {topic}: {value}")
+            return
+        try:
+            logger.debug(f"Received message on {topic}: {value}")
+            self.on_result(topic, value)
+        except Exception as e:
+            PARSE_FAILURES.labels(topic).inc()
+            logger.error(f"Error processing message from {topic}: {e}")
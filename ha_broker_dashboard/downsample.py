@@ -0,0 +1,40 @@
+"""Downsampling for history range queries."""
+
+from typing import Sequence
+
+
+def lttb(timestamps: Sequence[float], values: Sequence[float], threshold: int) -> list[int]:
+    # largest-triangle-three-buckets: indices of the points to keep, always
+    # including the first and last, chosen to preserve the visual shape
+    count = len(values)
+    if threshold >= count or threshold < 3:
+        return list(range(count))
+
+    selected = [0]
+    bucket_size = (count - 2) / (threshold - 2)
+    a = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+
+        # average of the next bucket is the third vertex of the triangle
+        next_start = end
+        next_end = min(int((bucket + 2) * bucket_size) + 1, count)
+        span = next_end - next_start
+        avg_x = sum(timestamps[next_start:next_end]) / span
+        avg_y = sum(values[next_start:next_end]) / span
+
+        ax = timestamps[a]
+        ay = values[a]
+        best = start
+        best_area = -1.0
+        for i in range(start, end):
+            area = abs((ax - avg_x) * (values[i] - ay) - (ax - timestamps[i]) * (avg_y - ay))
+            if area > best_area:
+                best_area = area
+                best = i
+        selected.append(best)
+        a = best
+
+    selected.append(count - 1)
+    return selected
@@ -0,0 +1,148 @@
+"""Columnar ring buffer for sensor history."""
+
+from array import array
+from datetime import datetime
+from typing import Iterator
+
+
+def format_point(value: float, timestamp: float) -> dict:
+    return {"value": value, "timestamp": datetime.fromtimestamp(timestamp).isoformat()}
+
+
+class HistoryBuffer:
+    # values and epoch timestamps live in two preallocated float64 arrays,
+    # so appending never allocates and slices can be served as memoryviews
+
+    __slots__ = ("maxlen", "_values", "_timestamps", "_start", "_size")
+
+    def __init__(self, maxlen: int):
+        self.maxlen = max(maxlen, 0)
+        self._values = array("d", bytes(8 * self.maxlen))
+        self._timestamps = array("d", bytes(8 * self.maxlen))
+        self._start = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[tuple[float, float]]:
+        for values, timestamps in self.segments():
+            yield from zip(values, timestamps)
+
+    def __getitem__(self, index: int | slice) -> "tuple[float, float] | HistoryView":
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._size)
+            if step != 1:
+                raise ValueError("HistoryBuffer slices do not support a step")
+            return HistoryView(self, start, max(start, stop))
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("history index out of range")
+        physical = (self._start + index) % self.maxlen
+        return self._values[physical], self._timestamps[physical]
+
+    def append(self, value: float, timestamp: float) -> None:
+        if not self.maxlen:
+            return
+        if self._size < self.maxlen:
+            physical = (self._start + self._size) % self.maxlen
+            self._size += 1
+        else:
+            physical = self._start
+            self._start = (self._start + 1) % self.maxlen
+        self._values[physical] = value
+        self._timestamps[physical] = timestamp
+
+    def bisect(self, timestamp: float, right: bool = False) -> int:
+        # logical index of the first point at (or, with right, after) timestamp
+        timestamps = self._timestamps
+        start = self._start
+        maxlen = self.maxlen
+        lo, hi = 0, self._size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            current = timestamps[(start + mid) % maxlen]
+            if current < timestamp or (right and current == timestamp):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def columns(self, start: int = 0, stop: int | None = None) -> tuple[array, array]:
+        # contiguous copies of the (timestamps, values) in [start, stop)
+        timestamps = array("d")
+        values = array("d")
+        for value_segment, timestamp_segment in self.segments(start, stop):
+            values.frombytes(value_segment.cast("B"))
+            timestamps.frombytes(timestamp_segment.cast("B"))
+        return timestamps, values
+
+    def copy(self) -> "HistoryBuffer":
+        clone = HistoryBuffer.__new__(HistoryBuffer)
+        clone.maxlen = self.maxlen
+        clone._values = self._values[:]
+        clone._timestamps = self._timestamps[:]
+        clone._start = self._start
+        clone._size = self._size
+        return clone
+
+    def clear(self) -> None:
+        self._start = 0
+        self._size = 0
+
+    def segments(self, start: int = 0, stop: int | None = None) -> list[tuple[memoryview, memoryview]]:
+        # the logical range [start, stop) as at most two (values, timestamps) pairs, oldest first
+        stop = self._size if stop is None else min(stop, self._size)
+        if start >= stop:
+            return []
+        values = memoryview(self._values)
+        timestamps = memoryview(self._timestamps)
+        first = (self._start + start) % self.maxlen
+        last = first + (stop - start)
+        if last <= self.maxlen:
+            return [(values[first:last], timestamps[first:last])]
+        wrapped = last - self.maxlen
+        return [
+            (values[first:], timestamps[first:]),
+            (values[:wrapped], timestamps[:wrapped]),
+        ]
+
+    def point(self, index: int) -> dict:
+        # a point as sent in live deltas, which also carry the epoch time as "ts":
+        # the naive ISO timestamp is ambiguous in the hour repeated when clocks go back
+        value, timestamp = self[index]
+        point = format_point(value, timestamp)
+        point["ts"] = timestamp
+        return point
+
+    def to_list(self, start: int = 0, stop: int | None = None) -> list[dict]:
+        return [
+            format_point(value, timestamp)
+            for values, timestamps in self.segments(start, stop)
+            for value, timestamp in zip(values, timestamps)
+        ]
+
+
+class HistoryView:
+    # a window onto a HistoryBuffer; it is only valid until the next append
+
+    __slots__ = ("buffer", "start", "stop")
+
+    def __init__(self, buffer: HistoryBuffer, start: int, stop: int):
+        self.buffer = buffer
+        self.start = start
+        self.stop = stop
+
+    def __len__(self) -> int:
+        return self.stop - self.start
+
+    def __iter__(self) -> Iterator[tuple[float, float]]:
+        for values, timestamps in self.segments():
+            yield from zip(values, timestamps)
+
+    def segments(self) -> list[tuple[memoryview, memoryview]]:
+        return self.buffer.segments(self.start, self.stop)
+
+    def to_list(self) -> list[dict]:
+        return self.buffer.to_list(self.start, self.stop)
@@ -0,0 +1,200 @@
+"""Append-only, segmented on-disk history log for graph sensors."""
+
+import logging
+import mmap
+import queue
+import struct
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+from typing import BinaryIO, Iterator
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+# one record per sample: float64 epoch seconds, float64 value (little endian)
+RECORD = struct.Struct("<dd")
+SEGMENT_SUFFIX = ".seg"
+
+_STOP = object()
+
+
+class _Segment:
+
+    def __init__(self, path: Path, file: BinaryIO, records: int):
+        self.path = path
+        self.file = file
+        self.records = records
+
+
+class HistoryLog:
+    # samples are queued by the ingest path and written by a background thread.
+    # each sensor gets a directory of segment files named after the epoch ms of
+    # their first record, so segments sort by time and can be dropped whole
+
+    def __init__(
+        self,
+        directory: str | Path,
+        segment_records: int = 65536,
+        retention_seconds: float = 7 * 24 * 3600,
+        compact_interval: float = 60.0,
+    ):
+        self.directory = Path(directory)
+        self.segment_records = segment_records
+        self.retention_seconds = retention_seconds
+        self.compact_interval = compact_interval
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._segments: dict[str, _Segment] = {}
+        self._thread: threading.Thread | None = None
+
+    def topic_directory(self, topic: str) -> Path:
+        return self.directory / quote(topic, safe="")
+
+    def _segment_paths(self, topic: str) -> list[Path]:
+        directory = self.topic_directory(topic)
+        if not directory.is_dir():
+            return []
+        return self._segments_in(directory)
+
+    @staticmethod
+    def _segments_in(directory: Path) -> list[Path]:
+        # segment files in time order; stray files that are not named by epoch ms are skipped
+        return sorted(path for path in directory.glob(f"*{SEGMENT_SUFFIX}") if path.stem.isdigit())
+
+    def append(self, topic: str, timestamp: float, value: float) -> None:
+        self._queue.put((topic, timestamp, value))
+
+    def start(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="history-log", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    def _run(self) -> None:
+        next_compaction = time.monotonic()
+        running = True
+        while running:
+            try:
+                items = [self._queue.get(timeout=self.compact_interval)]
+            except queue.Empty:
+                items = []
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if _STOP in items:
+                items = [item for item in items if item is not _STOP]
+                running = False
+
+            try:
+                self._write(items)
+                if time.monotonic() >= next_compaction or not running:
+                    self.compact()
+                    next_compaction = time.monotonic() + self.compact_interval
+            except Exception as e:
+                # the queue is unbounded, so this thread must outlive any one bad batch
+                logger.error(f"Error writing history log: {e}")
+
+        for segment in self._segments.values():
+            segment.file.close()
+        self._segments.clear()
+
+    def _write(self, items: list[tuple[str, float, float]]) -> None:
+        touched = set()
+        for topic, timestamp, value in items:
+            segment = self._segments.get(topic)
+            if segment is None or segment.records >= self.segment_records:
+                segment = self._open_segment(topic, timestamp)
+            segment.file.write(RECORD.pack(timestamp, value))
+            segment.records += 1
+            touched.add(topic)
+        # rolled-over segments were flushed when they were closed
+        for topic in touched:
+            self._segments[topic].file.flush()
+
+    def _open_segment(self, topic: str, timestamp: float) -> _Segment:
+        previous = self._segments.pop(topic, None)
+        if previous is None:
+            # continue the newest segment left by a previous run if it has room
+            paths = self._segment_paths(topic)
+            if paths:
+                records = paths[-1].stat().st_size // RECORD.size
+                if records < self.segment_records:
+                    segment = _Segment(paths[-1], open(paths[-1], "ab"), records)
+                    self._segments[topic] = segment
+                    return segment
+        else:
+            previous.file.close()
+
+        directory = self.topic_directory(topic)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{int(timestamp * 1000):016d}{SEGMENT_SUFFIX}"
+        segment = _Segment(path, open(path, "ab"), 0)
+        self._segments[topic] = segment
+        return segment
+
+    def compact(self, now: float | None = None) -> None:
+        # a segment is expired once the segment after it starts before the cutoff
+        cutoff = (time.time() if now is None else now) - self.retention_seconds
+        if not self.directory.is_dir():
+            return
+        for directory in self.directory.iterdir():
+            paths = self._segments_in(directory)
+            for path, following in zip(paths, paths[1:]):
+                if int(following.stem) / 1000 > cutoff:
+                    break
+                path.unlink()
+
+    def _records(self, path: Path) -> Iterator[memoryview]:
+        # yields the segment's float64 contents, trimmed to whole records
+        with open(path, "rb") as f:
+            size = f.seek(0, 2) // RECORD.size * RECORD.size
+            if not size:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)[:size].cast("d")
+                try:
+                    yield view
+                finally:
+                    view.release()
+
+    def load_recent(self, topic: str, count: int) -> list[tuple[float, float]]:
+        # newest `count` samples as (timestamp, value), oldest first
+        chunks: list[list[tuple[float, float]]] = []
+        remaining = count
+        for path in reversed(self._segment_paths(topic)):
+            if remaining <= 0:
+                break
+            for view in self._records(path):
+                records = len(view) // 2
+                start = max(records - remaining, 0)
+                chunks.append([(view[i * 2], view[i * 2 + 1]) for i in range(start, records)])
+                remaining -= records - start
+        return [record for chunk in reversed(chunks) for record in chunk]
+
+    def read(
+        self, topic: str, start: float | None = None, end: float | None = None
+    ) -> list[tuple[float, float]]:
+        # samples with start <= timestamp <= end as (timestamp, value), oldest first
+        paths = self._segment_paths(topic)
+        result = []
+        for index, path in enumerate(paths):
+            if end is not None and int(path.stem) / 1000 > end:
+                break
+            if start is not None and index + 1 < len(paths) and int(paths[index + 1].stem) / 1000 < start:
+                continue
+            for view in self._records(path):
+                # records are appended in time order, so bisect the timestamp column
+                with view[::2] as timestamps, view[1::2] as values:
+                    low = 0 if start is None else bisect_left(timestamps, start)
+                    high = len(timestamps) if end is None else bisect_right(timestamps, end)
+                    result.extend(zip(timestamps[low:high].tolist(), values[low:high].tolist()))
+        return result
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyStats:
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class IngestQueue:
+    # hands updates from the MQTT network thread to the event loop. deque appends
+    # are thread-safe, and the loop is only woken when it is not already due to
+    # drain, so a burst of messages costs one wake-up instead of one task each
+
+    def __init__(self, handler: Callable[[str, Any], None], max_batch: int = 1024):
+        self.handler = handler
+        self.max_batch = max_batch
+        self.latency = LatencyStats()
+        self.batches = 0
+        self._items: deque[tuple[str, Any, float]] = deque()
+        self._scheduled = False
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wakeup: asyncio.Event | None = None
+
+    @property
+    def depth(self) -> int:
+        return len(self._items)
+
+    def put(self, topic: str, update: Any) -> None:
+        self._items.append((topic, update, time.perf_counter()))
+        if not self._scheduled and self._loop is not None:
+            self._scheduled = True
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def run(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        # pick up anything queued before the loop was attached
+        self._wakeup.set()
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            self._scheduled = False
+            self._drain()
+            if self._items:
+                # batch limit hit; let other tasks run before continuing
+                self._wakeup.set()
+                await asyncio.sleep(0)
+
+    def _drain(self) -> None:
+        items = self._items
+        observe = self.latency.observe
+        now = time.perf_counter()
+        for _ in range(min(len(items), self.max_batch)):
+            topic, update, enqueued_at = items.popleft()
+            observe(now - enqueued_at)
+            try:
+                self.handler(topic, update)
+            except Exception as e:
+                logger.error(f"Error handling update for {topic}: {e}")
+        self.batches += 1
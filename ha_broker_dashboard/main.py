@@ -1,6 +1,7 @@
 import asyncio
 import logging
 import sys
+import threading
 from pathlib import Path
 
 import uvicorn
@@ -8,17 +9,27 @@ import uvicorn
 if __name__ == "__main__" and __package__ is None:
     # Running as script - fix imports
     sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from ha_broker_dashboard.coalescer import UpdateCoalescer
     from ha_broker_dashboard.config import load_config
-    from ha_broker_dashboard.data_store import DataStore
+    from ha_broker_dashboard.data_store import DataStore, SensorData
+    from ha_broker_dashboard.history_log import HistoryLog
+    from ha_broker_dashboard.ingest import IngestQueue
+    from ha_broker_dashboard.metrics import REGISTRY
     from ha_broker_dashboard.mqtt_client import MQTTClient
-    from ha_broker_dashboard.web_server import broadcast_sensor_update, create_app
+    from ha_broker_dashboard.topic_trie import is_wildcard
+    from ha_broker_dashboard.web_server import create_app
     from ha_broker_dashboard.websocket_manager import WebSocketManager
 else:
     # Running as module
+    from .coalescer import UpdateCoalescer
     from .config import load_config
-    from .data_store import DataStore
+    from .data_store import DataStore, SensorData
+    from .history_log import HistoryLog
+    from .ingest import IngestQueue
+    from .metrics import REGISTRY
     from .mqtt_client import MQTTClient
-    from .web_server import broadcast_sensor_update, create_app
+    from .topic_trie import is_wildcard
+    from .web_server import create_app
     from .websocket_manager import WebSocketManager
 
 logging.basicConfig(
@@ -31,11 +42,78 @@ logger = logging.getLogger(__name__)
 class Dashboard:
     def __init__(self, config_path: str = "config.yaml"):
         self.config = load_config(config_path)
-        self.data_store = DataStore()
-        self.ws_manager = WebSocketManager()
-        self.app = create_app(self.data_store, self.ws_manager)
+        self.history_log: HistoryLog | None = None
+        if self.config.storage:
+            self.history_log = HistoryLog(
+                self.config.storage.path,
+                segment_records=self.config.storage.segment_records,
+                retention_seconds=self.config.storage.retention_hours * 3600,
+            )
+        self.data_store = DataStore(history_log=self.history_log)
+        self.ws_manager = WebSocketManager(
+            max_queue=self.config.server.client_queue_size,
+            max_lag=self.config.server.client_max_lag,
+            topic_ids=self.data_store.topic_ids,
+            replay_size=self.config.server.replay_size,
+        )
+        self.coalescer = UpdateCoalescer(
+            self.ws_manager, default_interval=self.config.server.coalesce_ms / 1000
+        )
+        self.ingest = IngestQueue(self.coalescer.submit)
+        self.app = create_app(
+            self.data_store, self.ws_manager, static_reload=self.config.server.static_reload
+        )
+        self._register_metrics()
         self.mqtt_client: MQTTClient | None = None
+        self.server: uvicorn.Server | None = None
         self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread: int | None = None
+
+    def _register_metrics(self) -> None:
+        REGISTRY.callback(
+            "ha_dashboard_handoff_queue_depth",
+            "Updates waiting to be handed from the MQTT threads to the event loop",
+            lambda: self.ingest.depth,
+        )
+        REGISTRY.callback(
+            "ha_dashboard_handoff_seconds_total",
+            "Total time updates spent in the handoff queue",
+            lambda: self.ingest.latency.total,
+            kind="counter",
+        )
+        REGISTRY.callback(
+            "ha_dashboard_handoff_updates_total",
+            "Updates passed through the handoff queue",
+            lambda: self.ingest.latency.count,
+            kind="counter",
+        )
+        REGISTRY.callback(
+            "ha_dashboard_websocket_clients",
+            "Connected WebSocket clients",
+            lambda: len(self.ws_manager.active_connections),
+        )
+        REGISTRY.callback(
+            "ha_dashboard_websocket_client_lag_seconds",
+            "Age of the oldest message not yet written to each client",
+            self.ws_manager.client_lags,
+            labelnames=["client"],
+        )
+        REGISTRY.callback(
+            "ha_dashboard_frames_dropped_total",
+            "Queued client updates replaced by a newer one because the client fell behind",
+            self.ws_manager.frames_dropped,
+            kind="counter",
+        )
+        REGISTRY.callback(
+            "ha_dashboard_mqtt_messages_total",
+            "MQTT messages received on each broker connection",
+            lambda: {
+                (str(stats["connection"]),): stats["messages"]
+                for stats in (self.mqtt_client.stats() if self.mqtt_client else [])
+            },
+            labelnames=["connection"],
+            kind="counter",
+        )
 
     def _register_sensors(self) -> None:
         topics_seen = set()
@@ -47,8 +125,7 @@ class Dashboard:
 
             topics_seen.add(sensor.topic)
 
-            self.data_store.register_sensor(
-                topic=sensor.topic,
+            sensor_kwargs = dict(
                 name=sensor.name,
                 sensor_type=sensor.type,
                 implementation=sensor.implementation,
@@ -61,54 +138,127 @@ class Dashboard:
                 input_unit=sensor.inputUnit,
                 precision=sensor.precision,
             )
+            if is_wildcard(sensor.topic):
+                # sensors are created from this template as matching topics arrive
+                self.data_store.register_template(sensor.topic, **sensor_kwargs)
+            else:
+                self.data_store.register_sensor(topic=sensor.topic, **sensor_kwargs)
+            if sensor.coalesceMs is not None:
+                # for templates this is keyed by the pattern and copied to each new topic
+                self.coalescer.set_interval(sensor.topic, sensor.coalesceMs / 1000)
             logger.info(f"Registered sensor: {sensor.name} ({sensor.topic})")
 
     def _on_mqtt_message(self, topic: str, value) -> None:
         sensor_data = self.data_store.update_sensor(topic, value)
-        if sensor_data and self._loop:
-            asyncio.run_coroutine_threadsafe(
-                broadcast_sensor_update(self.ws_manager, topic, sensor_data.to_dict()),
-                self._loop,
-            )
+        if sensor_data:
+            if not sensor_data.announced:
+                sensor_data.announced = True
+                logger.info(f"Registered sensor: {sensor_data.name} ({topic}) from {sensor_data.template}")
+                if threading.get_ident() == self._loop_thread:
+                    self._announce_sensor(sensor_data)
+                elif self._loop:
+                    self._loop.call_soon_threadsafe(self._announce_sensor, sensor_data)
+            if threading.get_ident() == self._loop_thread:
+                # asyncio MQTT mode: already on the event loop, skip the handoff queue
+                self.coalescer.submit(topic, sensor_data.to_update_dict())
+            else:
+                self.ingest.put(topic, sensor_data.to_update_dict())
 
-    def run(self) -> None:
-        logger.info("Starting HA Broker Dashboard...")
+    def _announce_sensor(self, sensor_data: SensorData) -> None:
+        interval = self.coalescer.intervals.get(sensor_data.template)
+        if interval is not None:
+            self.coalescer.set_interval(sensor_data.topic, interval)
+        self.ws_manager.publish(
+            {"type": "sensor", "topic": sensor_data.topic, "data": sensor_data.to_dict()}
+        )
+
+    async def _report_throughput(self, interval: float = 60.0) -> None:
+        previous: dict[int, int] = {}
+        while True:
+            await asyncio.sleep(interval)
+            if not self.mqtt_client:
+                continue
+            for stats in self.mqtt_client.stats():
+                messages = stats["messages"] - previous.get(stats["connection"], 0)
+                previous[stats["connection"]] = stats["messages"]
+                logger.info(
+                    f"MQTT connection {stats['connection']}: {messages / interval:.1f} msg/s "
+                    f"over {stats['topics']} topic(s), {stats['messages']} messages total"
+                )
+
+    async def serve(self) -> None:
+        # runs the dashboard on the current event loop until stop() is called
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
         self._register_sensors()
+        if self.history_log:
+            self.history_log.start()
 
         self.mqtt_client = MQTTClient(
             config=self.config.mqtt,
             sensors=self.config.sensors,
             on_message_callback=self._on_mqtt_message,
+            loop=self._loop,
         )
 
         try:
             self.mqtt_client.connect()
             self.mqtt_client.start()
-            logger.info("MQTT client started")
+            logger.info(f"MQTT client started ({self.config.mqtt.mode} mode)")
         except Exception as e:
             logger.error(f"Failed to connect to MQTT broker: {e}")
 
-        self._loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(self._loop)
         config = uvicorn.Config(
             self.app,
             host=self.config.server.host,
             port=self.config.server.port,
             loop="asyncio",
         )
-        server = uvicorn.Server(config)
-
+        self.server = uvicorn.Server(config)
+        tasks = [
+            asyncio.create_task(self.ingest.run()),
+            asyncio.create_task(self._report_throughput()),
+        ]
         try:
             logger.info(
                 f"Starting web server on http://{self.config.server.host}:{self.config.server.port}"
             )
-            self._loop.run_until_complete(server.serve())
+            await self.server.serve()
+        finally:
+            for task in tasks:
+                task.cancel()
+            self._shutdown()
+
+    @property
+    def port(self) -> int | None:
+        # the bound port once the web server has started, also when configured as 0
+        if self.server is None or not self.server.started:
+            return None
+        return self.server.servers[0].sockets[0].getsockname()[1]
+
+    def stop(self) -> None:
+        # may be called from any thread
+        if self.server:
+            self.server.should_exit = True
+
+    def _shutdown(self) -> None:
+        if self.mqtt_client:
+            self.mqtt_client.stop()
+            self.mqtt_client = None
+        if self.history_log:
+            self.history_log.stop()
+
+    def run(self) -> None:
+        logger.info("Starting HA Broker Dashboard...")
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(self.serve())
         except KeyboardInterrupt:
             logger.info("Shutting down...")
         finally:
-            if self.mqtt_client:
-                self.mqtt_client.stop()
-            self._loop.close()
+            self._shutdown()
+            loop.close()
 
 
 def main():
@@ -0,0 +1,235 @@
+"""Minimal Prometheus metrics for the dashboard's hot paths.
+
+Metric children are bound once (per topic, at registration) and then updated
+without locks: every thread increments its own cell, and cells are only summed
+when /metrics is scraped.
+"""
+
+import math
+import threading
+from bisect import bisect_left
+from typing import Callable, Iterable
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+)
+
+Labels = tuple[str, ...]
+Sample = tuple[str, dict[str, str], float]
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + "}"
+
+
+class CounterChild:
+
+    __slots__ = ("_local", "_cells")
+
+    def __init__(self):
+        # each thread gets a one-element list only it writes to; the list of all
+        # of them is kept so cells of finished threads still count
+        self._local = threading.local()
+        self._cells: list[list[float]] = []
+
+    def inc(self, amount: float = 1.0) -> None:
+        try:
+            self._local.cell[0] += amount
+        except AttributeError:
+            self._local.cell = [amount]
+            self._cells.append(self._local.cell)
+
+    @property
+    def value(self) -> float:
+        return sum(cell[0] for cell in list(self._cells))
+
+
+class HistogramChild:
+
+    __slots__ = ("buckets", "_local", "_cells")
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self._local = threading.local()
+        # per thread: one count per bucket plus +Inf, then the sum
+        self._cells: list[list[float]] = []
+
+    def observe(self, value: float) -> None:
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._local.cell = [0.0] * (len(self.buckets) + 2)
+            self._cells.append(cell)
+        cell[bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def totals(self) -> list[float]:
+        totals = [0.0] * (len(self.buckets) + 2)
+        for cell in list(self._cells):
+            for index, value in enumerate(cell):
+                totals[index] += value
+        return totals
+
+    @property
+    def count(self) -> float:
+        return sum(self.totals()[:-1])
+
+
+class _Family:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[Labels, object] = {}
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        # bind once and keep the child; this lookup is not meant for the per-message path
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def samples(self) -> list[Sample]:
+        raise NotImplementedError
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Family):
+    kind = "counter"
+
+    def _new_child(self) -> CounterChild:
+        return CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def samples(self) -> list[Sample]:
+        return [
+            (self.name, dict(zip(self.labelnames, values)), child.value)
+            for values, child in list(self._children.items())
+        ]
+
+
+class Histogram(_Family):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> HistogramChild:
+        return HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def samples(self) -> list[Sample]:
+        samples = []
+        for values, child in list(self._children.items()):
+            labels = dict(zip(self.labelnames, values))
+            totals = child.totals()
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (math.inf,), totals):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            samples.append((f"{self.name}_sum", labels, totals[-1]))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+class CallbackMetric(_Family):
+    # a gauge or counter whose values are read from the application at scrape time;
+    # the function returns a number, or {label values: number} for labelled metrics
+
+    def __init__(self, name, documentation, function, labelnames=(), kind="gauge"):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self.function = function
+
+    def samples(self) -> list[Sample]:
+        result = self.function()
+        if not self.labelnames:
+            return [(self.name, {}, float(result))]
+        return [
+            (self.name, dict(zip(self.labelnames, values)), float(value))
+            for values, value in result.items()
+        ]
+
+
+class Registry:
+
+    def __init__(self):
+        self._families: dict[str, _Family] = {}
+
+    def _get_or_add(self, family: _Family) -> _Family:
+        existing = self._families.get(family.name)
+        if existing is not None:
+            if type(existing) is not type(family) or existing.labelnames != family.labelnames:
+                raise ValueError(f"Metric {family.name} is already registered differently")
+            return existing
+        self._families[family.name] = family
+        return family
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._get_or_add(Counter(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._get_or_add(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(
+        self,
+        name: str,
+        documentation: str,
+        function: Callable[[], float | dict[Labels, float]],
+        labelnames: Iterable[str] = (),
+        kind: str = "gauge",
+    ) -> CallbackMetric:
+        # registering the same name again points it at the new function, so a
+        # restarted component replaces its predecessor's callbacks
+        metric = CallbackMetric(name, documentation, function, labelnames, kind)
+        self._families[name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for family in list(self._families.values()):
+            lines.extend(family.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
@@ -1,26 +1,74 @@
-import json
+import asyncio
 import logging
+import time
+import zlib
 from typing import Callable
 
 import paho.mqtt.client as mqtt
 
 from .config import MQTTConfig, SensorConfig
+from .decode_pool import DecodePool
+from .payloads import PARSE_FAILURES, PayloadDecoder, PayloadFormat
+from .topic_trie import filters_overlap, is_wildcard
 
 logger = logging.getLogger(__name__)
 
+# asyncio mode: most packets handled per socket-readable callback, so a busy socket
+# cannot starve the rest of the event loop
+MAX_READS_PER_EVENT = 64
+MISC_INTERVAL = 1.0
+MAX_RECONNECT_DELAY = 30.0
+
+
+def partition_topics(topics: list[str], connections: int) -> list[list[str]]:
+    # stable topic -> connection assignment, so a topic's messages stay ordered on one socket.
+    # Filters that can match the same topic share a connection, where the broker delivers
+    # a message once; on separate connections it would arrive once per filter
+    partitions: list[list[str]] = [[] for _ in range(max(connections, 1))]
+    group = {topic: topic for topic in topics}
+
+    def root(topic: str) -> str:
+        while group[topic] != topic:
+            group[topic] = group[group[topic]]
+            topic = group[topic]
+        return topic
+
+    # two exact topics never overlap, so only wildcards need comparing
+    for pattern in filter(is_wildcard, topics):
+        for topic in topics:
+            if topic != pattern and filters_overlap(pattern, topic):
+                first, second = sorted((root(pattern), root(topic)))
+                group[second] = first
+    for topic in topics:
+        partitions[zlib.crc32(root(topic).encode()) % len(partitions)].append(topic)
+    return partitions
 
-class MQTTClient:
+
+class MQTTConnection:
+    # one broker connection with its own network thread and share of the topics
 
     def __init__(
         self,
+        index: int,
         config: MQTTConfig,
-        sensors: list[SensorConfig],
+        topics: list[str],
         on_message_callback: Callable[[str, str], None],
+        decoder: PayloadDecoder,
+        decode_pool: DecodePool | None = None,
     ):
+        self.index = index
         self.config = config
-        self.sensors = sensors
+        self.topics = topics
         self.on_message_callback = on_message_callback
-        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        self.decoder = decoder
+        self.decode_pool = decode_pool
+        self.messages = 0
+        self.bytes = 0
+        self.started_at: float | None = None
+
+        # shared subscriptions are an MQTT 5 feature
+        protocol = mqtt.MQTTv5 if config.shared_group else mqtt.MQTTv311
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, protocol=protocol)
         self.client.on_connect = self._on_connect
         self.client.on_message = self._on_message
         self.client.on_disconnect = self._on_disconnect
@@ -28,44 +76,197 @@ class MQTTClient:
         if config.username and config.password:
             self.client.username_pw_set(config.username, config.password)
 
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._misc_handle: asyncio.TimerHandle | None = None
+        self._reconnecting = False
+        self._reconnect_delay = MISC_INTERVAL
+
+    def attach(self, loop: asyncio.AbstractEventLoop) -> None:
+        # drive this connection from the event loop instead of a paho thread; must be
+        # called before connecting so the socket hooks see the first socket.
+        # paho may open sockets from an executor thread while reconnecting, so the
+        # hooks always go through call_soon_threadsafe
+        self._loop = loop
+        self.client.on_socket_open = lambda client, userdata, sock: loop.call_soon_threadsafe(
+            loop.add_reader, sock, self._read
+        )
+        self.client.on_socket_close = lambda client, userdata, sock: loop.call_soon_threadsafe(
+            self._remove_socket, sock
+        )
+        self.client.on_socket_register_write = (
+            lambda client, userdata, sock: loop.call_soon_threadsafe(
+                loop.add_writer, sock, self.client.loop_write
+            )
+        )
+        self.client.on_socket_unregister_write = (
+            lambda client, userdata, sock: loop.call_soon_threadsafe(loop.remove_writer, sock)
+        )
+
+    def _remove_socket(self, sock) -> None:
+        self._loop.remove_reader(sock)
+        self._loop.remove_writer(sock)
+
+    def _read(self) -> None:
+        # loop_read handles about one packet per call; keep going while messages arrive
+        for _ in range(MAX_READS_PER_EVENT):
+            received = self.messages
+            if self.client.loop_read() != mqtt.MQTT_ERR_SUCCESS or self.messages == received:
+                return
+
+    def _loop_misc(self) -> None:
+        if not self._reconnecting and self.client.loop_misc() == mqtt.MQTT_ERR_NO_CONN:
+            self._reconnecting = True
+            self._loop.run_in_executor(None, self._reconnect)
+        self._misc_handle = self._loop.call_later(MISC_INTERVAL, self._loop_misc)
+
+    def _reconnect(self) -> None:
+        time.sleep(self._reconnect_delay)
+        try:
+            self.client.reconnect()
+            self._reconnect_delay = MISC_INTERVAL
+        except Exception as e:
+            logger.error(f"Connection {self.index} failed to reconnect to MQTT broker: {e}")
+            self._reconnect_delay = min(self._reconnect_delay * 2, MAX_RECONNECT_DELAY)
+        finally:
+            self._reconnecting = False
+
+    def start(self) -> None:
+        self.started_at = time.monotonic()
+        if self._loop is None:
+            self.client.loop_start()
+        else:
+            self._misc_handle = self._loop.call_later(MISC_INTERVAL, self._loop_misc)
+
+    def stop(self) -> None:
+        self.client.disconnect()
+        if self._loop is None:
+            return
+        # nothing drives the socket once the loop stops, so flush the DISCONNECT now
+        self.client.loop_write()
+        if self._misc_handle:
+            self._misc_handle.cancel()
+        sock = self.client.socket()
+        if sock is not None:
+            self._remove_socket(sock)
+
+    def join(self) -> None:
+        if self._loop is None:
+            self.client.loop_stop()
+
+    def subscription(self, topic: str) -> str:
+        if self.config.shared_group:
+            return f"$share/{self.config.shared_group}/{topic}"
+        return topic
+
     def _on_connect(self, client, userdata, flags, reason_code, properties):
         if reason_code == 0:
-            logger.info("Connected to MQTT broker")
-            for sensor in self.sensors:
-                client.subscribe(sensor.topic)
-                logger.info(f"Subscribed to topic: {sensor.topic}")
+            logger.info(f"Connection {self.index} connected to MQTT broker")
+            for topic in self.topics:
+                client.subscribe(self.subscription(topic))
+                logger.debug(f"Subscribed to topic: {self.subscription(topic)} (connection {self.index})")
+            logger.info(f"Connection {self.index} subscribed to {len(self.topics)} topic(s)")
         else:
-            logger.error(f"Failed to connect to MQTT broker: {reason_code}")
+            logger.error(f"Connection {self.index} failed to connect to MQTT broker: {reason_code}")
 
     def _on_message(self, client, userdata, msg):
         topic = msg.topic
+        self.messages += 1
+        self.bytes += len(msg.payload)
         try:
-            payload = msg.payload.decode("utf-8")
-            try:
-                value = json.loads(payload)
-            except json.JSONDecodeError:
-                value = payload
+            if self.decode_pool and self.decode_pool.submit(topic, msg.payload):
+                return
+            value = self.decoder.decode(topic, msg.payload)
 
             logger.debug(f"Received message on {topic}: {value}")
             self.on_message_callback(topic, value)
         except Exception as e:
+            PARSE_FAILURES.labels(topic).inc()
             logger.error(f"Error processing message from {topic}: {e}")
 
     def _on_disconnect(self, client, userdata, flags, reason_code, properties):
-        logger.warning(f"Disconnected from MQTT broker: {reason_code}")
+        logger.warning(f"Connection {self.index} disconnected from MQTT broker: {reason_code}")
+
+    def stats(self) -> dict:
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        return {
+            "connection": self.index,
+            "topics": len(self.topics),
+            "messages": self.messages,
+            "bytes": self.bytes,
+            "messages_per_second": self.messages / elapsed if elapsed else 0.0,
+            "bytes_per_second": self.bytes / elapsed if elapsed else 0.0,
+        }
+
+
+class MQTTClient:
+
+    def __init__(
+        self,
+        config: MQTTConfig,
+        sensors: list[SensorConfig],
+        on_message_callback: Callable[[str, str], None],
+        loop: asyncio.AbstractEventLoop | None = None,
+    ):
+        # with config.mode == "asyncio" every connection is driven by `loop`
+        self.config = config
+        self.sensors = sensors
+        self.on_message_callback = on_message_callback
+        topics = list(dict.fromkeys(sensor.topic for sensor in sensors))
+        formats = [
+            PayloadFormat(
+                topic=sensor.topic,
+                format=sensor.payload,
+                value_path=sensor.valuePath,
+                true_value=sensor.true,
+                false_value=sensor.false,
+            )
+            for sensor in sensors
+        ]
+        self.decoder = PayloadDecoder(formats)
+        self.decode_pool: DecodePool | None = None
+        if config.decode_workers > 0:
+            self.decode_pool = DecodePool(
+                config.decode_workers,
+                formats,
+                on_message_callback,
+                min_bytes=config.decode_min_bytes,
+            )
+        self.connections = [
+            MQTTConnection(index, config, partition, on_message_callback, self.decoder, self.decode_pool)
+            for index, partition in enumerate(partition_topics(topics, config.connections))
+        ]
+        if config.mode == "asyncio":
+            if loop is None:
+                raise ValueError("MQTT asyncio mode needs an event loop")
+            for connection in self.connections:
+                connection.attach(loop)
 
     def connect(self) -> None:
-        logger.info(f"Connecting to MQTT broker at {self.config.host}:{self.config.port}")
+        logger.info(
+            f"Connecting to MQTT broker at {self.config.host}:{self.config.port} "
+            f"with {len(self.connections)} connection(s)"
+        )
         try:
-            self.client.connect(self.config.host, self.config.port, 60)
+            for connection in self.connections:
+                connection.client.connect(self.config.host, self.config.port, 60)
         except Exception as e:
             logger.error(f"Failed to connect to MQTT broker: {e}")
             raise
 
     def start(self) -> None:
-        self.client.loop_start()
+        if self.decode_pool:
+            self.decode_pool.start()
+        for connection in self.connections:
+            connection.start()
 
     def stop(self) -> None:
-        self.client.loop_stop()
-        self.client.disconnect()
+        # disconnecting first wakes every network thread, so they all exit together
+        for connection in self.connections:
+            connection.stop()
+        for connection in self.connections:
+            connection.join()
+        if self.decode_pool:
+            self.decode_pool.stop()
 
+    def stats(self) -> list[dict]:
+        return [connection.stats() for connection in self.connections]
@@ -0,0 +1,139 @@
+"""MQTT payload decoding, shared by the MQTT threads and the decode worker processes."""
+
+import json
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from .metrics import REGISTRY
+from .topic_trie import TopicTrie
+
+ValuePath = tuple[str | int, ...]
+Parser = Callable[[bytes], Any]
+
+PAYLOAD_FORMATS = ("auto", "numeric", "boolean", "string", "json")
+PARSE_FAILURES = REGISTRY.counter(
+    "ha_dashboard_parse_failures_total", "MQTT messages that could not be decoded or applied", ["topic"]
+)
+
+TRUE_WORDS = frozenset({"true", "on", "1", "yes", "open"})
+FALSE_WORDS = frozenset({"false", "off", "0", "no", "closed"})
+
+
+@dataclass(frozen=True)
+class PayloadFormat:
+    topic: str
+    format: str = "auto"
+    value_path: str | None = None
+    true_value: str | None = None
+    false_value: str | None = None
+
+
+def parse_value_path(path: str | None) -> ValuePath | None:
+    # "attributes.temperature" -> ("attributes", "temperature"); numeric levels index lists
+    if not path:
+        return None
+    return tuple(int(key) if key.lstrip("-").isdigit() else key for key in path.split("."))
+
+
+def extract_value(value: Any, path: ValuePath) -> Any:
+    for key in path:
+        try:
+            value = value[key]
+        except (KeyError, IndexError, TypeError):
+            raise ValueError(f"payload has no value at {'.'.join(map(str, path))}") from None
+    return value
+
+
+def decode_text(payload: bytes) -> Any:
+    text = payload.decode("utf-8")
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return text
+
+
+def build_parser(spec: PayloadFormat) -> Parser:
+    # picks the cheapest parser for the declared format once, at configuration time;
+    # payloads a declared format cannot handle are decoded the "auto" way instead
+    if spec.format not in PAYLOAD_FORMATS:
+        raise ValueError(f"Unknown payload format for {spec.topic}: {spec.format}")
+    path = parse_value_path(spec.value_path)
+
+    if path is None:
+        auto = decode_text
+    else:
+        def auto(payload: bytes) -> Any:
+            return extract_value(decode_text(payload), path)
+
+    if spec.format == "numeric":
+        def parse_numeric(payload: bytes) -> Any:
+            try:
+                return float(payload)
+            except ValueError:
+                return auto(payload)
+
+        return parse_numeric
+
+    if spec.format == "string":
+        return lambda payload: payload.decode("utf-8")
+
+    if spec.format == "boolean":
+        true_label = spec.true_value or "true"
+        false_label = spec.false_value or "false"
+        labels = {word: true_label for word in TRUE_WORDS} | {word: false_label for word in FALSE_WORDS}
+        labels[true_label.lower()] = true_label
+        labels[false_label.lower()] = false_label
+
+        def parse_boolean(payload: bytes) -> Any:
+            label = labels.get(payload.decode("utf-8").strip().lower())
+            return auto(payload) if label is None else label
+
+        return parse_boolean
+
+    if spec.format == "json":
+        loads = json.loads
+        if path is None:
+            def parse_json(payload: bytes) -> Any:
+                try:
+                    return loads(payload.decode("utf-8"))
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    return auto(payload)
+
+            return parse_json
+
+        def parse_json_path(payload: bytes) -> Any:
+            try:
+                value = loads(payload.decode("utf-8"))
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                # e.g. a plain "offline" on a JSON state topic
+                return decode_text(payload)
+            return extract_value(value, path)
+
+        return parse_json_path
+
+    return auto
+
+
+class PayloadDecoder:
+    # parsers are resolved once per topic, exact topics before wildcard templates
+
+    def __init__(self, formats: list[PayloadFormat]):
+        self.formats = formats
+        self._templates: TopicTrie[Parser] = TopicTrie()
+        self._parsers: dict[str, Parser] = {}
+        for spec in formats:
+            parser = build_parser(spec)
+            self._templates.insert(spec.topic, parser)
+            self._parsers.setdefault(spec.topic, parser)
+
+    def parser_for(self, topic: str) -> Parser:
+        try:
+            return self._parsers[topic]
+        except KeyError:
+            matches = self._templates.match(topic)
+            parser = matches[0][0] if matches else decode_text
+            self._parsers[topic] = parser
+            return parser
+
+    def decode(self, topic: str, payload: bytes) -> Any:
+        return self.parser_for(topic)(payload)
@@ -0,0 +1,85 @@
+"""Fixed-size multi-resolution aggregates for numeric sensors."""
+
+from array import array
+from datetime import datetime
+
+# (bucket width in seconds, buckets kept): an hour of seconds, a day of minutes, a month of hours
+DEFAULT_TIERS: tuple[tuple[int, int], ...] = ((1, 3600), (60, 1440), (3600, 720))
+
+RESOLUTIONS: dict[str, int] = {"1s": 1, "1m": 60, "1h": 3600}
+
+
+class RollupTier:
+    # ring of (start, min, max, sum, count) buckets; the newest bucket is updated
+    # in place and a sample for a later bucket overwrites the oldest one
+
+    __slots__ = ("resolution", "maxlen", "_starts", "_mins", "_maxs", "_sums", "_counts", "_head", "_size")
+
+    def __init__(self, resolution: int, maxlen: int):
+        self.resolution = resolution
+        self.maxlen = maxlen
+        self._starts = array("d", bytes(8 * maxlen))
+        self._mins = array("d", bytes(8 * maxlen))
+        self._maxs = array("d", bytes(8 * maxlen))
+        self._sums = array("d", bytes(8 * maxlen))
+        self._counts = array("q", bytes(8 * maxlen))
+        self._head = -1
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, timestamp: float, value: float) -> None:
+        start = timestamp // self.resolution * self.resolution
+        head = self._head
+        # samples older than the newest bucket (clock steps) are folded into it
+        if self._size and start <= self._starts[head]:
+            if value < self._mins[head]:
+                self._mins[head] = value
+            if value > self._maxs[head]:
+                self._maxs[head] = value
+            self._sums[head] += value
+            self._counts[head] += 1
+            return
+
+        head = (head + 1) % self.maxlen
+        self._head = head
+        if self._size < self.maxlen:
+            self._size += 1
+        self._starts[head] = start
+        self._mins[head] = value
+        self._maxs[head] = value
+        self._sums[head] = value
+        self._counts[head] = 1
+
+    def buckets(self, start: float | None = None, end: float | None = None) -> list[dict]:
+        result = []
+        oldest = self._head - self._size + 1
+        for i in range(oldest, self._head + 1):
+            slot = i % self.maxlen
+            bucket_start = self._starts[slot]
+            if (start is not None and bucket_start + self.resolution <= start) or (
+                end is not None and bucket_start > end
+            ):
+                continue
+            count = self._counts[slot]
+            result.append({
+                "timestamp": datetime.fromtimestamp(bucket_start).isoformat(),
+                "min": self._mins[slot],
+                "max": self._maxs[slot],
+                "mean": self._sums[slot] / count,
+                "count": count,
+            })
+        return result
+
+
+class RollupSet:
+
+    __slots__ = ("tiers",)
+
+    def __init__(self, tiers: tuple[tuple[int, int], ...] = DEFAULT_TIERS):
+        self.tiers = {resolution: RollupTier(resolution, maxlen) for resolution, maxlen in tiers}
+
+    def add(self, timestamp: float, value: float) -> None:
+        for tier in self.tiers.values():
+            tier.add(timestamp, value)
@@ -0,0 +1,87 @@
+import json
+from typing import Any, Callable, Iterator
+
+from .data_store import DataStore
+
+# target size of one init_chunk frame; a single larger sensor still gets a chunk of its own
+INIT_CHUNK_BYTES = 64 * 1024
+
+
+class SnapshotCache:
+    # keeps each sensor's JSON encoding until its version changes, so a full
+    # snapshot only re-encodes the sensors updated since the last one
+
+    def __init__(self, data_store: DataStore):
+        self.data_store = data_store
+        self._fragments: dict[str, tuple[int, bytes]] = {}
+        self._keys: dict[str, bytes] = {}
+
+    def _refresh(self) -> list[str]:
+        known = {topic: version for topic, (version, _) in self._fragments.items()}
+        topics, changed = self.data_store.get_changed_sensors(known)
+        for topic, (version, sensor_dict) in changed.items():
+            self._fragments[topic] = (version, json.dumps(sensor_dict).encode())
+            if topic not in self._keys:
+                self._keys[topic] = json.dumps(topic).encode() + b":"
+        return topics
+
+    def encode_all(self, include: Callable[[str], bool] | None = None) -> bytes:
+        # include limits the snapshot to the topics it accepts
+        topics = self._refresh()
+        if include is not None:
+            topics = [topic for topic in topics if include(topic)]
+        fragments = self._fragments
+        keys = self._keys
+        return b"{" + b",".join(keys[topic] + fragments[topic][1] for topic in topics) + b"}"
+
+    def _fragment(self, topic: str) -> bytes | None:
+        cached = self._fragments.get(topic)
+        changed = self.data_store.get_changed_sensor(topic, cached[0] if cached else None)
+        if changed is not None:
+            version, sensor_dict = changed
+            cached = self._fragments[topic] = (version, json.dumps(sensor_dict).encode())
+        if cached is None:
+            return None
+        key = self._keys.get(topic)
+        if key is None:
+            key = self._keys[topic] = json.dumps(topic).encode() + b":"
+        return key + cached[1]
+
+    def iter_chunks(
+        self,
+        include: Callable[[str], bool] | None = None,
+        max_bytes: int = INIT_CHUNK_BYTES,
+    ) -> Iterator[list[bytes]]:
+        # the snapshot as lists of '"topic":{...}' fragments of about max_bytes each.
+        # Sensors are refreshed as they are reached, so only one chunk is ever built
+        # at a time and each reflects the store when it was produced
+        chunk: list[bytes] = []
+        size = 0
+        for topic in self.data_store.topics():
+            if include is not None and not include(topic):
+                continue
+            fragment = self._fragment(topic)
+            if fragment is None:
+                continue
+            if chunk and size + len(fragment) > max_bytes:
+                yield chunk
+                chunk, size = [], 0
+            chunk.append(fragment)
+            size += len(fragment) + 1
+        if chunk:
+            yield chunk
+
+    @staticmethod
+    def wrap(message_type: str, data: bytes, **fields: Any) -> str:
+        # fields are added to the message next to its type, e.g. the sequence number
+        header = json.dumps({"type": message_type, **fields})[:-1]
+        return header + ', "data": ' + data.decode() + "}"
+
+    @staticmethod
+    def join(fragments: list[bytes]) -> bytes:
+        return b"{" + b",".join(fragments) + b"}"
+
+    def encode_message(
+        self, message_type: str, include: Callable[[str], bool] | None = None, **fields: Any
+    ) -> str:
+        return self.wrap(message_type, self.encode_all(include), **fields)
@@ -0,0 +1,108 @@
+"""Static files loaded once at startup and served from memory, precompressed."""
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+from dataclasses import dataclass
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:  # optional, assets are then only precompressed with gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# revalidate on every load; unchanged assets then cost a 304 from memory
+CACHE_CONTROL = "no-cache"
+# smaller files gain nothing worth a Content-Encoding
+MIN_COMPRESS_BYTES = 256
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+# codings we can serve, best first
+CODINGS = ("br", "gzip")
+
+
+@dataclass(frozen=True)
+class Asset:
+    media_type: str
+    # content coding -> (body, strong ETag); "identity" is always present
+    representations: dict[str, tuple[bytes, str]]
+    mtime: float = 0.0
+
+    def select(self, accept_encoding: str | None) -> tuple[str, bytes, str]:
+        coding = negotiate(accept_encoding, self.representations)
+        body, etag = self.representations[coding]
+        return coding, body, etag
+
+
+def negotiate(accept_encoding: str | None, available) -> str:
+    # the best available coding the client accepts, by q-value and then our preference
+    if not accept_encoding:
+        return "identity"
+    quality = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        quality[coding.strip().lower()] = q
+
+    best, best_q = "identity", 0.0
+    for coding in CODINGS:
+        q = quality.get(coding, quality.get("*", 0.0))
+        if coding in available and q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def build_asset(data: bytes, media_type: str, mtime: float = 0.0) -> Asset:
+    # each encoding is a different representation, so each gets its own strong ETag
+    digest = hashlib.sha256(data).hexdigest()[:20]
+    representations = {"identity": (data, f'"{digest}"')}
+    if len(data) >= MIN_COMPRESS_BYTES and media_type.startswith(COMPRESSIBLE_TYPES):
+        compressed = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            compressed["br"] = brotli.compress(data, quality=11)
+        for coding, body in compressed.items():
+            if len(body) < len(data):
+                representations[coding] = (body, f'"{digest}-{coding}"')
+    return Asset(media_type, representations, mtime)
+
+
+class StaticAssets:
+    # every file under directory, keyed by its relative path. With reload the
+    # directory is rescanned on each lookup and changed files are rebuilt, for
+    # editing the page during development
+
+    def __init__(self, directory: Path, reload: bool = False):
+        self.directory = directory
+        self.reload = reload
+        self._assets: dict[str, Asset] = {}
+        self.load()
+        logger.info(f"Loaded {len(self._assets)} static asset(s) from {self.directory}")
+
+    def load(self) -> None:
+        assets = {}
+        if self.directory.is_dir():
+            for path in sorted(self.directory.rglob("*")):
+                if not path.is_file():
+                    continue
+                name = path.relative_to(self.directory).as_posix()
+                mtime = path.stat().st_mtime
+                asset = self._assets.get(name)
+                if asset is None or asset.mtime != mtime:
+                    media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                    asset = build_asset(path.read_bytes(), media_type, mtime)
+                assets[name] = asset
+        self._assets = assets
+
+    def get(self, name: str) -> Asset | None:
+        if self.reload:
+            self.load()
+        return self._assets.get(name)
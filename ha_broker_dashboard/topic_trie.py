@@ -0,0 +1,93 @@
+"""MQTT topic filter matching."""
+
+from typing import Generic, TypeVar
+
+T = TypeVar("T")
+
+
+def is_wildcard(pattern: str) -> bool:
+    return "+" in pattern.split("/") or pattern.split("/")[-1] == "#"
+
+
+def filters_overlap(first: str, second: str) -> bool:
+    # whether some topic matches both filters
+    a, b = first.split("/"), second.split("/")
+    for depth in range(max(len(a), len(b))):
+        if depth == len(a) or depth == len(b):
+            # "home/#" also matches "home"
+            longer = a if len(a) > len(b) else b
+            return longer[depth] == "#" and len(longer) == depth + 1
+        x, y = a[depth], b[depth]
+        if depth == 0 and (x.startswith("$") or y.startswith("$")) and x != y:
+            # wildcards never match the first level of $-prefixed system topics
+            return False
+        if x == "#" or y == "#":
+            return True
+        if x != y and x != "+" and y != "+":
+            return False
+    return True
+
+
+class _Node(Generic[T]):
+
+    __slots__ = ("children", "entries")
+
+    def __init__(self):
+        self.children: dict[str, _Node[T]] = {}
+        self.entries: list[tuple[int, T]] = []
+
+
+class TopicTrie(Generic[T]):
+    # one node per filter level, so matching a topic walks its levels once and
+    # only branches into "+" and "#" children where filters actually use them
+
+    def __init__(self):
+        self._root: _Node[T] = _Node()
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def insert(self, pattern: str, value: T) -> None:
+        node = self._root
+        for level in pattern.split("/"):
+            node = node.children.setdefault(level, _Node())
+        node.entries.append((self._count, value))
+        self._count += 1
+
+    def match(self, topic: str) -> list[tuple[T, list[str]]]:
+        # every (value, wildcard captures) whose filter matches, in insertion order
+        levels = topic.split("/")
+        found: list[tuple[int, T, list[str]]] = []
+        self._match(self._root, levels, 0, [], found)
+        found.sort(key=lambda item: item[0])
+        return [(value, captures) for _, value, captures in found]
+
+    def _match(
+        self,
+        node: _Node[T],
+        levels: list[str],
+        depth: int,
+        captures: list[str],
+        found: list[tuple[int, T, list[str]]],
+    ) -> None:
+        # wildcards never match the first level of $-prefixed system topics
+        wildcards = not (depth == 0 and levels[0].startswith("$"))
+
+        multi = node.children.get("#") if wildcards else None
+        if multi is not None:
+            rest = "/".join(levels[depth:])
+            for order, value in multi.entries:
+                found.append((order, value, captures + [rest]))
+
+        if depth == len(levels):
+            for order, value in node.entries:
+                found.append((order, value, captures))
+            return
+
+        exact = node.children.get(levels[depth])
+        if exact is not None:
+            self._match(exact, levels, depth + 1, captures, found)
+        single = node.children.get("+") if wildcards else None
+        if single is not None:
+            self._match(single, levels, depth + 1, captures + [levels[depth]], found)
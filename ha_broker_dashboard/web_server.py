@@ -1,59 +1,233 @@
 import asyncio
+import itertools
+import json
 import logging
+from datetime import datetime
 from pathlib import Path
-from typing import Any
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, Response
 
 from .data_store import DataStore
-from .websocket_manager import WebSocketManager
+from .downsample import lttb
+from .history import format_point
+from .metrics import CONTENT_TYPE, REGISTRY, Registry
+from .rollups import RESOLUTIONS
+from .protocol import BINARY_SUBPROTOCOL
+from .snapshot import SnapshotCache
+from .static_assets import CACHE_CONTROL, StaticAssets
+from .topic_trie import TopicTrie
+from .websocket_manager import ALL_TOPICS, WebSocketManager
 
 logger = logging.getLogger(__name__)
 
 STATIC_DIR = Path(__file__).parent / "static"
 
 
-def create_app(data_store: DataStore, ws_manager: WebSocketManager) -> FastAPI:
+def parse_time(value: str | None) -> float | None:
+    # accepts epoch seconds or an ISO 8601 timestamp
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid time: {value}")
+
+
+def parse_topics(values: list[str]) -> list[str] | None:
+    # ?topics=a,b&topics=c/+ -> ["a", "b", "c/+"]; None when no filter was given
+    if not values:
+        return None
+    return [topic.strip() for value in values for topic in value.split(",") if topic.strip()]
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if if_none_match is None:
+        return False
+    candidates = [candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def create_app(
+    data_store: DataStore,
+    ws_manager: WebSocketManager,
+    registry: Registry = REGISTRY,
+    static_reload: bool = False,
+) -> FastAPI:
     app = FastAPI(title="HA Broker Dashboard")
-
-    @app.get("/", response_class=HTMLResponse)
-    async def index():
-        html_path = STATIC_DIR / "index.html"
-        if html_path.exists():
-            return html_path.read_text(encoding="utf-8")
-        return "<html><body><h1>Dashboard</h1><p>Static files not found.</p></body></html>"
+    snapshots = SnapshotCache(data_store)
+    assets = StaticAssets(STATIC_DIR, reload=static_reload)
+
+    def serve_asset(name: str, request: Request) -> Response | None:
+        asset = assets.get(name)
+        if asset is None:
+            return None
+        coding, body, etag = asset.select(request.headers.get("accept-encoding"))
+        headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL, "Vary": "Accept-Encoding"}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        if coding != "identity":
+            headers["Content-Encoding"] = coding
+        return Response(content=body, media_type=asset.media_type, headers=headers)
+
+    @app.api_route("/", methods=["GET", "HEAD"], response_class=HTMLResponse)
+    async def index(request: Request):
+        response = serve_asset("index.html", request)
+        if response is None:
+            return "<html><body><h1>Dashboard</h1><p>Static files not found.</p></body></html>"
+        return response
+
+    @app.api_route("/static/{name:path}", methods=["GET", "HEAD"])
+    async def static(name: str, request: Request):
+        response = serve_asset(name, request)
+        if response is None:
+            raise HTTPException(status_code=404, detail="Not Found")
+        return response
+
+    @app.get("/metrics")
+    async def metrics():
+        return Response(content=registry.render(), media_type=CONTENT_TYPE)
 
     @app.get("/api/sensors")
-    async def get_sensors():
-        return data_store.get_all_sensors()
+    async def get_sensors(
+        request: Request,
+        since: int | None = Query(None, ge=0),
+        fields: str | None = None,
+    ):
+        # the store version is read before the sensors, so the ETag and the
+        # X-Sensors-Version to pass as ?since= next time never claim changes the
+        # body does not contain
+        version = data_store.version
+        headers = {"ETag": f'"{version}"', "X-Sensors-Version": str(version)}
+        if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+
+        if since is None and fields is None:
+            content = snapshots.encode_all()
+        else:
+            names = [name.strip() for name in fields.split(",") if name.strip()] if fields else None
+            content = json.dumps(data_store.get_sensors_since(since or 0, names)).encode()
+        return Response(content=content, media_type="application/json", headers=headers)
+
+    @app.get("/api/sensors/{topic:path}/history")
+    def get_sensor_history(
+        topic: str,
+        start: str | None = Query(None, alias="from"),
+        end: str | None = Query(None, alias="to"),
+        points: int | None = Query(None, ge=3),
+        resolution: str | None = None,
+    ):
+        # a plain def, so FastAPI runs it in its threadpool: reading the on-disk log
+        # and downsampling block and must not stall the event loop
+        if resolution is not None:
+            if resolution not in RESOLUTIONS:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Unknown resolution {resolution}, expected one of {list(RESOLUTIONS)}",
+                )
+            buckets = data_store.get_rollups(
+                topic, RESOLUTIONS[resolution], parse_time(start), parse_time(end)
+            )
+            if buckets is None:
+                raise HTTPException(status_code=404, detail=f"Unknown sensor: {topic}")
+            return {"topic": topic, "resolution": resolution, "buckets": buckets}
+
+        history = data_store.get_history(topic, parse_time(start), parse_time(end))
+        if history is None:
+            raise HTTPException(status_code=404, detail=f"Unknown sensor: {topic}")
+        timestamps, values = history
+        indices = lttb(timestamps, values, points) if points else range(len(values))
+        return {
+            "topic": topic,
+            "points": [format_point(values[i], timestamps[i]) for i in indices],
+        }
+
+    async def handle_client_message(websocket: WebSocket, data: str) -> None:
+        # {"type": "subscribe" | "unsubscribe", "topics": [filter, ...]}
+        try:
+            message = json.loads(data)
+            message_type = message["type"]
+            topics = message["topics"]
+        except (json.JSONDecodeError, KeyError, TypeError):
+            logger.debug(f"Ignoring client message: {data}")
+            return
+        if isinstance(topics, str):
+            topics = [topics]
+        if not isinstance(topics, list) or not all(isinstance(topic, str) for topic in topics):
+            logger.debug(f"Ignoring client message: {data}")
+            return
+
+        if message_type == "subscribe":
+            added = ws_manager.subscribe(websocket, topics)
+            # send the current state of whatever the new filters cover
+            include = TopicTrie()
+            for topic_filter in added:
+                include.insert(topic_filter, topic_filter)
+            await ws_manager.send_personal_text(
+                websocket,
+                snapshots.encode_message(
+                    "subscribed",
+                    None if ALL_TOPICS in added else lambda topic: bool(include.match(topic)),
+                ),
+            )
+        elif message_type == "unsubscribe":
+            removed = ws_manager.unsubscribe(websocket, topics)
+            await ws_manager.send_personal(websocket, {"type": "unsubscribed", "topics": removed})
+        else:
+            logger.debug(f"Ignoring client message: {data}")
+
+    async def send_init(websocket: WebSocket) -> None:
+        # a snapshot that fits one chunk goes out as a single "init"; larger ones are
+        # streamed as "init_chunk" frames and an "init_done". The next chunk is only
+        # built once the previous one was written, so per-client memory stays at one
+        # chunk and other clients' updates keep flowing in between
+        fields = {"epoch": ws_manager.epoch, "seq": ws_manager.seq}
+        chunks = snapshots.iter_chunks(ws_manager.subscriptions(websocket))
+        first = next(chunks, [])
+        second = next(chunks, None)
+        if second is None:
+            await ws_manager.send_personal_text(
+                websocket, snapshots.wrap("init", snapshots.join(first), **fields)
+            )
+            return
+
+        index = sensors = 0
+        for chunk in itertools.chain((first, second), chunks):
+            message = snapshots.wrap("init_chunk", snapshots.join(chunk), index=index, **fields)
+            await ws_manager.send_personal_text(websocket, message)
+            index += 1
+            sensors += len(chunk)
+            if not await ws_manager.wait_drained(websocket):
+                return
+        await ws_manager.send_personal(
+            websocket, {"type": "init_done", **fields, "chunks": index, "sensors": sensors}
+        )
 
     @app.websocket("/ws")
     async def websocket_endpoint(websocket: WebSocket):
-        await ws_manager.connect(websocket)
+        # binary frames are opt-in; anything else gets the JSON protocol
+        requested = websocket.scope.get("subprotocols", [])
+        subprotocol = BINARY_SUBPROTOCOL if BINARY_SUBPROTOCOL in requested else None
+        topics = parse_topics(websocket.query_params.getlist("topics"))
+        # a reconnecting client passes ?resume=<epoch>:<seq> to get only what it missed
+        resume = websocket.query_params.get("resume")
+        await ws_manager.connect(websocket, subprotocol, topics)
 
-        await ws_manager.send_personal(
-            websocket, {"type": "init", "data": data_store.get_all_sensors()}
-        )
+        if resume is None or not ws_manager.resume(websocket, resume):
+            await send_init(websocket)
 
         try:
             while True:
                 data = await websocket.receive_text()
-                logger.debug(f"Received from client: {data}")
+                await handle_client_message(websocket, data)
         except WebSocketDisconnect:
+            pass
+        finally:
             ws_manager.disconnect(websocket)
 
-    if STATIC_DIR.exists():
-        app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
-
     return app
 
-
-async def broadcast_sensor_update(
-    ws_manager: WebSocketManager, topic: str, sensor_data: dict[str, Any]
-) -> None:
-    await ws_manager.broadcast(
-        {"type": "update", "topic": topic, "data": sensor_data}
-    )
-
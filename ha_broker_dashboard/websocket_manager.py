@@ -1,47 +1,455 @@
+import asyncio
+import itertools
 import json
 import logging
-from typing import Any
+import secrets
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Iterable
 
 from fastapi import WebSocket
 
+from .metrics import REGISTRY
+from .protocol import encode_binary
+from .topic_trie import TopicTrie
+
 logger = logging.getLogger(__name__)
 
+# the filter of clients that did not ask for specific topics; unlike an MQTT "#"
+# it also covers $-prefixed topics
+ALL_TOPICS = "#"
+# messages that change client state; they are numbered and kept for replay
+SEQUENCED_TYPES = frozenset({"update", "updates", "sensor"})
+# queue key of coalesced "updates" batches; MQTT topics cannot contain U+0000
+BATCH_KEY = "\x00updates"
+
+PUBLISH_SECONDS = REGISTRY.histogram(
+    "ha_dashboard_publish_seconds", "Time to encode a message and queue it for every client"
+).labels()
+BROADCAST_SECONDS = REGISTRY.histogram(
+    "ha_dashboard_broadcast_seconds",
+    "Time from queueing a message for a client until it was written to the socket",
+).labels()
+SLOW_CLIENT_DISCONNECTS = REGISTRY.counter(
+    "ha_dashboard_slow_client_disconnects_total", "WebSocket clients dropped for falling behind"
+).labels()
+RESUMES = REGISTRY.counter(
+    "ha_dashboard_websocket_resumes_total", "Reconnecting clients that asked to resume", ["result"]
+)
+RESUMES_REPLAYED = RESUMES.labels("replayed")
+RESUMES_SNAPSHOT = RESUMES.labels("snapshot")
+
+
+def merge_update(pending: dict[str, Any], update: dict[str, Any]) -> None:
+    # later fields win, graph points accumulate so clients still see every sample
+    points = pending.get("points")
+    pending.update(update)
+    if points and "points" in update:
+        pending["points"] = points + update["points"]
+
+
+def merge_messages(older: dict[str, Any], newer: dict[str, Any]) -> dict[str, Any]:
+    # folds a newer update/updates message into an older one without touching either,
+    # since both may be shared with other clients and the replay buffer
+    if older.get("type") == "update":
+        data = dict(older["data"])
+        merge_update(data, newer["data"])
+        return {**newer, "data": data}
+    if older.get("type") == "updates":
+        batch = dict(older["data"])
+        for topic, update in newer["data"].items():
+            if topic in batch:
+                batch[topic] = dict(batch[topic])
+                merge_update(batch[topic], update)
+            else:
+                batch[topic] = update
+        return {**newer, "data": batch}
+    return newer
+
+
+class ClientConnection:
+    # outbound messages are queued per client and written by the client's own task,
+    # so a slow socket only ever delays itself
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        max_queue: int,
+        binary: bool = False,
+        encode: Callable[[dict[str, Any], bool], list[str | bytes]] | None = None,
+    ):
+        self.websocket = websocket
+        self.max_queue = max_queue
+        self.binary = binary
+        self.encode = encode
+        self.filters: set[str] = set()
+        # entry id -> (frames, enqueue time, message the frames encode if it may be merged)
+        self._pending: OrderedDict[int, tuple[list[str | bytes], float, dict | None]] = OrderedDict()
+        self._latest: dict[str, int] = {}
+        self._ids = itertools.count()
+        self._ready = asyncio.Event()
+        # set while nothing is queued or being written, and once the client is gone
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._sending_since: float | None = None
+        self.dropped = 0
+        self.task: asyncio.Task | None = None
+
+    def enqueue(self, *frames: str | bytes, force: bool = False) -> bool:
+        # frames that are sent back to back and never merged
+        return self._append(list(frames), None, None, force)
+
+    def enqueue_message(
+        self, message: dict[str, Any], frames: list[str | bytes], key: str | None = None
+    ) -> bool:
+        if len(self._pending) >= self.max_queue:
+            # queue is full: fold the message into the queued one for the same key, so
+            # graph points are merged rather than lost. The merged entry carries the
+            # newer seq and moves to the tail, keeping seqs in sending order, which a
+            # resuming client relies on
+            entry_id = self._latest.get(key) if key is not None else None
+            entry = self._pending.get(entry_id) if entry_id is not None else None
+            if entry is None:
+                return False
+            merged = merge_messages(entry[2], message)
+            self._pending[entry_id] = (self.encode(merged, self.binary), entry[1], merged)
+            self._pending.move_to_end(entry_id)
+            self.dropped += 1
+            return True
+        return self._append(frames, key, message)
+
+    def _append(
+        self, frames: list[str | bytes], key: str | None, message: dict | None, force: bool = False
+    ) -> bool:
+        if len(self._pending) >= self.max_queue and not force:
+            return False
+        entry_id = next(self._ids)
+        self._pending[entry_id] = (frames, time.monotonic(), message)
+        if key is None:
+            # never merge a later message across an unkeyed frame, such as the
+            # announcement of the sensor it updates
+            self._latest.clear()
+        else:
+            self._latest[key] = entry_id
+        self._ready.set()
+        self._drained.clear()
+        return True
+
+    def lag(self) -> float:
+        oldest = self._sending_since
+        if self._pending:
+            queued = next(iter(self._pending.values()))[1]
+            oldest = queued if oldest is None else min(oldest, queued)
+        return 0.0 if oldest is None else time.monotonic() - oldest
+
+    async def drained(self) -> None:
+        await self._drained.wait()
+
+    def close(self) -> None:
+        self._drained.set()
+        if self.task and not self.task.done():
+            self.task.cancel()
+
+    async def run(self) -> None:
+        while True:
+            if not self._pending:
+                self._ready.clear()
+                self._drained.set()
+                await self._ready.wait()
+                continue
+            _, (frames, enqueued_at, _) = self._pending.popitem(last=False)
+            self._sending_since = enqueued_at
+            for frame in frames:
+                if isinstance(frame, bytes):
+                    await self.websocket.send_bytes(frame)
+                else:
+                    await self.websocket.send_text(frame)
+            self._sending_since = None
+            BROADCAST_SECONDS.observe(time.monotonic() - enqueued_at)
+
 
 class WebSocketManager:
 
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
+    def __init__(
+        self,
+        max_queue: int = 256,
+        max_lag: float = 10.0,
+        topic_ids: dict[str, int] | None = None,
+        replay_size: int = 1024,
+    ):
+        self.max_queue = max_queue
+        self.max_lag = max_lag
+        self.topic_ids: dict[str, int] = topic_ids if topic_ids is not None else {}
+        # sequence numbers restart with the process, the epoch tells clients apart
+        # which numbering their last sequence number belongs to
+        self.epoch = secrets.token_hex(4)
+        self.seq = 0
+        self._replay: deque[dict[str, Any]] = deque(maxlen=replay_size)
+        self.active_connections: dict[WebSocket, ClientConnection] = {}
+        self._dropped_by_closed = 0
+        # routing index: filter -> subscribed clients, and the resolved clients per
+        # topic, which is rebuilt lazily whenever any subscription changes
+        self._subscribers: dict[str, set[ClientConnection]] = {}
+        self._patterns: TopicTrie[str] | None = None
+        self._routes: dict[str, frozenset[ClientConnection]] = {}
 
-    async def connect(self, websocket: WebSocket) -> None:
-        await websocket.accept()
-        self.active_connections.append(websocket)
+    async def connect(
+        self,
+        websocket: WebSocket,
+        subprotocol: str | None = None,
+        topics: Iterable[str] | None = None,
+    ) -> None:
+        await websocket.accept(subprotocol=subprotocol)
+        client = ClientConnection(
+            websocket, self.max_queue, binary=subprotocol is not None, encode=self._encode
+        )
+        client.task = asyncio.create_task(client.run())
+        client.task.add_done_callback(lambda task: self._on_writer_done(websocket, task))
+        self.active_connections[websocket] = client
+        self._add_filters(client, [ALL_TOPICS] if topics is None else topics)
         logger.info(f"WebSocket connected. Active connections: {len(self.active_connections)}")
 
     def disconnect(self, websocket: WebSocket) -> None:
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+        client = self.active_connections.pop(websocket, None)
+        if client is None:
+            return
+        self._remove_filters(client, list(client.filters))
+        self._dropped_by_closed += client.dropped
+        client.close()
         logger.info(f"WebSocket disconnected. Active connections: {len(self.active_connections)}")
 
-    async def broadcast(self, message: dict[str, Any]) -> None:
+    def _add_filters(self, client: ClientConnection, filters: Iterable[str]) -> list[str]:
+        added = [
+            topic_filter for topic_filter in dict.fromkeys(filters)
+            if topic_filter not in client.filters
+        ]
+        for topic_filter in added:
+            client.filters.add(topic_filter)
+            self._subscribers.setdefault(topic_filter, set()).add(client)
+        if added:
+            self._invalidate_routes()
+        return added
+
+    def _remove_filters(self, client: ClientConnection, filters: Iterable[str]) -> None:
+        for topic_filter in filters:
+            if topic_filter not in client.filters:
+                continue
+            client.filters.discard(topic_filter)
+            subscribers = self._subscribers[topic_filter]
+            subscribers.discard(client)
+            if not subscribers:
+                del self._subscribers[topic_filter]
+        self._invalidate_routes()
+
+    def _invalidate_routes(self) -> None:
+        self._patterns = None
+        self._routes.clear()
+
+    def route(self, topic: str) -> frozenset[ClientConnection]:
+        # the clients subscribed to a topic, resolved once per topic until the
+        # subscriptions change
+        clients = self._routes.get(topic)
+        if clients is not None:
+            return clients
+        if self._patterns is None:
+            self._patterns = TopicTrie()
+            for topic_filter in self._subscribers:
+                if topic_filter != ALL_TOPICS:
+                    self._patterns.insert(topic_filter, topic_filter)
+        matched = set(self._subscribers.get(ALL_TOPICS, ()))
+        for topic_filter, _ in self._patterns.match(topic):
+            matched |= self._subscribers[topic_filter]
+        clients = self._routes[topic] = frozenset(matched)
+        return clients
+
+    def subscriptions(self, websocket: WebSocket) -> Callable[[str], bool] | None:
+        # a predicate for the topics a client receives, or None if it receives all of them
+        client = self.active_connections.get(websocket)
+        if client is None or ALL_TOPICS in client.filters:
+            return None
+        return lambda topic: client in self.route(topic)
+
+    def subscribe(self, websocket: WebSocket, filters: Iterable[str]) -> list[str]:
+        # returns the filters the client was not subscribed to yet
+        client = self.active_connections.get(websocket)
+        if client is None:
+            return []
+        return self._add_filters(client, filters)
+
+    def unsubscribe(self, websocket: WebSocket, filters: Iterable[str]) -> list[str]:
+        # filters are removed as given, not subtracted from wider ones: dropping
+        # "home/kitchen/temp" leaves "home/#" in place. Returns the known topics
+        # the client no longer receives
+        client = self.active_connections.get(websocket)
+        if client is None:
+            return []
+        # topic_ids is the store's, which the MQTT thread grows as templates match;
+        # list() copies it in one step under the GIL
+        before = [topic for topic in list(self.topic_ids) if client in self.route(topic)]
+        self._remove_filters(client, filters)
+        return [topic for topic in before if client not in self.route(topic)]
+
+    def _on_writer_done(self, websocket: WebSocket, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception():
+            logger.error(f"Error sending to websocket: {task.exception()}")
+        if websocket in self.active_connections:
+            self.disconnect(websocket)
+
+    def frames_dropped(self) -> int:
+        # queued updates replaced by a newer one for the same key, over all clients ever
+        return self._dropped_by_closed + sum(
+            client.dropped for client in list(self.active_connections.values())
+        )
+
+    def client_lags(self) -> dict[tuple[str], float]:
+        lags = {}
+        for websocket, client in list(self.active_connections.items()):
+            address = getattr(websocket, "client", None)
+            name = f"{address.host}:{address.port}" if address else str(id(websocket))
+            lags[(name,)] = client.lag()
+        return lags
+
+    def _drop_slow_client(self, client: ClientConnection, reason: str) -> None:
+        SLOW_CLIENT_DISCONNECTS.inc()
+        logger.warning(f"Disconnecting slow websocket client: {reason}")
+        self.disconnect(client.websocket)
+        asyncio.create_task(self._close(client.websocket))
+
+    async def _close(self, websocket: WebSocket) -> None:
+        try:
+            await asyncio.wait_for(websocket.close(code=1013), timeout=1.0)
+        except Exception:
+            pass
+
+    async def broadcast(self, message: dict[str, Any], key: str | None = None) -> None:
+        self.publish(message, key)
+
+    def publish(self, message: dict[str, Any], key: str | None = None) -> None:
+        if message.get("type") in SEQUENCED_TYPES:
+            self.seq += 1
+            message = {**message, "seq": self.seq}
+            self._replay.append(message)
         if not self.active_connections:
             return
+        started = time.perf_counter()
+        if message.get("type") == "updates":
+            self._publish_batch(message, key or BATCH_KEY)
+        elif "topic" in message:
+            self._deliver(message, self.route(message["topic"]), key)
+        else:
+            self._deliver(message, list(self.active_connections.values()), key)
+        PUBLISH_SECONDS.observe(time.perf_counter() - started)
 
-        message_json = json.dumps(message)
-        disconnected = []
+    def _publish_batch(self, message: dict[str, Any], key: str) -> None:
+        everyone = self._subscribers.get(ALL_TOPICS, ())
+        if len(everyone) == len(self.active_connections):
+            self._deliver(message, list(everyone), key)
+            return
 
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message_json)
-            except Exception as e:
-                logger.error(f"Error sending to websocket: {e}")
-                disconnected.append(connection)
+        # each client gets the part of the batch it subscribed to; clients whose
+        # parts are identical share one encoding
+        batch = message["data"]
+        selections: dict[ClientConnection, list[str]] = {}
+        for topic in batch:
+            for client in self.route(topic):
+                selections.setdefault(client, []).append(topic)
+        groups: dict[tuple[str, ...], list[ClientConnection]] = {}
+        for client, topics in selections.items():
+            groups.setdefault(tuple(topics), []).append(client)
+        for topics, clients in groups.items():
+            if len(topics) == len(batch):
+                self._deliver(message, clients, key)
+            else:
+                selected = {topic: batch[topic] for topic in topics}
+                self._deliver({**message, "data": selected}, clients, key)
 
-        for conn in disconnected:
-            self.disconnect(conn)
+    def _encode(self, message: dict[str, Any], binary: bool) -> list[str | bytes]:
+        if not binary:
+            return [json.dumps(message)]
+        frame, fallback = encode_binary(message, self.topic_ids)
+        frames: list[str | bytes] = [frame] if frame else []
+        if fallback is not None:
+            frames.append(json.dumps(fallback))
+        return frames
 
-    async def send_personal(self, websocket: WebSocket, message: dict[str, Any]) -> None:
+    def _deliver(
+        self, message: dict[str, Any], clients: Iterable[ClientConnection], key: str | None = None
+    ) -> None:
+        # encode at most once per protocol, however many clients share it
+        json_frames: list[str | bytes] | None = None
+        binary_frames: list[str | bytes] | None = None
+
+        for client in clients:
+            if client.binary:
+                if binary_frames is None:
+                    binary_frames = self._encode(message, binary=True)
+                frames = binary_frames
+            else:
+                if json_frames is None:
+                    json_frames = self._encode(message, binary=False)
+                frames = json_frames
+
+            if not client.enqueue_message(message, frames, key):
+                self._drop_slow_client(client, f"outbound queue full ({client.max_queue})")
+            elif client.lag() > self.max_lag:
+                self._drop_slow_client(client, f"lagging {client.lag():.1f}s behind")
+
+    def _select(self, message: dict[str, Any], client: ClientConnection) -> dict[str, Any] | None:
+        # the part of a sequenced message a client is subscribed to, if any
+        if ALL_TOPICS in client.filters:
+            return message
+        if message["type"] == "updates":
+            data = {
+                topic: update for topic, update in message["data"].items()
+                if client in self.route(topic)
+            }
+            return {**message, "data": data} if data else None
+        return message if client in self.route(message["topic"]) else None
+
+    def resume(self, websocket: WebSocket, token: str) -> bool:
+        # token is "<epoch>:<last seen seq>". Queues every later message the client
+        # is subscribed to and returns True, or returns False when the client needs
+        # a full snapshot: another epoch, or messages it missed were already evicted
+        client = self.active_connections.get(websocket)
+        if client is None:
+            return False
+        epoch, _, last = token.partition(":")
         try:
-            await websocket.send_text(json.dumps(message))
-        except Exception as e:
-            logger.error(f"Error sending personal message: {e}")
+            last = int(last)
+        except ValueError:
+            last = -1
+        missed = self.seq - last
+        if epoch != self.epoch or last < 0 or missed < 0 or missed > len(self._replay):
+            RESUMES_SNAPSHOT.inc()
+            return False
 
+        replayed = 0
+        for message in list(self._replay)[len(self._replay) - missed:]:
+            selected = self._select(message, client)
+            if selected is not None:
+                client.enqueue(*self._encode(selected, client.binary), force=True)
+                replayed += 1
+        resumed = {"type": "resumed", "epoch": self.epoch, "seq": self.seq}
+        client.enqueue(json.dumps(resumed), force=True)
+        RESUMES_REPLAYED.inc()
+        logger.info(f"WebSocket resumed from {last}, replayed {replayed} of {missed} messages")
+        return True
+
+    async def wait_drained(self, websocket: WebSocket) -> bool:
+        # waits until everything queued for the client has been written; False if
+        # the client disconnected instead
+        client = self.active_connections.get(websocket)
+        if client is None:
+            return False
+        await client.drained()
+        return websocket in self.active_connections
+
+    async def send_personal(self, websocket: WebSocket, message: dict[str, Any]) -> None:
+        await self.send_personal_text(websocket, json.dumps(message))
+
+    async def send_personal_text(self, websocket: WebSocket, message_json: str) -> None:
+        client = self.active_connections.get(websocket)
+        if client is None:
+            logger.error("Error sending personal message: websocket is not connected")
+            return
+        client.enqueue(message_json, force=True)
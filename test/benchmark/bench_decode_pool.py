@@ -0,0 +1,106 @@
+"""Inline JSON decoding vs the worker-process decode pool, by payload size.
+
+    python -m test.benchmark.bench_decode_pool --workers 4 --messages 20000
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+
+from ha_broker_dashboard.decode_pool import DecodePool
+from ha_broker_dashboard.payloads import PayloadDecoder, PayloadFormat
+
+SIZES = [64, 256, 1024, 4096, 16384, 65536]
+FORMATS = [PayloadFormat("zigbee/+", value_path="state")]
+
+
+def make_payload(size: int, n: int) -> bytes:
+    # Zigbee2MQTT-style state: the value plus a pile of attributes
+    state = {"state": n, "linkquality": 120, "battery": 87, "attributes": {}}
+    length = len(json.dumps(state))
+    index = 0
+    while length < size:
+        key, value = f"attribute_{index}", {"value": index * 0.5, "unit": "lx"}
+        state["attributes"][key] = value
+        length += len(json.dumps({key: value})) + 2
+        index += 1
+    return json.dumps(state).encode()
+
+
+def topics_and_payloads(size: int, messages: int) -> list[tuple[str, bytes]]:
+    payloads = [make_payload(size, n) for n in range(16)]
+    return [(f"zigbee/{n % 64}", payloads[n % 16]) for n in range(messages)]
+
+
+def run_inline(messages: list[tuple[str, bytes]]) -> float:
+    decoder = PayloadDecoder(FORMATS)
+    started = time.perf_counter()
+    for topic, payload in messages:
+        decoder.decode(topic, payload)
+    return time.perf_counter() - started
+
+
+class Completion:
+    # signals once the pool has delivered a given number of results
+
+    def __init__(self, pool: DecodePool):
+        self.pool = pool
+        self.target = 0
+        self.done = threading.Event()
+
+    def on_result(self, topic, value) -> None:
+        if self.pool.completed >= self.target:
+            self.done.set()
+
+    def run(self, messages: list[tuple[str, bytes]]) -> tuple[float, float]:
+        # (seconds the submitting thread was busy, seconds until every value was delivered)
+        self.done.clear()
+        self.target = self.pool.completed + len(messages)
+        started = time.perf_counter()
+        for topic, payload in messages:
+            self.pool.submit(topic, payload)
+        submitted = time.perf_counter()
+        self.done.wait()
+        return submitted - started, time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--messages", type=int, default=20_000)
+    args = parser.parse_args()
+
+    pool = DecodePool(args.workers, FORMATS, lambda topic, value: None, min_bytes=0, ring_bytes=1 << 24)
+    completion = Completion(pool)
+    pool.on_result = completion.on_result
+    pool.start()
+    print(f"{os.cpu_count()} CPUs, {args.workers} workers, {args.messages} messages per size")
+    crossover = None
+    try:
+        completion.run(topics_and_payloads(64, 1000))  # warm up the workers
+        for size in SIZES:
+            messages = topics_and_payloads(size, args.messages)
+            inline = run_inline(messages)
+            submit, total = completion.run(messages)
+            inline_rate = len(messages) / inline
+            pool_rate = len(messages) / total
+            if crossover is None and pool_rate > inline_rate:
+                crossover = size
+            print(
+                f"{size:>6} B: inline {inline_rate:9.0f} msg/s  "
+                f"pool {pool_rate:9.0f} msg/s  "
+                f"MQTT thread busy {submit / inline:6.1%} of inline"
+            )
+    finally:
+        pool.stop()
+
+    if crossover is None:
+        print("the pool never beat inline decoding at these sizes")
+    else:
+        print(f"crossover: the pool wins from ~{crossover} B payloads; set decode_min_bytes near it")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""MQTT -> WebSocket latency and throughput through a locally booted Dashboard.
+
+Everything runs offline in this process: the broker stand-in from test.broker, the
+Dashboard on an ephemeral port, a TestRunner publisher and a WebSocket client.
+Each payload is its publish time, so the client measures publish-to-receive latency.
+
+    python -m test.benchmark.bench_end_to_end --topics 50 --rate 2000 --duration 10
+"""
+
+import argparse
+import json
+import logging
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import yaml
+from websockets.exceptions import ConnectionClosed
+from websockets.sync.client import connect
+
+from ha_broker_dashboard.main import Dashboard
+from test.broker import LocalBroker
+from test.remote.test_runner import TestRunner
+
+
+@dataclass
+class Result:
+    sent: int
+    received: int
+    elapsed: float
+    latencies: list[float] = field(repr=False)
+    connection_stats: list[dict] = field(default_factory=list, repr=False)
+
+    @property
+    def rate(self) -> float:
+        return self.received / self.elapsed if self.elapsed else 0.0
+
+    def percentile(self, q: float) -> float:
+        ordered = sorted(self.latencies)
+        if not ordered:
+            return float("nan")
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def summary(self) -> str:
+        return (
+            f"sent {self.sent}  received {self.received}  {self.rate:.0f} msg/s  "
+            f"latency p50 {self.percentile(0.5) * 1000:.2f} ms  "
+            f"p99 {self.percentile(0.99) * 1000:.2f} ms  "
+            f"p999 {self.percentile(0.999) * 1000:.2f} ms"
+        )
+
+
+class WebSocketProbe:
+    # a dashboard client that records how long each published value took to arrive
+
+    def __init__(self, url: str):
+        self.url = url
+        self.latencies: list[float] = []
+        self.ready = threading.Event()
+        self._websocket = None
+        self._thread = threading.Thread(target=self._run, name="ws-probe", daemon=True)
+
+    def start(self, timeout: float = 10.0) -> None:
+        self._thread.start()
+        if not self.ready.wait(timeout):
+            raise RuntimeError(f"could not connect to {self.url}")
+
+    def close(self) -> None:
+        if self._websocket:
+            self._websocket.close()
+        self._thread.join()
+
+    def _run(self) -> None:
+        with connect(self.url) as websocket:
+            self._websocket = websocket
+            self.ready.set()
+            try:
+                for frame in websocket:
+                    self._record(json.loads(frame), time.time())
+            except ConnectionClosed:
+                pass
+
+    def _record(self, message: dict, received_at: float) -> None:
+        if message["type"] == "update":
+            deltas = [message["data"]]
+        elif message["type"] == "updates":
+            deltas = list(message["data"].values())
+        else:
+            return
+        for delta in deltas:
+            # coalesced graph deltas carry every point, so count those
+            points = delta.get("points") or [{"value": delta["current_value"]}]
+            self.latencies.extend(received_at - point["value"] for point in points)
+
+
+def write_config(directory: Path, broker: LocalBroker, topics: list[str], **options) -> Path:
+    config = {
+        "mqtt": {
+            "host": broker.host,
+            "port": broker.port,
+            "mode": options.get("mode", "thread"),
+            "connections": options.get("connections", 1),
+        },
+        "server": {"host": "127.0.0.1", "port": 0, "coalesce_ms": options.get("coalesce_ms", 0)},
+        "sensors": [
+            {
+                "topic": topic,
+                "type": "benchmark",
+                "name": topic,
+                "implementation": options.get("implementation", "graph"),
+                "history": 100,
+                "payload": "numeric",
+            }
+            for topic in topics
+        ],
+    }
+    path = directory / "config.yaml"
+    path.write_text(yaml.safe_dump(config))
+    return path
+
+
+def wait_for(condition, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def run_benchmark(
+    topics: int = 10,
+    rate: float = 1000.0,
+    duration: float = 5.0,
+    drain_timeout: float = 10.0,
+    **options,
+) -> Result:
+    # options: mode, connections, implementation, coalesce_ms (see write_config)
+    topic_names = [f"bench/sensor_{n}/value" for n in range(topics)]
+    with LocalBroker() as broker, tempfile.TemporaryDirectory() as directory:
+        dashboard = Dashboard(str(write_config(Path(directory), broker, topic_names, **options)))
+        server = threading.Thread(target=dashboard.run, name="dashboard", daemon=True)
+        server.start()
+        probe = None
+        runner = TestRunner(
+            topic_names,
+            message=time.time,
+            interval_ms=topics * 1000.0 / rate,
+            host=broker.host,
+            port=broker.port,
+            username="",
+            password="",
+        )
+        try:
+            if not wait_for(
+                lambda: dashboard.port is not None and broker.subscription_count() >= topics, 10.0
+            ):
+                raise RuntimeError("dashboard did not start")
+            probe = WebSocketProbe(f"ws://127.0.0.1:{dashboard.port}/ws")
+            probe.start()
+            runner.connect()
+
+            started = time.monotonic()
+            sent = runner.publish_paced(duration=duration)
+            wait_for(lambda: len(probe.latencies) >= sent, drain_timeout)
+            elapsed = time.monotonic() - started
+            stats = dashboard.mqtt_client.stats() if dashboard.mqtt_client else []
+        finally:
+            runner.disconnect()
+            if probe:
+                probe.close()
+            dashboard.stop()
+            server.join()
+
+    return Result(sent, len(probe.latencies), elapsed, probe.latencies, stats)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--topics", type=int, default=10)
+    parser.add_argument("--rate", type=float, default=1000.0, help="messages per second, all topics")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--mode", choices=["thread", "asyncio"], default="thread")
+    parser.add_argument("--connections", type=int, default=1)
+    parser.add_argument("--implementation", choices=["graph", "gauge", "text"], default="graph")
+    parser.add_argument("--coalesce-ms", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    result = run_benchmark(
+        topics=args.topics,
+        rate=args.rate,
+        duration=args.duration,
+        mode=args.mode,
+        connections=args.connections,
+        implementation=args.implementation,
+        coalesce_ms=args.coalesce_ms,
+    )
+    print(
+        f"{args.topics} topics @ {args.rate:.0f} msg/s for {args.duration:.0f}s "
+        f"({args.mode} mode, {args.connections} connection(s), {args.implementation})"
+    )
+    print(result.summary())
+    for stats in result.connection_stats:
+        print(f"  connection {stats['connection']}: {stats['messages']} messages over {stats['topics']} topics")
+
+
+if __name__ == "__main__":
+    main()
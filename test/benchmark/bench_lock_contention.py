@@ -0,0 +1,98 @@
+"""Ingest latency under concurrent /api/sensors-style polling.
+
+Compares the per-sensor locking DataStore against the previous design, where
+one global lock was held while every sensor was serialized.
+
+    python -m test.benchmark.bench_lock_contention --sensors 200 --history 2000
+"""
+
+import argparse
+import threading
+import time
+from threading import Lock
+
+from ha_broker_dashboard.data_store import DataStore
+
+
+class GlobalLockDataStore(DataStore):
+    # the pre-striping behaviour: writers and readers share one lock and
+    # readers build every sensor dict while holding it
+
+    def __init__(self):
+        super().__init__(rollup_tiers=())
+        self._global_lock = Lock()
+
+    def update_sensor(self, topic, value):
+        with self._global_lock:
+            return super().update_sensor(topic, value)
+
+    def get_all_sensors(self):
+        with self._global_lock:
+            return {topic: sensor.to_dict() for topic, sensor in self._sensors.items()}
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def run(store: DataStore, sensors: int, history: int, duration: float, readers: int) -> dict:
+    topics = [f"bench/{i}/value" for i in range(sensors)]
+    for topic in topics:
+        store.register_sensor(topic, topic, "temperature", "graph", history_size=history)
+        for n in range(history):
+            store.update_sensor(topic, float(n))
+
+    stop = threading.Event()
+    polls = [0] * readers
+
+    def poll(index: int) -> None:
+        while not stop.is_set():
+            store.get_all_sensors()
+            polls[index] += 1
+
+    threads = [threading.Thread(target=poll, args=(i,)) for i in range(readers)]
+    for thread in threads:
+        thread.start()
+
+    latencies = []
+    deadline = time.perf_counter() + duration
+    n = 0
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        store.update_sensor(topics[n % sensors], float(n))
+        latencies.append(time.perf_counter() - started)
+        n += 1
+
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    return {
+        "updates/s": n / duration,
+        "polls/s": sum(polls) / duration,
+        "p50 us": percentile(latencies, 0.50) * 1e6,
+        "p99 us": percentile(latencies, 0.99) * 1e6,
+        "max ms": max(latencies) * 1e3,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sensors", type=int, default=200)
+    parser.add_argument("--history", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--readers", type=int, default=2)
+    args = parser.parse_args()
+
+    stores = {
+        "global lock": GlobalLockDataStore(),
+        "per-sensor locks": DataStore(rollup_tiers=()),
+    }
+    for label, store in stores.items():
+        result = run(store, args.sensors, args.history, args.duration, args.readers)
+        print(f"{label:>18}: " + "  ".join(f"{key} {value:,.1f}" for key, value in result.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Per-payload parse cost: the "auto" JSON-first guess vs declared payload formats.
+
+    python -m test.benchmark.bench_payload_parsing --messages 200000
+"""
+
+import argparse
+import time
+
+from ha_broker_dashboard.payloads import PayloadFormat, build_parser
+
+CASES = {
+    "numeric 21.5": (b"21.5", PayloadFormat("t", "numeric")),
+    "string open": (b"open", PayloadFormat("t", "string")),
+    "boolean ON": (b"ON", PayloadFormat("t", "boolean", true_value="on", false_value="off")),
+    "json state": (
+        b'{"state": 21.5, "attributes": {"unit_of_measurement": "C", "friendly_name": "Living room"}}',
+        PayloadFormat("t", "json", value_path="state"),
+    ),
+}
+
+
+def time_per_payload(parse, payload: bytes, messages: int) -> float:
+    started = time.perf_counter()
+    for _ in range(messages):
+        parse(payload)
+    return (time.perf_counter() - started) / messages * 1e9
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200_000)
+    args = parser.parse_args()
+
+    for label, (payload, spec) in CASES.items():
+        # auto cannot extract a nested value on its own; give it the same value path
+        auto = build_parser(PayloadFormat("t", value_path=spec.value_path))
+        declared = build_parser(spec)
+        auto_ns = time_per_payload(auto, payload, args.messages)
+        declared_ns = time_per_payload(declared, payload, args.messages)
+        print(
+            f"{label:>13}: auto {auto_ns:6.0f} ns  declared {declared_ns:6.0f} ns  "
+            f"({auto_ns / declared_ns:.2f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
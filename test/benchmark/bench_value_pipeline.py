@@ -0,0 +1,94 @@
+"""Per-message cost of DataStore.update_sensor: compiled pipeline vs the old path.
+
+    python -m test.benchmark.bench_value_pipeline --messages 200000
+"""
+
+import argparse
+import time
+from datetime import datetime
+
+from ha_broker_dashboard.conversions import convert_value, truncate_to_precision
+from ha_broker_dashboard.data_store import ROLLUP_IMPLEMENTATIONS, DataStore, SensorData
+
+
+def legacy_apply(store: DataStore, sensor: SensorData, value) -> None:
+    # DataStore.update_sensor's body before per-sensor pipelines were compiled
+    old_value = sensor.current_value
+    converted_value = value
+    if sensor.input_unit and sensor.unit and sensor.input_unit != sensor.unit:
+        try:
+            numeric_value = float(value)
+            converted_value = convert_value(numeric_value, sensor.input_unit, sensor.unit)
+        except (ValueError, TypeError):
+            pass
+
+    if sensor.precision is not None:
+        try:
+            numeric_value = float(converted_value)
+            converted_value = truncate_to_precision(numeric_value, sensor.precision)
+        except (ValueError, TypeError):
+            pass
+
+    sensor.current_value = converted_value
+    sensor.version = store._next_version()
+    sensor.last_updated = datetime.now()
+    if sensor.implementation in ROLLUP_IMPLEMENTATIONS:
+        try:
+            numeric_value = float(converted_value)
+        except (ValueError, TypeError):
+            pass
+        else:
+            timestamp = sensor.last_updated.timestamp()
+            if sensor.rollups is not None:
+                sensor.rollups.add(timestamp, numeric_value)
+            if sensor.implementation == "graph":
+                sensor.history.append(numeric_value, timestamp)
+    elif sensor.implementation == "boolean":
+        if old_value != converted_value:
+            sensor.last_switched = sensor.last_updated
+
+
+CASES = {
+    "graph C->F 0.01": dict(implementation="graph", input_unit="C", unit="F", precision=0.01),
+    "graph plain": dict(implementation="graph"),
+    "gauge 0.1": dict(implementation="gauge", precision=0.1),
+    "text": dict(implementation="text"),
+    "boolean": dict(implementation="boolean"),
+}
+
+
+def time_per_message(apply, values: list) -> float:
+    started = time.perf_counter()
+    for value in values:
+        apply(value)
+    return (time.perf_counter() - started) / len(values) * 1e9
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200_000)
+    args = parser.parse_args()
+
+    for label, options in CASES.items():
+        implementation = options.pop("implementation")
+        store = DataStore()
+        store.register_sensor("compiled", label, "bench", implementation, 1000, **options)
+        store.register_sensor("legacy", label, "bench", implementation, 1000, **options)
+        compiled = store.get_sensor("compiled")
+        legacy = store.get_sensor("legacy")
+        values = (
+            ["open", "closed"] * (args.messages // 2)
+            if implementation in ("boolean", "text")
+            else [20.0 + (n % 100) / 7 for n in range(args.messages)]
+        )
+
+        legacy_ns = time_per_message(lambda value: legacy_apply(store, legacy, value), values)
+        compiled_ns = time_per_message(compiled.apply, values)
+        print(
+            f"{label:>16}: legacy {legacy_ns:7.0f} ns/msg  compiled {compiled_ns:7.0f} ns/msg  "
+            f"({legacy_ns / compiled_ns:.2f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
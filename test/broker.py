@@ -0,0 +1,244 @@
+"""Minimal in-process MQTT broker stand-in for tests and benchmarks.
+
+Speaks enough of MQTT 3.1.1 and 5 for paho clients: CONNECT, PUBLISH (QoS 0
+and 1), SUBSCRIBE/UNSUBSCRIBE with wildcards and $share groups, PINGREQ and
+DISCONNECT. Messages are delivered at QoS 0 and nothing is retained.
+"""
+
+import asyncio
+import itertools
+import logging
+import threading
+
+from paho.mqtt.client import topic_matches_sub
+
+logger = logging.getLogger(__name__)
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+
+def encode_length(length: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        encoded.append(byte | (0x80 if length else 0))
+        if not length:
+            return bytes(encoded)
+
+
+def encode_string(value: str) -> bytes:
+    data = value.encode()
+    return len(data).to_bytes(2, "big") + data
+
+
+def packet(packet_type: int, flags: int, body: bytes) -> bytes:
+    return bytes([packet_type << 4 | flags]) + encode_length(len(body)) + body
+
+
+class _Reader:
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.offset = 0
+
+    def byte(self) -> int:
+        self.offset += 1
+        return self.data[self.offset - 1]
+
+    def uint16(self) -> int:
+        self.offset += 2
+        return int.from_bytes(self.data[self.offset - 2:self.offset], "big")
+
+    def varint(self) -> int:
+        value, shift = 0, 0
+        while True:
+            byte = self.byte()
+            value |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                return value
+
+    def string(self) -> str:
+        length = self.uint16()
+        self.offset += length
+        return self.data[self.offset - length:self.offset].decode()
+
+    def skip_properties(self) -> None:
+        length = self.varint()
+        self.offset += length
+
+    def rest(self) -> bytes:
+        return self.data[self.offset:]
+
+
+class _Session:
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.version = 4
+        self.client_id = ""
+        # filter -> share group (None for an ordinary subscription)
+        self.subscriptions: dict[str, str | None] = {}
+
+    @property
+    def v5(self) -> bool:
+        return self.version == 5
+
+    def send(self, data: bytes) -> None:
+        if not self.writer.is_closing():
+            self.writer.write(data)
+
+
+class LocalBroker:
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.sessions: set[_Session] = set()
+        self.published = 0
+        self.delivered = 0
+        self._round_robin: dict[tuple[str, str], itertools.count] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._server: asyncio.Server | None = None
+        self._thread: threading.Thread | None = None
+        self._ready = threading.Event()
+
+    def __enter__(self) -> "LocalBroker":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="local-broker", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def stop(self) -> None:
+        if self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop = None
+
+    def subscription_count(self) -> int:
+        return sum(len(session.subscriptions) for session in list(self.sessions))
+
+    def _run(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        self._server = self._loop.run_until_complete(
+            asyncio.start_server(self._handle, self.host, self.port)
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._server.close()
+            for session in self.sessions:
+                session.writer.close()
+            self._loop.run_until_complete(asyncio.sleep(0))
+            self._loop.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        session = _Session(writer)
+        self.sessions.add(session)
+        try:
+            while True:
+                header = await reader.readexactly(1)
+                length, shift = 0, 0
+                while True:
+                    byte = (await reader.readexactly(1))[0]
+                    length |= (byte & 0x7F) << shift
+                    shift += 7
+                    if not byte & 0x80:
+                        break
+                body = await reader.readexactly(length) if length else b""
+                if not self._dispatch(session, header[0] >> 4, header[0] & 0x0F, body):
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.sessions.discard(session)
+            writer.close()
+
+    def _dispatch(self, session: _Session, packet_type: int, flags: int, body: bytes) -> bool:
+        data = _Reader(body)
+        if packet_type == CONNECT:
+            data.string()
+            session.version = data.byte()
+            data.byte()
+            data.uint16()
+            if session.v5:
+                data.skip_properties()
+            session.client_id = data.string()
+            connack = b"\x00\x00" + (b"\x00" if session.v5 else b"")
+            session.send(packet(CONNACK, 0, connack))
+        elif packet_type == PUBLISH:
+            topic = data.string()
+            qos = (flags >> 1) & 0x03
+            packet_id = data.uint16() if qos else None
+            if session.v5:
+                data.skip_properties()
+            if packet_id is not None:
+                session.send(packet(PUBACK, 0, packet_id.to_bytes(2, "big")))
+            self._route(topic, data.rest())
+        elif packet_type == SUBSCRIBE:
+            packet_id = data.uint16()
+            if session.v5:
+                data.skip_properties()
+            granted = bytearray()
+            while data.offset < len(body):
+                topic_filter = data.string()
+                data.byte()
+                group = None
+                if topic_filter.startswith("$share/"):
+                    _, group, topic_filter = topic_filter.split("/", 2)
+                session.subscriptions[topic_filter] = group
+                granted.append(0)
+            props = b"\x00" if session.v5 else b""
+            session.send(packet(SUBACK, 0, packet_id.to_bytes(2, "big") + props + bytes(granted)))
+        elif packet_type == UNSUBSCRIBE:
+            packet_id = data.uint16()
+            if session.v5:
+                data.skip_properties()
+            count = 0
+            while data.offset < len(body):
+                topic_filter = data.string()
+                if topic_filter.startswith("$share/"):
+                    topic_filter = topic_filter.split("/", 2)[2]
+                session.subscriptions.pop(topic_filter, None)
+                count += 1
+            reasons = b"\x00" + bytes(count) if session.v5 else b""
+            session.send(packet(UNSUBACK, 0, packet_id.to_bytes(2, "big") + reasons))
+        elif packet_type == PINGREQ:
+            session.send(packet(PINGRESP, 0, b""))
+        elif packet_type == DISCONNECT:
+            return False
+        return True
+
+    def _route(self, topic: str, payload: bytes) -> None:
+        self.published += 1
+        recipients: set[_Session] = set()
+        groups: dict[tuple[str, str], list[_Session]] = {}
+        for session in list(self.sessions):
+            for topic_filter, group in session.subscriptions.items():
+                if not topic_matches_sub(topic_filter, topic):
+                    continue
+                if group is None:
+                    recipients.add(session)
+                else:
+                    groups.setdefault((group, topic_filter), []).append(session)
+
+        for key, members in groups.items():
+            turn = next(self._round_robin.setdefault(key, itertools.count()))
+            recipients.add(members[turn % len(members)])
+
+        for session in recipients:
+            props = b"\x00" if session.v5 else b""
+            session.send(packet(PUBLISH, 0, encode_string(topic) + props + payload))
+            self.delivered += 1
@@ -1,5 +1,6 @@
 import json
 import logging
+import os
 import random
 import time
 from typing import Any, Callable
@@ -14,22 +15,30 @@ logger = logging.getLogger(__name__)
 
 
 class TestRunner:
+    # publishes `message` to one or more topics, each topic every interval_ms.
+    # Sends are paced against a monotonic schedule rather than sleeping between
+    # them, so the rate holds even when publishing itself takes time. The broker
+    # defaults come from MQTT_HOST / MQTT_PORT / MQTT_USERNAME / MQTT_PASSWORD
 
     def __init__(
         self,
-        topic: str,
+        topic: str | list[str],
         message: Any | Callable[[], Any],
-        interval_ms: int = 1000,
-        host: str = "192.168.4.20",
-        port: int = 1883,
-        username: str = "admin",
-        password: str = "password",
+        interval_ms: float = 1000,
+        host: str | None = None,
+        port: int | None = None,
+        username: str | None = None,
+        password: str | None = None,
+        qos: int = 0,
     ):
-        self.topic = topic
+        self.topics = [topic] if isinstance(topic, str) else list(topic)
         self.message = message
         self.interval_ms = interval_ms
-        self.host = host
-        self.port = port
+        self.host = host or os.environ.get("MQTT_HOST", "localhost")
+        self.port = port or int(os.environ.get("MQTT_PORT", "1883"))
+        self.qos = qos
+        username = os.environ.get("MQTT_USERNAME", "admin") if username is None else username
+        password = os.environ.get("MQTT_PASSWORD", "password") if password is None else password
 
         self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
         self.client.on_connect = self._on_connect
@@ -39,6 +48,16 @@ class TestRunner:
             self.client.username_pw_set(username, password)
 
         self._running = False
+        self.sent = 0
+
+    @property
+    def topic(self) -> str:
+        return self.topics[0]
+
+    @property
+    def rate(self) -> float:
+        # messages per second across all topics
+        return len(self.topics) * 1000.0 / self.interval_ms
 
     def _on_connect(self, client, userdata, flags, reason_code, properties):
         # all the unused parameters are required by the callback signature :(, will silent fail otherwise
@@ -73,34 +92,48 @@ class TestRunner:
             raise
 
     def disconnect(self) -> None:
-        self.client.loop_stop()
         self.client.disconnect()
+        self.client.loop_stop()
         logger.info("Disconnected from MQTT broker")
 
-    def publish_once(self) -> None:
+    def publish_once(self, topic: str | None = None) -> None:
+        topic = topic or self.topic
         payload = self._format_message()
-        result = self.client.publish(self.topic, payload)
+        result = self.client.publish(topic, payload, qos=self.qos)
         if result.rc == mqtt.MQTT_ERR_SUCCESS:
-            logger.info(f"Published to {self.topic}: {payload}")
+            self.sent += 1
+            logger.debug(f"Published to {topic}: {payload}")
         else:
-            logger.error(f"Failed to publish to {self.topic}: {result.rc}")
+            logger.error(f"Failed to publish to {topic}: {result.rc}")
 
-    def run(self, count: int | None = None) -> None:
-        self.connect()
+    def publish_paced(self, count: int | None = None, duration: float | None = None) -> int:
+        # publishes round-robin over the topics at `rate` until count messages have
+        # been sent, duration seconds have passed or stop() is called
         self._running = True
-        interval_sec = self.interval_ms / 1000.0
-
+        started = time.monotonic()
+        rate = self.rate
+        sent = 0
+        while self._running:
+            now = time.monotonic()
+            if duration is not None and now - started >= duration:
+                break
+            # catch up on every send that is due; a late loop never lowers the rate
+            due = int((now - started) * rate) + 1
+            if count is not None:
+                due = min(due, count)
+            while sent < due:
+                self.publish_once(self.topics[sent % len(self.topics)])
+                sent += 1
+            if count is not None and sent >= count:
+                break
+            time.sleep(max(0.0, started + sent / rate - time.monotonic()))
+        return sent
+
+    def run(self, count: int | None = None, duration: float | None = None) -> None:
+        self.connect()
         try:
-            messages_sent = 0
-            while self._running:
-                self.publish_once()
-                messages_sent += 1
-
-                if count is not None and messages_sent >= count:
-                    logger.info(f"Sent {messages_sent} messages, stopping...")
-                    break
-
-                time.sleep(interval_sec)
+            messages_sent = self.publish_paced(count=count, duration=duration)
+            logger.info(f"Sent {messages_sent} messages, stopping...")
         except KeyboardInterrupt:
             logger.info("Interrupted by user")
         finally:
@@ -0,0 +1,64 @@
+import asyncio
+
+from ha_broker_dashboard.coalescer import UpdateCoalescer, merge_update
+
+
+class RecordingManager:
+    def __init__(self):
+        self.published: list[dict] = []
+
+    def publish(self, message, key=None):
+        self.published.append(message)
+
+
+class TestMergeUpdate:
+    def test_later_fields_win_and_points_accumulate(self):
+        pending = {"current_value": 1, "points": [{"value": 1}]}
+        merge_update(pending, {"current_value": 2, "points": [{"value": 2}]})
+        assert pending == {"current_value": 2, "points": [{"value": 1}, {"value": 2}]}
+
+    def test_update_without_points_keeps_pending_points(self):
+        pending = {"current_value": 1, "points": [{"value": 1}]}
+        merge_update(pending, {"current_value": "n/a"})
+        assert pending["points"] == [{"value": 1}]
+
+
+class TestUpdateCoalescer:
+    def test_zero_interval_sends_immediately(self):
+        async def scenario():
+            manager = RecordingManager()
+            coalescer = UpdateCoalescer(manager)
+            coalescer.submit("a", {"current_value": 1})
+            assert manager.published == [
+                {"type": "update", "topic": "a", "data": {"current_value": 1}}
+            ]
+
+        asyncio.run(scenario())
+
+    def test_updates_within_window_are_batched(self):
+        async def scenario():
+            manager = RecordingManager()
+            coalescer = UpdateCoalescer(manager, default_interval=0.02)
+            for n in range(5):
+                coalescer.submit("a", {"current_value": n, "points": [{"value": n}]})
+            coalescer.submit("b", {"current_value": "x"})
+            assert manager.published == []
+
+            await asyncio.sleep(0.05)
+            assert len(manager.published) == 1
+            frame = manager.published[0]
+            assert frame["type"] == "updates"
+            assert frame["data"]["a"]["current_value"] == 4
+            assert [p["value"] for p in frame["data"]["a"]["points"]] == [0, 1, 2, 3, 4]
+            assert frame["data"]["b"] == {"current_value": "x"}
+
+        asyncio.run(scenario())
+
+    def test_per_topic_interval_overrides_default(self):
+        async def scenario():
+            manager = RecordingManager()
+            coalescer = UpdateCoalescer(manager, default_interval=0.02, intervals={"fast": 0})
+            coalescer.submit("fast", {"current_value": 1})
+            assert manager.published[0]["type"] == "update"
+
+        asyncio.run(scenario())
@@ -1,13 +1,21 @@
+import math
+import random
+from array import array
+
 import pytest
 
+from ha_broker_dashboard import conversions
 from ha_broker_dashboard.conversions import (
     celsius_to_fahrenheit,
+    compile_conversion,
     convert_value,
+    convert_values,
     fahrenheit_to_celsius,
     feet_to_meters,
     has_conversion,
     meters_to_feet,
     truncate_to_precision,
+    truncate_values,
 )
 
 
@@ -133,3 +141,94 @@ class TestHasConversion:
     def test_unknown_conversion_returns_false(self):
         assert has_conversion("foo", "bar") is False
 
+
+def reference_conversion(value, input_unit, output_unit, precision):
+    # the per-message path DataStore.update_sensor used before conversions were compiled
+    converted = value
+    if input_unit and output_unit and input_unit != output_unit:
+        try:
+            converted = convert_value(float(value), input_unit, output_unit)
+        except (ValueError, TypeError):
+            pass
+    if precision is not None:
+        try:
+            converted = truncate_to_precision(float(converted), precision)
+        except (ValueError, TypeError):
+            pass
+    return converted
+
+
+class TestCompileConversion:
+    @pytest.mark.parametrize("input_unit, output_unit", [
+        (None, None), ("C", "F"), ("°F", "°C"), ("m", "m"), ("foo", "bar"), ("m", None),
+    ])
+    @pytest.mark.parametrize("precision", [None, 0.01, 0.5, 0, -1])
+    @pytest.mark.parametrize("value", [19.343, -19.343, 0, 21, "21.5", True, "open", None, [1]])
+    def test_matches_reference(self, value, input_unit, output_unit, precision):
+        compiled = compile_conversion(input_unit, output_unit, precision)
+        expected = reference_conversion(value, input_unit, output_unit, precision)
+        result = compiled(value)
+        assert result == expected
+        assert type(result) is type(expected)
+
+
+@pytest.fixture(params=["numpy", "python"])
+def batch_backend(request, monkeypatch):
+    if request.param == "numpy":
+        if conversions.np is None:
+            pytest.skip("numpy is not installed")
+    else:
+        monkeypatch.setattr(conversions, "np", None)
+    return request.param
+
+
+SAMPLES = [19.343, -19.343, 0.0, -0.0, 1e-9, 123456.789, float("nan"), float("inf"), float("-inf")] + [
+    random.Random(seed).uniform(-1000, 1000) for seed in range(200)
+]
+
+
+def same_values(actual, expected):
+    return len(actual) == len(expected) and all(
+        a == e or (math.isnan(a) and math.isnan(e)) for a, e in zip(actual, expected)
+    )
+
+
+def outcome(func):
+    try:
+        return func()
+    except (ValueError, OverflowError) as exc:
+        return type(exc)
+
+
+class TestBatchConversions:
+    @pytest.mark.parametrize("input_unit, output_unit", [
+        ("°C", "°F"), ("F", "C"), ("m", "ft"), ("ft", "m"), ("C", "C"), ("foo", "bar"), (None, "F"),
+    ])
+    def test_convert_values_matches_scalar(self, batch_backend, input_unit, output_unit):
+        result = convert_values(array("d", SAMPLES), input_unit, output_unit)
+        assert isinstance(result, array)
+        assert same_values(list(result), [convert_value(v, input_unit, output_unit) for v in SAMPLES])
+
+    @pytest.mark.parametrize("precision", [0.01, 0.1, 0.5, 1, 0, -0.01])
+    def test_truncate_values_matches_scalar(self, batch_backend, precision):
+        # nan and inf make the scalar function raise, and every backend must raise the same
+        expected = outcome(lambda: [truncate_to_precision(v, precision) for v in SAMPLES])
+        actual = outcome(lambda: list(truncate_values(array("d", SAMPLES), precision)))
+        if isinstance(expected, type):
+            assert actual is expected
+        else:
+            assert same_values(actual, expected)
+
+    def test_truncate_negative_uses_floor(self, batch_backend):
+        assert list(truncate_values([-19.343], 0.01)) == [-19.35]
+
+    def test_accepts_buffers_and_iterables(self, batch_backend):
+        expected = [32.0, 212.0]
+        assert list(convert_values([0, 100], "C", "F")) == expected
+        assert list(convert_values(memoryview(array("d", [0, 100])), "C", "F")) == expected
+        assert list(convert_values(array("i", [0, 100]), "C", "F")) == expected
+
+    def test_does_not_modify_input(self, batch_backend):
+        values = array("d", [0.0])
+        convert_values(values, "C", "C")[0] = 5.0
+        assert values[0] == 0.0
@@ -0,0 +1,150 @@
+import threading
+
+from ha_broker_dashboard.data_store import DataStore
+
+
+def make_store() -> DataStore:
+    store = DataStore()
+    store.register_sensor("home/temp", "Temp", "temperature", "graph", history_size=3)
+    store.register_sensor("home/door", "Door", "door", "boolean", history_size=3)
+    return store
+
+
+class TestUpdateDict:
+    def test_graph_update_carries_only_new_point(self):
+        store = make_store()
+        store.update_sensor("home/temp", 20.0)
+        sensor = store.update_sensor("home/temp", 21.0)
+
+        update = sensor.to_update_dict()
+        assert update["current_value"] == 21.0
+        assert [p["value"] for p in update["points"]] == [21.0]
+        assert "history" not in update
+
+    def test_boolean_update_carries_last_switched(self):
+        store = make_store()
+        sensor = store.update_sensor("home/door", "open")
+
+        update = sensor.to_update_dict()
+        assert update["current_value"] == "open"
+        assert update["last_switched"] == update["last_updated"]
+        assert "points" not in update
+
+    def test_snapshot_ts_matches_the_newest_point(self):
+        # the page skips delta points whose ts is not newer than the snapshot's
+        store = make_store()
+        store.update_sensor("home/temp", 20.0)
+        sensor = store.update_sensor("home/temp", 21.0)
+        [point] = sensor.to_update_dict()["points"]
+        assert store.get_all_sensors()["home/temp"]["ts"] == point["ts"]
+
+    def test_full_dict_reports_history_size(self):
+        store = make_store()
+        assert store.get_all_sensors()["home/temp"]["history_size"] == 3
+
+
+class TestConcurrency:
+    def test_held_sensor_lock_does_not_block_other_sensors(self):
+        store = make_store()
+        temp = store.get_sensor("home/temp")
+        with temp.lock:
+            door = threading.Thread(target=store.update_sensor, args=("home/door", "open"))
+            door.start()
+            door.join(timeout=5)
+            assert not door.is_alive()
+            assert store.get_sensor("home/door").current_value == "open"
+
+            # an update of the locked sensor itself waits for the reader
+            blocked = threading.Thread(target=store.update_sensor, args=("home/temp", 20.0))
+            blocked.start()
+            blocked.join(timeout=0.05)
+            assert blocked.is_alive()
+        blocked.join(timeout=5)
+        assert temp.current_value == 20.0
+
+    def test_copy_is_detached_from_later_appends(self):
+        store = make_store()
+        store.update_sensor("home/temp", 20.0)
+        copied = store.get_sensor("home/temp").copy()
+
+        store.update_sensor("home/temp", 21.0)
+        store.update_sensor("home/temp", 22.0)
+        assert copied.current_value == 20.0
+        assert list(copied.history.columns()[1]) == [20.0]
+        assert copied.lock is not store.get_sensor("home/temp").lock
+
+
+class TestSensorsSince:
+    def test_only_sensors_changed_after_version_are_returned(self):
+        store = make_store()
+        version = store.version
+        store.update_sensor("home/door", "open")
+        assert list(store.get_sensors_since(version)) == ["home/door"]
+        assert store.get_sensors_since(store.version) == {}
+        assert list(store.get_sensors_since()) == ["home/temp", "home/door"]
+
+    def test_fields_are_projected(self):
+        store = make_store()
+        store.update_sensor("home/temp", 20.0)
+        sensors = store.get_sensors_since(fields=["current_value", "history", "unknown"])
+        assert sensors["home/temp"]["current_value"] == 20.0
+        assert [point["value"] for point in sensors["home/temp"]["history"]] == [20.0]
+        assert set(sensors["home/door"]) == {"current_value", "history"}
+
+    def test_history_is_left_out_unless_requested(self):
+        store = make_store()
+        store.update_sensor("home/temp", 20.0)
+        sensors = store.get_sensors_since(fields=["current_value", "last_updated"])
+        assert set(sensors["home/temp"]) == {"current_value", "last_updated"}
+
+
+class TestGetHistory:
+    def test_unknown_topic_returns_none(self):
+        assert make_store().get_history("nope") is None
+
+    def test_range_is_inclusive(self):
+        store = make_store()
+        sensor = store.get_sensor("home/temp")
+        for n in range(3):
+            sensor.history.append(float(n), 100.0 + n)
+
+        timestamps, values = store.get_history("home/temp", 101.0, 102.0)
+        assert list(values) == [1.0, 2.0]
+        assert list(timestamps) == [101.0, 102.0]
+
+
+class TestTemplates:
+    def make_store(self) -> DataStore:
+        store = DataStore()
+        store.register_template(
+            "home/+/temperature",
+            name="{0} Temperature",
+            sensor_type="temperature",
+            implementation="graph",
+            history_size=10,
+            unit="°C",
+        )
+        return store
+
+    def test_matching_topic_registers_sensor(self):
+        store = self.make_store()
+        sensor = store.update_sensor("home/kitchen/temperature", 21.5)
+
+        assert sensor.name == "kitchen Temperature"
+        assert sensor.unit == "°C"
+        assert sensor.template == "home/+/temperature"
+        assert sensor.announced is False
+        assert store.get_sensor("home/kitchen/temperature") is sensor
+        assert "home/kitchen/temperature" in store.topic_ids
+
+    def test_existing_sensor_is_reused(self):
+        store = self.make_store()
+        first = store.update_sensor("home/kitchen/temperature", 21.5)
+        first.announced = True
+        assert store.update_sensor("home/kitchen/temperature", 22.0) is first
+        assert len(first.history) == 2
+
+    def test_non_matching_topic_is_ignored(self):
+        store = self.make_store()
+        assert store.update_sensor("home/kitchen/humidity", 40) is None
+        assert store.get_all_sensors() == {}
@@ -0,0 +1,167 @@
+import json
+import threading
+import time
+
+import pytest
+
+from ha_broker_dashboard.decode_pool import (
+    DecodePool,
+    ShmRing,
+    decode_result,
+    encode_result,
+)
+from ha_broker_dashboard.payloads import PayloadFormat
+
+
+@pytest.fixture
+def ring():
+    ring = ShmRing(256)
+    yield ring
+    ring.close()
+
+
+class TestShmRing:
+    def test_frames_round_trip_in_order(self, ring):
+        assert ring.get() is None
+        assert ring.put(b"ab", b"cd")
+        assert ring.put(b"")
+        assert ring.get() == b"abcd"
+        assert ring.get() == b""
+        assert ring.get() is None
+
+    def test_full_ring_rejects_frames(self, ring):
+        frame = bytes(60)
+        written = 0
+        while ring.put(frame):
+            written += 1
+        assert written == 4
+        assert ring.get() == frame
+        assert ring.put(frame)
+
+    def test_frames_wrap_around_the_end(self, ring):
+        for n in range(200):
+            frame = bytes([n % 256]) * (n % 90)
+            assert ring.put(frame)
+            assert ring.get() == frame
+
+    def test_frames_larger_than_half_the_ring_fit_once_drained(self):
+        ring = ShmRing(1000)
+        try:
+            assert ring.put(bytes(400))
+            assert ring.get() == bytes(400)
+            frame = bytes(range(256)) * 2 + bytes(188)
+            assert ring.put(frame)
+            assert not ring.put(bytes(300))
+            assert ring.get() == frame
+            # capacity minus the length prefix is the largest frame there is
+            assert ring.put(bytes(996))
+            assert ring.get() == bytes(996)
+        finally:
+            ring.close()
+
+    def test_oversized_frame_raises(self, ring):
+        with pytest.raises(ValueError):
+            ring.put(bytes(300))
+
+    def test_attached_ring_shares_frames(self, ring):
+        other = ShmRing(name=ring.name)
+        try:
+            assert other.capacity == ring.capacity
+            ring.put(b"hello")
+            assert other.get() == b"hello"
+            assert ring.get() is None
+        finally:
+            other.close()
+
+    def test_concurrent_producer_and_consumer(self, ring):
+        frames = [str(n).encode() * (n % 7 + 1) for n in range(5000)]
+
+        def produce():
+            for frame in frames:
+                while not ring.put(frame):
+                    time.sleep(0)
+
+        producer = threading.Thread(target=produce)
+        producer.start()
+        received = []
+        while len(received) < len(frames):
+            frame = ring.get()
+            if frame is not None:
+                received.append(frame)
+        producer.join()
+        assert received == frames
+
+
+class TestResultEncoding:
+    @pytest.mark.parametrize(
+        "value", [21.5, 42, -7, True, False, None, "open", {"a": [1, 2]}, [1, "x"], 1 << 70]
+    )
+    def test_round_trip(self, value):
+        topic, kind, decoded = decode_result(b"".join(encode_result(b"home/t", value)))
+        assert topic == "home/t"
+        assert decoded == value
+        assert type(decoded) is type(value)
+
+
+class TestDecodePool:
+    def test_large_payloads_are_decoded_by_workers(self):
+        received = []
+        lock = threading.Lock()
+
+        def on_result(topic, value):
+            with lock:
+                received.append((topic, value))
+
+        pool = DecodePool(
+            2,
+            [PayloadFormat("zigbee/+", value_path="state"), PayloadFormat("home/plain")],
+            on_result,
+            min_bytes=64,
+        )
+        pool.start()
+        try:
+            padding = "x" * 100
+            assert not pool.submit("home/plain", b"21.5")
+            for n in range(200):
+                payload = json.dumps({"state": n, "padding": padding}).encode()
+                assert pool.submit(f"zigbee/{n % 4}", payload)
+            # topics stay pooled once they have been, whatever the payload size
+            assert pool.submit("zigbee/0", b'{"state": "last"}')
+            assert pool.submit("zigbee/1", b"not json")
+
+            deadline = time.monotonic() + 10
+            while pool.pending and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            pool.stop()
+
+        assert pool.pending == 0
+        by_topic = {}
+        for topic, value in received:
+            by_topic.setdefault(topic, []).append(value)
+        assert by_topic["zigbee/0"] == list(range(0, 200, 4)) + ["last"]
+        assert by_topic["zigbee/2"] == list(range(2, 200, 4))
+        # a missing value path is reported, not delivered
+        assert by_topic["zigbee/1"] == list(range(1, 200, 4))
+
+    def test_payloads_too_big_for_the_ring_are_left_to_the_caller(self):
+        received = []
+        pool = DecodePool(
+            1,
+            [PayloadFormat("home/+")],
+            lambda topic, value: received.append(value),
+            min_bytes=8,
+            ring_bytes=256,
+        )
+        pool.start()
+        try:
+            assert not pool.submit("home/big", b"1" * 300)
+            # the topic was not pinned, so small payloads are still decoded inline
+            assert not pool.submit("home/big", b"2")
+            assert pool.submit("home/pooled", b"3" * 100)
+            # a pooled topic waits for its queued values, then falls back too
+            assert not pool.submit("home/pooled", b"4" * 300)
+            assert pool.pending == 0
+        finally:
+            pool.stop()
+        assert received == [int("3" * 100)]
@@ -0,0 +1,23 @@
+import math
+
+from ha_broker_dashboard.downsample import lttb
+
+
+class TestLttb:
+    def test_below_threshold_keeps_everything(self):
+        assert lttb([0, 1, 2], [5, 6, 7], 10) == [0, 1, 2]
+
+    def test_keeps_first_and_last(self):
+        timestamps = list(range(100))
+        values = [math.sin(t / 5) for t in timestamps]
+        selected = lttb(timestamps, values, 10)
+        assert len(selected) == 10
+        assert selected[0] == 0
+        assert selected[-1] == 99
+        assert selected == sorted(selected)
+
+    def test_keeps_spike(self):
+        timestamps = list(range(50))
+        values = [0.0] * 50
+        values[23] = 100.0
+        assert 23 in lttb(timestamps, values, 5)
@@ -0,0 +1,18 @@
+import pytest
+
+from test.benchmark.bench_end_to_end import run_benchmark
+
+
+@pytest.mark.parametrize("mode", ["thread", "asyncio"])
+def test_every_published_value_reaches_the_websocket(mode):
+    result = run_benchmark(topics=3, rate=300, duration=0.5, drain_timeout=5, mode=mode)
+
+    assert result.sent > 0
+    assert result.received == result.sent
+    assert 0 < result.percentile(0.5) <= result.percentile(0.99) < 5
+
+
+def test_coalesced_graph_points_are_all_delivered():
+    result = run_benchmark(topics=2, rate=400, duration=0.5, drain_timeout=5, coalesce_ms=50)
+
+    assert result.received == result.sent
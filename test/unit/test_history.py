@@ -0,0 +1,68 @@
+from datetime import datetime
+
+import pytest
+
+from ha_broker_dashboard.history import HistoryBuffer
+
+
+def filled(maxlen: int, count: int) -> HistoryBuffer:
+    buffer = HistoryBuffer(maxlen)
+    for i in range(count):
+        buffer.append(float(i), 1_700_000_000.0 + i)
+    return buffer
+
+
+class TestHistoryBuffer:
+    def test_append_below_capacity(self):
+        buffer = filled(5, 3)
+        assert len(buffer) == 3
+        assert [v for v, _ in buffer] == [0.0, 1.0, 2.0]
+
+    def test_append_wraps_and_drops_oldest(self):
+        buffer = filled(3, 5)
+        assert len(buffer) == 3
+        assert [v for v, _ in buffer] == [2.0, 3.0, 4.0]
+
+    def test_indexing(self):
+        buffer = filled(3, 5)
+        assert buffer[0] == (2.0, 1_700_000_002.0)
+        assert buffer[-1] == (4.0, 1_700_000_004.0)
+        with pytest.raises(IndexError):
+            buffer[3]
+
+    def test_zero_capacity_ignores_appends(self):
+        buffer = filled(0, 3)
+        assert len(buffer) == 0
+        assert buffer.to_list() == []
+
+    def test_segments_split_at_wrap(self):
+        buffer = filled(4, 6)
+        segments = buffer.segments()
+        assert len(segments) == 2
+        assert [list(values) for values, _ in segments] == [[2.0, 3.0], [4.0, 5.0]]
+
+    def test_slice_is_a_view(self):
+        buffer = filled(4, 6)
+        view = buffer[1:3]
+        assert len(view) == 2
+        assert [v for v, _ in view] == [3.0, 4.0]
+        assert all(isinstance(values, memoryview) for values, _ in view.segments())
+
+    def test_to_list_matches_wire_format(self):
+        buffer = filled(2, 1)
+        assert buffer.to_list() == [
+            {"value": 0.0, "timestamp": datetime.fromtimestamp(1_700_000_000.0).isoformat()}
+        ]
+
+    def test_bisect_finds_time_bounds(self):
+        buffer = filled(4, 6)
+        assert buffer.bisect(1_700_000_003.0) == 1
+        assert buffer.bisect(1_700_000_003.0, right=True) == 2
+        assert buffer.bisect(0.0) == 0
+        assert buffer.bisect(2_000_000_000.0) == 4
+
+    def test_columns_copies_range_across_wrap(self):
+        buffer = filled(4, 6)
+        timestamps, values = buffer.columns(1, 4)
+        assert list(values) == [3.0, 4.0, 5.0]
+        assert list(timestamps) == [1_700_000_003.0, 1_700_000_004.0, 1_700_000_005.0]
@@ -0,0 +1,104 @@
+import time
+
+from ha_broker_dashboard.data_store import DataStore
+from ha_broker_dashboard.history_log import RECORD, HistoryLog
+
+
+def make_log(tmp_path, **kwargs) -> HistoryLog:
+    # test samples use tiny epoch timestamps, so keep retention from expiring them
+    kwargs.setdefault("retention_seconds", float("inf"))
+    return HistoryLog(tmp_path, **kwargs)
+
+
+def write(log: HistoryLog, topic: str, samples: list[tuple[float, float]]) -> None:
+    log.start()
+    for timestamp, value in samples:
+        log.append(topic, timestamp, value)
+    log.stop()
+
+
+class TestHistoryLog:
+    def test_load_recent_returns_newest_samples_in_order(self, tmp_path):
+        log = make_log(tmp_path, segment_records=4)
+        write(log, "home/temp", [(1000.0 + i, float(i)) for i in range(10)])
+
+        assert len(log._segment_paths("home/temp")) == 3
+        assert log.load_recent("home/temp", 5) == [(1000.0 + i, float(i)) for i in range(5, 10)]
+
+    def test_load_recent_for_unknown_topic_is_empty(self, tmp_path):
+        assert make_log(tmp_path).load_recent("nope", 10) == []
+
+    def test_appends_continue_previous_segment(self, tmp_path):
+        write(make_log(tmp_path, segment_records=10), "t", [(1.0, 1.0)])
+        log = make_log(tmp_path, segment_records=10)
+        write(log, "t", [(2.0, 2.0)])
+        assert len(log._segment_paths("t")) == 1
+        assert log.load_recent("t", 10) == [(1.0, 1.0), (2.0, 2.0)]
+
+    def test_partial_trailing_record_is_ignored(self, tmp_path):
+        log = make_log(tmp_path)
+        write(log, "t", [(1.0, 1.0)])
+        with open(log._segment_paths("t")[0], "ab") as f:
+            f.write(RECORD.pack(2.0, 2.0)[:5])
+        assert log.load_recent("t", 10) == [(1.0, 1.0)]
+
+    def test_read_range(self, tmp_path):
+        log = make_log(tmp_path, segment_records=3)
+        write(log, "t", [(float(i), float(i)) for i in range(10)])
+        assert [ts for ts, _ in log.read("t", 4.0, 6.0)] == [4.0, 5.0, 6.0]
+
+    def test_read_range_within_one_segment(self, tmp_path):
+        log = make_log(tmp_path)
+        write(log, "t", [(float(i), float(i) * 2) for i in range(100)])
+        assert len(log._segment_paths("t")) == 1
+        assert log.read("t", 41.5, 44.0) == [(42.0, 84.0), (43.0, 86.0), (44.0, 88.0)]
+        assert log.read("t", end=1.0) == [(0.0, 0.0), (1.0, 2.0)]
+        assert log.read("t", start=98.0) == [(98.0, 196.0), (99.0, 198.0)]
+        assert log.read("t", 200.0) == []
+
+    def test_compact_drops_expired_segments_but_keeps_newest(self, tmp_path):
+        log = make_log(tmp_path, segment_records=2, retention_seconds=5)
+        write(log, "t", [(float(i), float(i)) for i in range(10)])
+        log.compact(now=14.0)
+        assert [ts for ts, _ in log.read("t")] == [8.0, 9.0]
+
+    def test_stray_files_are_ignored(self, tmp_path):
+        log = make_log(tmp_path, segment_records=2, retention_seconds=5)
+        write(log, "t", [(float(i), float(i)) for i in range(10)])
+        (log.topic_directory("t") / "notes.seg").write_bytes(RECORD.pack(99.0, 99.0))
+        log.compact(now=14.0)
+        assert [ts for ts, _ in log.read("t")] == [8.0, 9.0]
+
+    def test_writer_survives_errors(self, tmp_path, monkeypatch):
+        log = make_log(tmp_path)
+        write_batch = log._write
+        calls = []
+
+        def failing_write(items):
+            calls.append(items)
+            if len(calls) == 1:
+                raise ValueError("boom")
+            write_batch(items)
+
+        monkeypatch.setattr(log, "_write", failing_write)
+        log.start()
+        log.append("t", 1.0, 1.0)
+        while not calls:
+            time.sleep(0.01)
+        log.append("t", 2.0, 2.0)
+        log.stop()
+        assert log.load_recent("t", 10) == [(2.0, 2.0)]
+
+    def test_data_store_rehydrates_graph_history(self, tmp_path):
+        log = make_log(tmp_path)
+        log.start()
+        store = DataStore(history_log=log)
+        store.register_sensor("t", "T", "temperature", "graph", history_size=5)
+        store.update_sensor("t", 20.5)
+        log.stop()
+
+        restarted = DataStore(history_log=make_log(tmp_path))
+        restarted.register_sensor("t", "T", "temperature", "graph", history_size=5)
+        sensor = restarted.get_sensor("t")
+        assert sensor.current_value == 20.5
+        assert [value for value, _ in sensor.history] == [20.5]
@@ -0,0 +1,77 @@
+import asyncio
+import threading
+
+from ha_broker_dashboard.ingest import IngestQueue
+
+
+class TestIngestQueue:
+    def test_items_from_another_thread_are_delivered_in_order(self):
+        received = []
+
+        async def scenario():
+            queue = IngestQueue(lambda topic, update: received.append((topic, update)))
+            task = asyncio.create_task(queue.run())
+            await asyncio.sleep(0)
+
+            producer = threading.Thread(
+                target=lambda: [queue.put("a", n) for n in range(1000)]
+            )
+            producer.start()
+            producer.join()
+            while len(received) < 1000:
+                await asyncio.sleep(0.01)
+            task.cancel()
+            return queue
+
+        queue = asyncio.run(scenario())
+        assert [update for _, update in received] == list(range(1000))
+        assert queue.latency.count == 1000
+        assert queue.batches < 1000
+
+    def test_items_queued_before_run_are_drained(self):
+        received = []
+
+        async def scenario():
+            queue = IngestQueue(lambda topic, update: received.append(update))
+            queue.put("a", 1)
+            task = asyncio.create_task(queue.run())
+            await asyncio.sleep(0.01)
+            task.cancel()
+
+        asyncio.run(scenario())
+        assert received == [1]
+
+    def test_large_backlog_is_drained_in_batches(self):
+        received = []
+
+        async def scenario():
+            queue = IngestQueue(lambda topic, update: received.append(update), max_batch=10)
+            for n in range(35):
+                queue.put("a", n)
+            task = asyncio.create_task(queue.run())
+            await asyncio.sleep(0.01)
+            task.cancel()
+            return queue
+
+        queue = asyncio.run(scenario())
+        assert received == list(range(35))
+        assert queue.batches == 4
+
+    def test_handler_errors_do_not_stop_the_queue(self):
+        received = []
+
+        def handler(topic, update):
+            if update == 0:
+                raise ValueError("boom")
+            received.append(update)
+
+        async def scenario():
+            queue = IngestQueue(handler)
+            queue.put("a", 0)
+            queue.put("a", 1)
+            task = asyncio.create_task(queue.run())
+            await asyncio.sleep(0.01)
+            task.cancel()
+
+        asyncio.run(scenario())
+        assert received == [1]
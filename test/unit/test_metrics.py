@@ -0,0 +1,101 @@
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from ha_broker_dashboard.data_store import DataStore
+from ha_broker_dashboard.metrics import CONTENT_TYPE, REGISTRY, Registry
+from ha_broker_dashboard.web_server import create_app
+from ha_broker_dashboard.websocket_manager import WebSocketManager
+
+
+class TestCounter:
+    def test_increments_from_many_threads_are_not_lost(self):
+        child = Registry().counter("c_total", "help").labels()
+
+        def work():
+            for _ in range(10000):
+                child.inc()
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert child.value == 40000
+
+    def test_labelled_children_are_bound_once(self):
+        counter = Registry().counter("c_total", "help", ["topic"])
+        assert counter.labels("a") is counter.labels("a")
+        counter.labels("a").inc(2)
+        counter.labels("b").inc()
+        assert counter.samples() == [("c_total", {"topic": "a"}, 2.0), ("c_total", {"topic": "b"}, 1.0)]
+
+    def test_wrong_label_count_raises(self):
+        with pytest.raises(ValueError):
+            Registry().counter("c_total", "help", ["topic"]).labels()
+
+
+class TestHistogram:
+    def test_cumulative_buckets_sum_and_count(self):
+        histogram = Registry().histogram("h_seconds", "help", buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+        samples = {(name, labels.get("le")): value for name, labels, value in histogram.samples()}
+        assert samples[("h_seconds_bucket", "0.1")] == 2
+        assert samples[("h_seconds_bucket", "1")] == 3
+        assert samples[("h_seconds_bucket", "+Inf")] == 4
+        assert samples[("h_seconds_count", None)] == 4
+        assert samples[("h_seconds_sum", None)] == pytest.approx(2.65)
+
+
+class TestRegistry:
+    def test_render_text_format(self):
+        registry = Registry()
+        registry.counter("requests_total", "Requests", ["path"]).labels('/a"b').inc()
+        registry.callback("queue_depth", "Depth", lambda: 3)
+        registry.callback("lag_seconds", "Lag", lambda: {("c1",): 0.5}, labelnames=["client"])
+        text = registry.render()
+        assert "# TYPE requests_total counter" in text
+        assert 'requests_total{path="/a\\"b"} 1' in text
+        assert "# TYPE queue_depth gauge\nqueue_depth 3" in text
+        assert 'lag_seconds{client="c1"} 0.5' in text
+
+    def test_same_name_returns_the_existing_family(self):
+        registry = Registry()
+        assert registry.counter("c_total", "help") is registry.counter("c_total", "help")
+        with pytest.raises(ValueError):
+            registry.histogram("c_total", "help")
+
+    def test_callbacks_are_replaced(self):
+        registry = Registry()
+        registry.callback("depth", "help", lambda: 1)
+        registry.callback("depth", "help", lambda: 2)
+        assert registry.render().count("depth 2") == 1
+
+
+class TestDataStoreMetrics:
+    def test_ingest_and_convert_failures_are_counted_per_topic(self):
+        store = DataStore()
+        store.register_sensor("metrics/graph", "Graph", "t", "graph", 10)
+        store.register_sensor("metrics/text", "Text", "t", "text", 10)
+        store.update_sensor("metrics/graph", 1.5)
+        store.update_sensor("metrics/graph", "unavailable")
+        store.update_sensor("metrics/text", "hello")
+
+        text = REGISTRY.render()
+        assert 'ha_dashboard_topic_messages_total{topic="metrics/graph"} 2' in text
+        assert 'ha_dashboard_topic_messages_total{topic="metrics/text"} 1' in text
+        assert 'ha_dashboard_convert_failures_total{topic="metrics/graph"} 1' in text
+        assert "ha_dashboard_ingest_messages_total " in text
+
+
+def test_metrics_endpoint_serves_the_registry():
+    registry = Registry()
+    registry.callback("queue_depth", "Depth", lambda: 7)
+    client = TestClient(create_app(DataStore(), WebSocketManager(), registry=registry))
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == CONTENT_TYPE
+    assert "queue_depth 7" in response.text
@@ -0,0 +1,161 @@
+import asyncio
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+import pytest
+
+from ha_broker_dashboard.config import MQTTConfig, SensorConfig
+from ha_broker_dashboard.mqtt_client import MQTTClient, partition_topics
+from test.broker import LocalBroker
+
+TOPICS = [f"home/sensor/{n}" for n in range(8)]
+
+
+def sensor(topic):
+    return SensorConfig(topic=topic, type="sensor", name=topic, implementation="text", history=10)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def broker():
+    with LocalBroker() as broker:
+        yield broker
+
+
+def publish_all(broker, messages):
+    publisher = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    publisher.connect(broker.host, broker.port)
+    publisher.loop_start()
+    for topic, payload in messages:
+        publisher.publish(topic, payload, qos=1).wait_for_publish(5)
+    publisher.disconnect()
+    publisher.loop_stop()
+
+
+def start_client(broker, received, loop=None, **config):
+    lock = threading.Lock()
+
+    def on_message(topic, value):
+        with lock:
+            received.append((topic, value))
+
+    client = MQTTClient(
+        MQTTConfig(host=broker.host, port=broker.port, **config),
+        [sensor(topic) for topic in TOPICS],
+        on_message,
+        loop=loop,
+    )
+    client.connect()
+    client.start()
+    return client
+
+
+class TestPartitionTopics:
+    def test_every_topic_is_assigned_once(self):
+        partitions = partition_topics(TOPICS, 3)
+        assert len(partitions) == 3
+        assert sorted(topic for partition in partitions for topic in partition) == sorted(TOPICS)
+
+    def test_assignment_is_stable(self):
+        for topic in TOPICS:
+            first = [i for i, p in enumerate(partition_topics(TOPICS, 4)) if topic in p]
+            second = [i for i, p in enumerate(partition_topics([topic], 4)) if topic in p]
+            assert first == second
+
+    def test_overlapping_filters_share_a_connection(self):
+        topics = TOPICS + ["home/+/temperature", "home/kitchen/temperature", "home/hall/temperature"]
+        for connections in range(2, 9):
+            partitions = partition_topics(topics, connections)
+            [shared] = [p for p in partitions if "home/+/temperature" in p]
+            assert {"home/kitchen/temperature", "home/hall/temperature"} <= set(shared)
+            assert sorted(topic for partition in partitions for topic in partition) == sorted(topics)
+
+    def test_single_connection_gets_everything(self):
+        assert partition_topics(TOPICS, 1) == [TOPICS]
+        assert partition_topics(TOPICS, 0) == [TOPICS]
+
+
+class TestMQTTClient:
+    def test_sharded_connections_receive_their_topics(self, broker):
+        received = []
+        client = start_client(broker, received, connections=3)
+        try:
+            wait_for(lambda: broker.subscription_count() == len(TOPICS))
+            publish_all(broker, [(topic, str(n)) for n, topic in enumerate(TOPICS)] * 5)
+            wait_for(lambda: len(received) == len(TOPICS) * 5)
+        finally:
+            client.stop()
+
+        assert sorted(received) == sorted((topic, n) for n, topic in enumerate(TOPICS) for _ in range(5))
+        stats = client.stats()
+        assert [s["connection"] for s in stats] == [0, 1, 2]
+        for connection, s in zip(client.connections, stats):
+            assert s["messages"] == len(connection.topics) * 5
+            assert s["bytes"] == s["messages"]
+        assert sum(s["topics"] for s in stats) == len(TOPICS)
+
+    def test_shared_group_splits_messages_between_replicas(self, broker):
+        received = []
+        replicas = [start_client(broker, received, connections=2, shared_group="dash") for _ in range(2)]
+        try:
+            wait_for(lambda: broker.subscription_count() == len(TOPICS) * 2)
+            publish_all(broker, [(TOPICS[0], "1")] * 10)
+            wait_for(lambda: len(received) == 10)
+            time.sleep(0.1)
+        finally:
+            for replica in replicas:
+                replica.stop()
+
+        assert len(received) == 10
+        per_replica = [sum(s["messages"] for s in replica.stats()) for replica in replicas]
+        assert per_replica == [5, 5]
+        assert all(
+            connection.client.protocol == mqtt.MQTTv5
+            for replica in replicas for connection in replica.connections
+        )
+
+    def test_asyncio_mode_delivers_on_the_event_loop(self, broker):
+        received = []
+        threads = set()
+
+        async def wait_until(condition, timeout=5.0):
+            deadline = time.monotonic() + timeout
+            while not condition():
+                assert time.monotonic() < deadline, "timed out"
+                await asyncio.sleep(0.01)
+
+        async def scenario():
+            loop = asyncio.get_running_loop()
+            client = start_client(broker, received, loop=loop, connections=2, mode="asyncio")
+            for connection in client.connections:
+                callback = connection.on_message_callback
+                connection.on_message_callback = lambda topic, value, callback=callback: (
+                    threads.add(threading.get_ident()), callback(topic, value)
+                )
+            try:
+                await wait_until(lambda: broker.subscription_count() == len(TOPICS))
+                messages = [(topic, str(n)) for n in range(50) for topic in TOPICS]
+                await loop.run_in_executor(None, publish_all, broker, messages)
+                await wait_until(lambda: len(received) == len(messages))
+                # no paho network threads were started
+                assert all(connection.client._thread is None for connection in client.connections)
+            finally:
+                client.stop()
+            return threading.get_ident()
+
+        loop_thread = asyncio.run(scenario())
+        assert threads == {loop_thread}
+        for topic in TOPICS:
+            assert [value for t, value in received if t == topic] == list(range(50))
+
+    def test_asyncio_mode_requires_a_loop(self):
+        with pytest.raises(ValueError):
+            MQTTClient(MQTTConfig(host="localhost", port=1883, mode="asyncio"), [], print)
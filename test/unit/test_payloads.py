@@ -0,0 +1,105 @@
+import pytest
+
+from ha_broker_dashboard.payloads import (
+    PayloadDecoder,
+    PayloadFormat,
+    build_parser,
+    extract_value,
+    parse_value_path,
+)
+
+
+class TestValuePath:
+    def test_parse(self):
+        assert parse_value_path(None) is None
+        assert parse_value_path("") is None
+        assert parse_value_path("attributes.temperature") == ("attributes", "temperature")
+        assert parse_value_path("values.0") == ("values", 0)
+
+    def test_extract(self):
+        value = {"attributes": {"temperature": 21.5}, "values": [1, 2]}
+        assert extract_value(value, ("attributes", "temperature")) == 21.5
+        assert extract_value(value, ("values", -1)) == 2
+
+    def test_missing_path_raises(self):
+        with pytest.raises(ValueError, match="attributes.humidity"):
+            extract_value({"attributes": {}}, ("attributes", "humidity"))
+        with pytest.raises(ValueError):
+            extract_value(21.5, ("state",))
+
+
+class TestBuildParser:
+    def parser(self, payload_format, **options):
+        return build_parser(PayloadFormat("t", payload_format, **options))
+
+    def test_auto_keeps_json_with_string_fallback(self):
+        parse = self.parser("auto")
+        assert parse(b"21.5") == 21.5
+        assert parse(b"21") == 21
+        assert parse(b"open") == "open"
+        assert parse(b'{"a": 1}') == {"a": 1}
+
+    def test_numeric(self):
+        parse = self.parser("numeric")
+        assert parse(b"21.5") == 21.5
+        assert parse(b" -3 ") == -3.0
+        assert parse(b"unavailable") == "unavailable"
+        assert parse(b'{"a": 1}') == {"a": 1}
+
+    def test_string_never_parses_json(self):
+        parse = self.parser("string")
+        assert parse(b"21.5") == "21.5"
+        assert parse(b'{"a": 1}') == '{"a": 1}'
+
+    def test_boolean_maps_to_the_sensor_labels(self):
+        parse = self.parser("boolean", true_value="open", false_value="closed")
+        assert parse(b"ON") == "open"
+        assert parse(b"true") == "open"
+        assert parse(b"Closed") == "closed"
+        assert parse(b"0") == "closed"
+        assert parse(b"jammed") == "jammed"
+
+    def test_boolean_defaults_to_true_and_false(self):
+        parse = self.parser("boolean")
+        assert parse(b"on") == "true"
+        assert parse(b"OFF") == "false"
+
+    def test_json_with_value_path(self):
+        parse = self.parser("json", value_path="attributes.temperature")
+        assert parse(b'{"attributes": {"temperature": 19.5}}') == 19.5
+        with pytest.raises(ValueError):
+            parse(b'{"attributes": {}}')
+        assert parse(b"offline") == "offline"
+
+    def test_json_without_path(self):
+        assert self.parser("json")(b"[1, 2]") == [1, 2]
+
+    def test_unknown_format_raises(self):
+        with pytest.raises(ValueError, match="xml"):
+            self.parser("xml")
+
+
+class TestPayloadDecoder:
+    def make_decoder(self):
+        return PayloadDecoder([
+            PayloadFormat("home/plain"),
+            PayloadFormat("home/climate", "json", "attributes.temperature"),
+            PayloadFormat("zigbee/+", value_path="state"),
+            PayloadFormat("home/door", "boolean", true_value="open", false_value="closed"),
+        ])
+
+    def test_unconfigured_topics_decode_as_auto(self):
+        decoder = self.make_decoder()
+        assert decoder.decode("home/plain", b"21.5") == 21.5
+        assert decoder.decode("unknown/topic", b"true") is True
+
+    def test_formats_on_exact_and_wildcard_topics(self):
+        decoder = self.make_decoder()
+        assert decoder.decode("home/climate", b'{"attributes": {"temperature": 19}}') == 19
+        assert decoder.decode("zigbee/door", b'{"state": "ON", "battery": 90}') == "ON"
+        assert decoder.decode("home/door", b"OPEN") == "open"
+        assert decoder.parser_for("zigbee/window") is decoder.parser_for("zigbee/door")
+
+    def test_invalid_utf8_raises(self):
+        with pytest.raises(UnicodeDecodeError):
+            self.make_decoder().decode("home/plain", b"\xff\xfe")
@@ -0,0 +1,111 @@
+import time
+from datetime import datetime
+
+from ha_broker_dashboard.data_store import DataStore
+from ha_broker_dashboard.protocol import (
+    FRAME_HEADER,
+    KIND_UPDATES,
+    KIND_UPDATES_SEQ,
+    RECORD,
+    SEQUENCE,
+    encode_binary,
+)
+
+TOPIC_IDS = {"home/temp": 0, "home/door": 1, "home/text": 2}
+STAMP = "2026-01-01T12:00:00.500000"
+TS = datetime.fromisoformat(STAMP).timestamp()
+STAMP_MS = TS * 1000
+
+
+def decode(frame: bytes) -> list[tuple[int, float, float]]:
+    kind, count = FRAME_HEADER.unpack_from(frame, 0)
+    assert kind == KIND_UPDATES
+    return [
+        RECORD.unpack_from(frame, FRAME_HEADER.size + i * RECORD.size) for i in range(count)
+    ]
+
+
+class TestEncodeBinary:
+    def test_graph_update_encodes_each_point(self):
+        message = {
+            "type": "update",
+            "topic": "home/temp",
+            "data": {
+                "current_value": 21.5,
+                "last_updated": STAMP,
+                "ts": TS,
+                "points": [{"value": 21.5, "timestamp": STAMP, "ts": TS}],
+            },
+        }
+        frame, fallback = encode_binary(message, TOPIC_IDS)
+        assert fallback is None
+        assert decode(frame) == [(0, 21.5, STAMP_MS)]
+
+    def test_non_numeric_updates_fall_back_to_json(self):
+        message = {
+            "type": "updates",
+            "data": {
+                "home/temp": {"current_value": 3, "last_updated": STAMP, "ts": TS},
+                "home/door": {
+                    "current_value": "open", "last_updated": STAMP, "ts": TS, "last_switched": STAMP
+                },
+                "home/text": {"current_value": "hello", "last_updated": STAMP, "ts": TS},
+            },
+        }
+        frame, fallback = encode_binary(message, TOPIC_IDS)
+        assert decode(frame) == [(0, 3.0, STAMP_MS)]
+        assert fallback == {
+            "type": "updates",
+            "data": {
+                "home/door": message["data"]["home/door"],
+                "home/text": message["data"]["home/text"],
+            },
+        }
+
+    def test_unknown_topic_falls_back_to_json(self):
+        message = {"type": "update", "topic": "other", "data": {"current_value": 1, "ts": TS}}
+        assert encode_binary(message, TOPIC_IDS) == (None, message)
+
+    def test_other_message_types_pass_through(self):
+        message = {"type": "init", "data": {}}
+        assert encode_binary(message, TOPIC_IDS) == (None, message)
+
+    def test_sequence_number_is_carried_in_both_parts(self):
+        message = {
+            "type": "updates",
+            "seq": 42,
+            "data": {
+                "home/temp": {"current_value": 3, "last_updated": STAMP, "ts": TS},
+                "home/text": {"current_value": "hello", "last_updated": STAMP, "ts": TS},
+            },
+        }
+        frame, fallback = encode_binary(message, TOPIC_IDS)
+        kind, count = FRAME_HEADER.unpack_from(frame, 0)
+        assert (kind, count) == (KIND_UPDATES_SEQ, 1)
+        assert SEQUENCE.unpack_from(frame, FRAME_HEADER.size) == (42,)
+        assert RECORD.unpack_from(frame, FRAME_HEADER.size + SEQUENCE.size) == (0, 3.0, STAMP_MS)
+        assert fallback["seq"] == 42
+
+    def test_updates_without_epoch_times_fall_back_to_json(self):
+        message = {"type": "update", "topic": "home/temp", "data": {"current_value": 1, "last_updated": STAMP}}
+        assert encode_binary(message, TOPIC_IDS) == (None, message)
+
+    def test_repeated_hour_keeps_the_right_time(self, monkeypatch):
+        # 2025-11-02 01:06:40 EST, the second 1 a.m. in New York; its naive ISO
+        # string reads back as the first one, an hour earlier
+        monkeypatch.setenv("TZ", "America/New_York")
+        time.tzset()
+        try:
+            store = DataStore()
+            store.register_sensor("home/temp", "Temp", "temperature", "graph", history_size=5)
+            sensor = store.get_sensor("home/temp")
+            sensor.history.append(21.5, 1762063600.0)
+            sensor.current_value = 21.5
+            sensor.last_updated = datetime.fromtimestamp(1762063600.0)
+            message = {"type": "update", "topic": "home/temp", "data": sensor.to_update_dict()}
+            frame, fallback = encode_binary(message, {"home/temp": 0})
+        finally:
+            monkeypatch.undo()
+            time.tzset()
+        assert fallback is None
+        assert decode(frame) == [(0, 21.5, 1762063600000.0)]
@@ -0,0 +1,79 @@
+from ha_broker_dashboard.data_store import DataStore
+from ha_broker_dashboard.rollups import RollupSet, RollupTier
+
+
+class TestRollupTier:
+    def test_samples_in_one_bucket_are_aggregated(self):
+        tier = RollupTier(60, 10)
+        for timestamp, value in [(600.0, 3.0), (610.0, 1.0), (659.0, 5.0)]:
+            tier.add(timestamp, value)
+
+        [bucket] = tier.buckets()
+        assert (bucket["min"], bucket["max"], bucket["mean"], bucket["count"]) == (1.0, 5.0, 3.0, 3)
+
+    def test_new_bucket_starts_at_boundary(self):
+        tier = RollupTier(60, 10)
+        tier.add(659.0, 1.0)
+        tier.add(660.0, 2.0)
+        assert [b["count"] for b in tier.buckets()] == [1, 1]
+
+    def test_oldest_buckets_are_overwritten(self):
+        tier = RollupTier(1, 3)
+        for second in range(5):
+            tier.add(float(second), float(second))
+        assert len(tier) == 3
+        assert [b["mean"] for b in tier.buckets()] == [2.0, 3.0, 4.0]
+
+    def test_out_of_order_sample_folds_into_newest_bucket(self):
+        tier = RollupTier(1, 3)
+        tier.add(5.0, 1.0)
+        tier.add(3.0, 9.0)
+        [bucket] = tier.buckets()
+        assert bucket["max"] == 9.0
+
+    def test_buckets_filtered_by_range(self):
+        tier = RollupTier(10, 10)
+        for timestamp in (0.0, 10.0, 20.0, 30.0):
+            tier.add(timestamp, timestamp)
+        assert [b["mean"] for b in tier.buckets(15.0, 25.0)] == [10.0, 20.0]
+
+
+class TestRollupSet:
+    def test_every_tier_sees_each_sample(self):
+        rollups = RollupSet(((1, 10), (60, 10)))
+        rollups.add(0.0, 1.0)
+        rollups.add(1.0, 3.0)
+        assert len(rollups.tiers[1]) == 2
+        assert rollups.tiers[60].buckets()[0]["mean"] == 2.0
+
+
+class TestDataStoreRollups:
+    def test_gauge_and_graph_sensors_keep_rollups(self):
+        store = DataStore(rollup_tiers=((60, 10),))
+        store.register_sensor("g", "G", "temperature", "gauge", history_size=5)
+        store.update_sensor("g", 10)
+        store.update_sensor("g", 20)
+        [bucket] = store.get_rollups("g", 60)
+        assert bucket["mean"] == 15.0
+
+    def test_rollups_are_allocated_on_the_first_number(self):
+        store = DataStore(rollup_tiers=((60, 10),))
+        store.register_sensor("g", "G", "temperature", "gauge", history_size=5)
+        sensor = store.get_sensor("g")
+        assert sensor.rollups is None
+        store.update_sensor("g", "unavailable")
+        assert sensor.rollups is None
+        assert store.get_rollups("g", 60) == []
+
+        store.update_sensor("g", 10)
+        rollups = sensor.rollups
+        store.update_sensor("g", 20)
+        assert sensor.rollups is rollups
+        assert [bucket["mean"] for bucket in store.get_rollups("g", 60)] == [15.0]
+
+    def test_non_numeric_sensors_have_no_rollups(self):
+        store = DataStore()
+        store.register_sensor("t", "T", "motion", "text", history_size=5)
+        store.update_sensor("t", "detected")
+        assert store.get_rollups("t", 60) == []
+        assert store.get_rollups("missing", 60) is None
@@ -0,0 +1,77 @@
+import json
+
+from ha_broker_dashboard.data_store import DataStore
+from ha_broker_dashboard.snapshot import SnapshotCache
+
+
+def make_store() -> DataStore:
+    store = DataStore()
+    store.register_sensor("home/temp", "Temp", "temperature", "graph", history_size=5)
+    store.register_sensor("home/door", "Door", "door", "boolean", history_size=5)
+    return store
+
+
+class TestSnapshotCache:
+    def test_matches_get_all_sensors(self):
+        store = make_store()
+        store.update_sensor("home/temp", 20.5)
+        cache = SnapshotCache(store)
+        assert json.loads(cache.encode_all()) == store.get_all_sensors()
+
+    def test_reflects_later_updates(self):
+        store = make_store()
+        cache = SnapshotCache(store)
+        cache.encode_all()
+        store.update_sensor("home/door", "open")
+        assert json.loads(cache.encode_all())["home/door"]["current_value"] == "open"
+
+    def test_only_changed_sensors_are_rebuilt(self):
+        store = make_store()
+        cache = SnapshotCache(store)
+        cache.encode_all()
+        store.update_sensor("home/temp", 21.0)
+
+        known = {topic: version for topic, (version, _) in cache._fragments.items()}
+        topics, changed = store.get_changed_sensors(known)
+        assert topics == ["home/temp", "home/door"]
+        assert list(changed) == ["home/temp"]
+
+    def test_encode_message_wraps_snapshot(self):
+        store = make_store()
+        message = json.loads(SnapshotCache(store).encode_message("init"))
+        assert message["type"] == "init"
+        assert set(message["data"]) == {"home/temp", "home/door"}
+
+    def test_encode_message_adds_fields_and_filters_topics(self):
+        store = make_store()
+        message = json.loads(
+            SnapshotCache(store).encode_message("init", lambda topic: topic == "home/door", seq=7)
+        )
+        assert message["seq"] == 7
+        assert list(message["data"]) == ["home/door"]
+
+    def test_chunks_are_bounded_and_cover_every_sensor(self):
+        store = DataStore()
+        for n in range(20):
+            store.register_sensor(f"home/{n}", f"Sensor {n}", "temperature", "graph", history_size=50)
+            for value in range(50):
+                store.update_sensor(f"home/{n}", float(value))
+        cache = SnapshotCache(store)
+
+        chunks = list(cache.iter_chunks(max_bytes=8192))
+        assert len(chunks) > 1
+        assert all(sum(len(f) + 1 for f in chunk) <= 8192 for chunk in chunks if len(chunk) > 1)
+        merged = {}
+        for chunk in chunks:
+            merged.update(json.loads(cache.join(chunk)))
+        assert merged == store.get_all_sensors()
+
+    def test_chunks_follow_include_and_pick_up_updates(self):
+        store = make_store()
+        cache = SnapshotCache(store)
+        [chunk] = cache.iter_chunks(lambda topic: topic == "home/door")
+        assert list(json.loads(cache.join(chunk))) == ["home/door"]
+
+        store.update_sensor("home/door", "open")
+        [chunk] = cache.iter_chunks()
+        assert json.loads(cache.join(chunk))["home/door"]["current_value"] == "open"
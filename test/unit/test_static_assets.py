@@ -0,0 +1,57 @@
+import gzip
+import os
+
+from ha_broker_dashboard.static_assets import StaticAssets, build_asset, negotiate
+
+PAGE = b"<html><body>" + b"<p>dashboard</p>" * 100 + b"</body></html>"
+
+
+class TestNegotiate:
+    def test_prefers_brotli_then_gzip(self):
+        available = {"identity": 0, "gzip": 0, "br": 0}
+        assert negotiate("gzip, deflate, br", available) == "br"
+        assert negotiate("gzip, deflate", available) == "gzip"
+        assert negotiate(None, available) == "identity"
+
+    def test_respects_q_values(self):
+        available = {"identity": 0, "gzip": 0, "br": 0}
+        assert negotiate("br;q=0.5, gzip", available) == "gzip"
+        assert negotiate("br;q=0, gzip;q=0", available) == "identity"
+        assert negotiate("*", available) == "br"
+
+    def test_only_offers_what_was_built(self):
+        assert negotiate("br", {"identity": 0, "gzip": 0}) == "identity"
+
+
+class TestBuildAsset:
+    def test_compressed_representations_have_their_own_etags(self):
+        asset = build_asset(PAGE, "text/html")
+        coding, body, etag = asset.select("gzip")
+        assert coding == "gzip"
+        assert gzip.decompress(body) == PAGE
+        assert etag != asset.select(None)[2]
+        assert asset.select(None) == ("identity", PAGE, asset.representations["identity"][1])
+
+    def test_small_or_binary_files_are_not_compressed(self):
+        assert list(build_asset(b"tiny", "text/html").representations) == ["identity"]
+        assert list(build_asset(PAGE, "image/png").representations) == ["identity"]
+
+
+class TestStaticAssets:
+    def test_files_are_read_once(self, tmp_path):
+        (tmp_path / "index.html").write_bytes(PAGE)
+        assets = StaticAssets(tmp_path)
+        (tmp_path / "index.html").write_bytes(b"changed")
+        assert assets.get("index.html").select(None)[1] == PAGE
+        assert assets.get("missing.js") is None
+
+    def test_reload_picks_up_edits(self, tmp_path):
+        path = tmp_path / "index.html"
+        path.write_bytes(PAGE)
+        assets = StaticAssets(tmp_path, reload=True)
+        first = assets.get("index.html")
+        assert assets.get("index.html") is first
+
+        path.write_bytes(b"changed")
+        os.utime(path, (first.mtime + 10, first.mtime + 10))
+        assert assets.get("index.html").select(None)[1] == b"changed"
@@ -0,0 +1,64 @@
+from ha_broker_dashboard.topic_trie import TopicTrie, filters_overlap, is_wildcard
+
+
+class TestIsWildcard:
+    def test_wildcards(self):
+        assert is_wildcard("home/+/temperature")
+        assert is_wildcard("home/#")
+        assert is_wildcard("#")
+
+    def test_exact_topics(self):
+        assert not is_wildcard("home/living_room/temperature")
+        assert not is_wildcard("home/a+b")
+
+
+class TestFiltersOverlap:
+    def test_overlapping_filters(self):
+        assert filters_overlap("home/+/temperature", "home/kitchen/temperature")
+        assert filters_overlap("home/#", "home/kitchen/temperature")
+        assert filters_overlap("home/#", "home")
+        assert filters_overlap("home/+/temperature", "+/kitchen/#")
+        assert filters_overlap("#", "home/kitchen")
+        assert filters_overlap("home/a", "home/a")
+
+    def test_disjoint_filters(self):
+        assert not filters_overlap("home/+/temperature", "home/kitchen/humidity")
+        assert not filters_overlap("home/+", "home/kitchen/temperature")
+        assert not filters_overlap("home/+", "home")
+        assert not filters_overlap("home/a", "home/b")
+        assert not filters_overlap("#", "$SYS/broker/load")
+
+
+class TestTopicTrie:
+    def make_trie(self) -> TopicTrie[str]:
+        trie: TopicTrie[str] = TopicTrie()
+        trie.insert("home/+/temperature", "temps")
+        trie.insert("home/#", "everything")
+        trie.insert("home/garage/door", "door")
+        return trie
+
+    def test_single_level_wildcard_captures_level(self):
+        assert self.make_trie().match("home/kitchen/temperature") == [
+            ("temps", ["kitchen"]),
+            ("everything", ["kitchen/temperature"]),
+        ]
+
+    def test_exact_match(self):
+        assert ("door", []) in self.make_trie().match("home/garage/door")
+
+    def test_single_level_wildcard_does_not_span_levels(self):
+        assert self.make_trie().match("home/a/b/temperature") == [
+            ("everything", ["a/b/temperature"])
+        ]
+
+    def test_multi_level_wildcard_matches_parent(self):
+        assert self.make_trie().match("home") == [("everything", [""])]
+
+    def test_no_match(self):
+        assert self.make_trie().match("office/temperature") == []
+
+    def test_wildcards_skip_system_topics(self):
+        trie: TopicTrie[str] = TopicTrie()
+        trie.insert("#", "all")
+        trie.insert("$SYS/#", "sys")
+        assert trie.match("$SYS/broker/load") == [("sys", ["broker/load"])]
@@ -0,0 +1,108 @@
+from fastapi.testclient import TestClient
+
+from ha_broker_dashboard.data_store import DataStore
+from ha_broker_dashboard.web_server import create_app, etag_matches
+from ha_broker_dashboard.websocket_manager import WebSocketManager
+
+
+def make_client() -> tuple[DataStore, TestClient]:
+    store = DataStore()
+    store.register_sensor("home/temp", "Temp", "temperature", "graph", history_size=3)
+    store.register_sensor("home/door", "Door", "door", "boolean", history_size=3)
+    return store, TestClient(create_app(store, WebSocketManager()))
+
+
+class TestSensorsEndpoint:
+    def test_unchanged_store_is_not_modified(self):
+        store, client = make_client()
+        first = client.get("/api/sensors")
+        assert first.status_code == 200
+        etag = first.headers["etag"]
+
+        second = client.get("/api/sensors", headers={"If-None-Match": etag})
+        assert second.status_code == 304
+        assert second.content == b""
+
+        store.update_sensor("home/temp", 20.0)
+        third = client.get("/api/sensors", headers={"If-None-Match": etag})
+        assert third.status_code == 200
+        assert third.headers["etag"] != etag
+
+    def test_since_returns_only_changed_sensors(self):
+        store, client = make_client()
+        version = client.get("/api/sensors").headers["x-sensors-version"]
+        store.update_sensor("home/door", "open")
+
+        response = client.get("/api/sensors", params={"since": version})
+        assert list(response.json()) == ["home/door"]
+        assert int(response.headers["x-sensors-version"]) > int(version)
+
+    def test_fields_projection_skips_history(self):
+        store, client = make_client()
+        store.update_sensor("home/temp", 20.0)
+        response = client.get("/api/sensors", params={"fields": "current_value,last_updated"})
+        assert set(response.json()["home/temp"]) == {"current_value", "last_updated"}
+
+    def test_negative_since_is_rejected(self):
+        _, client = make_client()
+        assert client.get("/api/sensors", params={"since": -1}).status_code == 422
+
+
+class TestEtagMatches:
+    def test_lists_weak_tags_and_wildcard(self):
+        assert etag_matches('"1", W/"5"', '"5"')
+        assert etag_matches("*", '"5"')
+        assert not etag_matches('"4"', '"5"')
+        assert not etag_matches(None, '"5"')
+
+
+class TestStaticFiles:
+    def test_index_is_served_compressed_with_an_etag(self):
+        _, client = make_client()
+        response = client.get("/", headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["cache-control"] == "no-cache"
+        assert response.headers["content-type"].startswith("text/html")
+        assert "<html" in response.text
+
+        revalidated = client.get(
+            "/", headers={"Accept-Encoding": "gzip", "If-None-Match": response.headers["etag"]}
+        )
+        assert revalidated.status_code == 304
+
+    def test_static_path_serves_known_files_only(self):
+        _, client = make_client()
+        assert client.get("/static/index.html").status_code == 200
+        assert client.get("/static/missing.js").status_code == 404
+        assert client.get("/static/../web_server.py").status_code == 404
+
+
+class TestInit:
+    def test_small_snapshot_is_one_init_frame(self):
+        _, client = make_client()
+        with client.websocket_connect("/ws") as websocket:
+            init = websocket.receive_json()
+        assert init["type"] == "init"
+        assert list(init["data"]) == ["home/temp", "home/door"]
+
+    def test_large_snapshot_is_streamed_in_chunks(self):
+        store = DataStore()
+        for n in range(40):
+            store.register_sensor(f"home/{n}", f"Sensor {n}", "temperature", "graph", history_size=200)
+            for value in range(200):
+                store.update_sensor(f"home/{n}", float(value))
+        client = TestClient(create_app(store, WebSocketManager()))
+
+        received = {}
+        with client.websocket_connect("/ws") as websocket:
+            message = websocket.receive_json()
+            while message["type"] == "init_chunk":
+                assert message["index"] == len(received) and message["seq"] == 0
+                received[message["index"]] = message["data"]
+                message = websocket.receive_json()
+        assert message["type"] == "init_done"
+        assert message["chunks"] == len(received) > 1
+        assert message["sensors"] == 40
+        sensors = {topic: data for chunk in received.values() for topic, data in chunk.items()}
+        assert sensors == store.get_all_sensors()
@@ -0,0 +1,425 @@
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+from ha_broker_dashboard.data_store import DataStore
+from ha_broker_dashboard.web_server import create_app
+from ha_broker_dashboard.websocket_manager import BROADCAST_SECONDS, WebSocketManager
+
+
+class FakeWebSocket:
+    def __init__(self, blocked: bool = False):
+        self.sent: list[str] = []
+        self.closed = False
+        self.unblock = asyncio.Event()
+        if not blocked:
+            self.unblock.set()
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def send_text(self, data: str):
+        await self.unblock.wait()
+        self.sent.append(data)
+
+    async def close(self, code: int = 1000):
+        self.closed = True
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+class TestBroadcast:
+    def test_slow_client_does_not_delay_others(self):
+        async def scenario():
+            manager = WebSocketManager(max_queue=10)
+            fast, slow = FakeWebSocket(), FakeWebSocket(blocked=True)
+            await manager.connect(fast)
+            await manager.connect(slow)
+
+            await manager.broadcast({"n": 1}, key="a")
+            await settle()
+            assert [json.loads(m) for m in fast.sent] == [{"n": 1}]
+            assert slow.sent == []
+
+            slow.unblock.set()
+            await settle()
+            assert [json.loads(m) for m in slow.sent] == [{"n": 1}]
+
+        asyncio.run(scenario())
+
+    def test_broadcast_time_covers_the_socket_write(self):
+        async def scenario():
+            manager = WebSocketManager()
+            websocket = FakeWebSocket(blocked=True)
+            await manager.connect(websocket)
+            count, total = BROADCAST_SECONDS.count, BROADCAST_SECONDS.totals()[-1]
+
+            await manager.broadcast({"n": 1})
+            await asyncio.sleep(0.05)
+            assert BROADCAST_SECONDS.count == count
+            websocket.unblock.set()
+            await settle()
+            assert BROADCAST_SECONDS.count == count + 1
+            assert BROADCAST_SECONDS.totals()[-1] - total >= 0.05
+
+        asyncio.run(scenario())
+
+    def test_full_queue_keeps_latest_update_per_key(self):
+        async def scenario():
+            manager = WebSocketManager(max_queue=2)
+            slow = FakeWebSocket(blocked=True)
+            await manager.connect(slow)
+            await settle()
+
+            for n in range(5):
+                await manager.broadcast({"n": n}, key="a")
+            client = manager.active_connections[slow]
+            assert client.dropped > 0
+
+            slow.unblock.set()
+            await settle()
+            assert json.loads(slow.sent[-1]) == {"n": 4}
+            assert len(slow.sent) < 5
+
+        asyncio.run(scenario())
+
+    def test_graph_points_survive_a_full_queue(self):
+        async def scenario():
+            manager = WebSocketManager(max_queue=2)
+            slow = FakeWebSocket(blocked=True)
+            await manager.connect(slow)
+            await settle()
+
+            for n in range(6):
+                point = {"value": float(n), "timestamp": n}
+                update = {"current_value": float(n), "points": [point]}
+                manager.publish({"type": "update", "topic": "home/temp", "data": update}, key="home/temp")
+            assert slow in manager.active_connections
+
+            slow.unblock.set()
+            await settle()
+            points = [p["value"] for m in slow.sent for p in json.loads(m)["data"]["points"]]
+            assert points == [0.0, 1.0, 2.0, 3.0, 4.0, 5.0]
+            assert json.loads(slow.sent[-1])["data"]["current_value"] == 5.0
+
+        asyncio.run(scenario())
+
+    def test_full_queue_merges_coalesced_batches(self):
+        async def scenario():
+            manager = WebSocketManager(max_queue=2)
+            slow = FakeWebSocket(blocked=True)
+            await manager.connect(slow)
+            await settle()
+
+            for n in range(6):
+                batch = {
+                    "home/temp": {"current_value": n, "points": [{"value": n}]},
+                    f"home/other_{n % 2}": {"current_value": n},
+                }
+                manager.publish({"type": "updates", "data": batch})
+            assert slow in manager.active_connections
+
+            slow.unblock.set()
+            await settle()
+            messages = [json.loads(m) for m in slow.sent]
+            points = [p["value"] for m in messages for p in m["data"]["home/temp"]["points"]]
+            assert points == list(range(6))
+            assert messages[-1]["data"]["home/other_1"] == {"current_value": 5}
+            assert messages[-1]["seq"] == 6
+
+        asyncio.run(scenario())
+
+    def test_merges_do_not_cross_unkeyed_frames(self):
+        async def scenario():
+            manager = WebSocketManager(max_queue=2)
+            slow = FakeWebSocket(blocked=True)
+            await manager.connect(slow)
+            await settle()
+
+            manager.publish({"type": "update", "topic": "a", "data": {"n": 1}}, key="a")
+            manager.publish({"type": "sensor", "topic": "b", "data": {}})
+            manager.publish({"type": "update", "topic": "a", "data": {"n": 2}}, key="a")
+            await settle()
+            assert slow not in manager.active_connections
+
+        asyncio.run(scenario())
+
+    def test_overflowing_client_is_disconnected(self):
+        async def scenario():
+            manager = WebSocketManager(max_queue=1)
+            slow = FakeWebSocket(blocked=True)
+            await manager.connect(slow)
+            await settle()
+
+            await manager.broadcast({"n": 1}, key="a")
+            await manager.broadcast({"n": 2}, key="b")
+            await manager.broadcast({"n": 3}, key="c")
+            await settle()
+            assert slow not in manager.active_connections
+            assert slow.closed
+
+        asyncio.run(scenario())
+
+    def test_lagging_client_is_disconnected(self):
+        async def scenario():
+            manager = WebSocketManager(max_queue=10, max_lag=0.0)
+            slow = FakeWebSocket(blocked=True)
+            await manager.connect(slow)
+            await manager.broadcast({"n": 1}, key="a")
+            await settle()
+            await manager.broadcast({"n": 2}, key="a")
+            assert slow not in manager.active_connections
+
+        asyncio.run(scenario())
+
+
+class TestDrained:
+    def test_waits_for_queued_frames_to_be_written(self):
+        async def scenario():
+            manager = WebSocketManager()
+            websocket = FakeWebSocket(blocked=True)
+            await manager.connect(websocket)
+            await manager.send_personal(websocket, {"n": 1})
+
+            waiter = asyncio.create_task(manager.wait_drained(websocket))
+            await settle()
+            assert not waiter.done()
+            websocket.unblock.set()
+            assert await waiter is True
+
+        asyncio.run(scenario())
+
+    def test_returns_false_when_the_client_leaves(self):
+        async def scenario():
+            manager = WebSocketManager()
+            websocket = FakeWebSocket(blocked=True)
+            await manager.connect(websocket)
+            await manager.send_personal(websocket, {"n": 1})
+
+            waiter = asyncio.create_task(manager.wait_drained(websocket))
+            await settle()
+            manager.disconnect(websocket)
+            assert await waiter is False
+
+        asyncio.run(scenario())
+
+
+class TestSubscriptions:
+    def test_updates_only_reach_subscribed_clients(self):
+        async def scenario():
+            manager = WebSocketManager()
+            everything, kitchen = FakeWebSocket(), FakeWebSocket()
+            await manager.connect(everything)
+            await manager.connect(kitchen, topics=["home/kitchen/+"])
+
+            manager.publish({"type": "update", "topic": "home/kitchen/temp", "data": {"n": 1}})
+            manager.publish({"type": "update", "topic": "home/garage/temp", "data": {"n": 2}})
+            await settle()
+            assert [json.loads(m)["data"]["n"] for m in everything.sent] == [1, 2]
+            assert [json.loads(m)["data"]["n"] for m in kitchen.sent] == [1]
+
+        asyncio.run(scenario())
+
+    def test_batches_are_split_per_client(self):
+        async def scenario():
+            manager = WebSocketManager()
+            everything, kitchen, door = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+            await manager.connect(everything)
+            await manager.connect(kitchen, topics=["home/kitchen/#"])
+            await manager.connect(door, topics=["home/door"])
+
+            batch = {"home/kitchen/temp": {"n": 1}, "home/door": {"n": 2}, "home/garage": {"n": 3}}
+            manager.publish({"type": "updates", "data": batch})
+            await settle()
+            assert json.loads(everything.sent[0])["data"] == batch
+            assert json.loads(kitchen.sent[0])["data"] == {"home/kitchen/temp": {"n": 1}}
+            assert json.loads(door.sent[0])["data"] == {"home/door": {"n": 2}}
+
+        asyncio.run(scenario())
+
+    def test_subscribe_and_unsubscribe_update_the_routes(self):
+        async def scenario():
+            manager = WebSocketManager(topic_ids={"home/a": 0, "home/b": 1})
+            websocket = FakeWebSocket()
+            await manager.connect(websocket, topics=[])
+            client = manager.active_connections[websocket]
+            assert client not in manager.route("home/a")
+
+            assert manager.subscribe(websocket, ["home/+", "home/a"]) == ["home/+", "home/a"]
+            assert client in manager.route("home/a")
+            assert client in manager.route("home/b")
+
+            # home/a stays covered by its exact filter
+            assert manager.unsubscribe(websocket, ["home/+"]) == ["home/b"]
+            assert client in manager.route("home/a")
+            assert client not in manager.route("home/b")
+
+            manager.disconnect(websocket)
+            assert manager.route("home/a") == frozenset()
+
+        asyncio.run(scenario())
+
+    def test_unsubscribe_tolerates_topics_registered_meanwhile(self):
+        async def scenario():
+            topic_ids = {"home/a": 0, "home/b": 1}
+            manager = WebSocketManager(topic_ids=topic_ids)
+            websocket = FakeWebSocket()
+            await manager.connect(websocket, topics=["home/+"])
+            route = manager.route
+
+            def route_while_registering(topic):
+                # stands in for the MQTT thread auto-registering a sensor
+                topic_ids.setdefault("home/new", 2)
+                return route(topic)
+
+            manager.route = route_while_registering
+            assert manager.unsubscribe(websocket, ["home/+"]) == ["home/a", "home/b"]
+
+        asyncio.run(scenario())
+
+    def test_unfiltered_clients_also_receive_system_topics(self):
+        async def scenario():
+            manager = WebSocketManager()
+            websocket = FakeWebSocket()
+            await manager.connect(websocket)
+            assert manager.active_connections[websocket] in manager.route("$SYS/broker/uptime")
+            assert manager.subscriptions(websocket) is None
+
+        asyncio.run(scenario())
+
+
+class TestSubscriptionProtocol:
+    def make_client(self) -> TestClient:
+        store = DataStore()
+        for topic in ("home/kitchen/temp", "home/kitchen/humidity", "home/door"):
+            store.register_sensor(topic, topic, "sensor", "text", history_size=5)
+        return TestClient(create_app(store, WebSocketManager(topic_ids=store.topic_ids)))
+
+    def test_init_only_contains_requested_topics(self):
+        with self.make_client().websocket_connect("/ws?topics=home/kitchen/%2B") as websocket:
+            init = websocket.receive_json()
+        assert init["type"] == "init"
+        assert sorted(init["data"]) == ["home/kitchen/humidity", "home/kitchen/temp"]
+
+    def test_subscribe_sends_the_new_sensors(self):
+        with self.make_client().websocket_connect("/ws?topics=home/door") as websocket:
+            assert list(websocket.receive_json()["data"]) == ["home/door"]
+
+            websocket.send_json({"type": "subscribe", "topics": ["home/kitchen/temp"]})
+            subscribed = websocket.receive_json()
+            assert subscribed["type"] == "subscribed"
+            assert list(subscribed["data"]) == ["home/kitchen/temp"]
+
+            websocket.send_json({"type": "unsubscribe", "topics": ["home/door"]})
+            assert websocket.receive_json() == {"type": "unsubscribed", "topics": ["home/door"]}
+
+    def test_malformed_topics_are_ignored(self):
+        client = self.make_client()
+        with client.websocket_connect("/ws?topics=home/door") as websocket:
+            websocket.receive_json()
+            for topics in (5, [1], ["home/kitchen/temp", None], {"home/kitchen/temp": 1}):
+                websocket.send_json({"type": "subscribe", "topics": topics})
+            # the connection survives and its filters are unchanged
+            websocket.send_json({"type": "unsubscribe", "topics": "home/door"})
+            assert websocket.receive_json() == {"type": "unsubscribed", "topics": ["home/door"]}
+
+
+def update(topic: str, n: int) -> dict:
+    return {"type": "update", "topic": topic, "data": {"n": n}}
+
+
+class TestResume:
+    def test_updates_are_numbered(self):
+        async def scenario():
+            manager = WebSocketManager()
+            websocket = FakeWebSocket()
+            await manager.connect(websocket)
+            manager.publish(update("home/a", 1))
+            manager.publish({"type": "updates", "data": {"home/a": {"n": 2}}})
+            await settle()
+            assert [json.loads(m)["seq"] for m in websocket.sent] == [1, 2]
+
+        asyncio.run(scenario())
+
+    def test_resume_replays_only_missed_subscribed_updates(self):
+        async def scenario():
+            manager = WebSocketManager()
+            for n in range(1, 6):
+                manager.publish(update("home/a" if n % 2 else "home/b", n))
+
+            websocket = FakeWebSocket()
+            await manager.connect(websocket, topics=["home/a"])
+            assert manager.resume(websocket, f"{manager.epoch}:2")
+            await settle()
+            messages = [json.loads(m) for m in websocket.sent]
+            assert [m["data"]["n"] for m in messages[:-1]] == [3, 5]
+            assert messages[-1] == {"type": "resumed", "epoch": manager.epoch, "seq": 5}
+
+        asyncio.run(scenario())
+
+    def test_resume_after_a_merge_misses_nothing(self):
+        async def scenario():
+            manager = WebSocketManager(max_queue=2)
+            slow = FakeWebSocket(blocked=True)
+            await manager.connect(slow)
+            await settle()
+
+            manager.publish(update("home/a", 1), key="home/a")
+            await settle()
+            manager.publish(update("home/b", 2), key="home/b")
+            manager.publish(update("home/a", 3), key="home/a")
+            # the queue is full, so this folds into the queued seq 2
+            manager.publish(update("home/b", 4), key="home/b")
+            slow.unblock.set()
+            await settle()
+            sent = [json.loads(m) for m in slow.sent]
+            assert [m["seq"] for m in sent] == [1, 3, 4]
+
+            # the connection drops after the second frame and resumes from the
+            # highest seq the page saw
+            websocket = FakeWebSocket()
+            await manager.connect(websocket)
+            assert manager.resume(websocket, f"{manager.epoch}:{max(m['seq'] for m in sent[:2])}")
+            await settle()
+            replayed = [json.loads(m) for m in websocket.sent]
+            assert [(m["topic"], m["data"]) for m in replayed[:-1]] == [("home/b", {"n": 4})]
+
+        asyncio.run(scenario())
+
+    def test_evicted_or_foreign_positions_need_a_snapshot(self):
+        async def scenario():
+            manager = WebSocketManager(replay_size=2)
+            for n in range(1, 6):
+                manager.publish(update("home/a", n))
+
+            websocket = FakeWebSocket()
+            await manager.connect(websocket)
+            assert not manager.resume(websocket, f"{manager.epoch}:2")
+            assert not manager.resume(websocket, "other:4")
+            assert not manager.resume(websocket, f"{manager.epoch}:9")
+            assert not manager.resume(websocket, "garbage")
+            assert manager.resume(websocket, f"{manager.epoch}:3")
+
+        asyncio.run(scenario())
+
+    def test_reconnect_with_resume_skips_the_snapshot(self):
+        store = DataStore()
+        store.register_sensor("home/a", "A", "sensor", "text", history_size=5)
+        manager = WebSocketManager(topic_ids=store.topic_ids)
+        client = TestClient(create_app(store, manager))
+
+        with client.websocket_connect("/ws") as websocket:
+            init = websocket.receive_json()
+        assert (init["type"], init["epoch"], init["seq"]) == ("init", manager.epoch, 0)
+
+        manager.publish(update("home/a", 1))
+        with client.websocket_connect(f"/ws?resume={init['epoch']}:{init['seq']}") as websocket:
+            assert websocket.receive_json()["data"] == {"n": 1}
+            assert websocket.receive_json()["type"] == "resumed"
+
+        with client.websocket_connect("/ws?resume=stale:0") as websocket:
+            assert websocket.receive_json()["type"] == "init"